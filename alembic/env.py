@@ -19,7 +19,7 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from backend.core.database import Base
-from backend.models import user, message, session
+from backend.models import user, message, session, stage_checkpoint, job
 target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
@@ -0,0 +1,134 @@
+"""add content-addressed message blobs
+
+Revision ID: 7c2e4a9f1d3b
+Revises: f4b8d2a6c0e3
+Create Date: 2026-10-18 23:30:00.000000
+
+Bodies of MESSAGE_BLOB_MIN_BYTES or more are stored once in message_blobs,
+keyed by their SHA-256. messages.blob_hash points to the blob.
+
+PostgreSQL:
+- Reference counts are kept by an AFTER trigger on messages (insert, delete,
+  blob_hash change), so every path that touches messages keeps them exact.
+- The content trigger from f4b8d2a6c0e3 now also clears content for blob rows,
+  after indexing the text the application sent.
+- The foreign key is added NOT VALID and then validated. The blob_hash index
+  is built CONCURRENTLY.
+
+Existing rows are moved into blobs with
+`python -m backend.scripts.message_blobs migrate`. On downgrade, run
+`python -m backend.scripts.message_blobs inline` first.
+
+SQLite: only the table and column are added. Bodies stay in messages.content,
+because the FTS5 external-content table reads it.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e4a9f1d3b'
+down_revision: Union[str, Sequence[str], None] = 'f4b8d2a6c0e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _index_content_function(stored_elsewhere: str) -> str:
+    """Trigger function indexing the text the application sent, then clearing it if it is stored elsewhere."""
+    config = os.getenv('SEARCH_TS_CONFIG', 'simple').replace("'", "")
+    return (
+        "CREATE OR REPLACE FUNCTION messages_index_content() RETURNS trigger AS $$\n"
+        "BEGIN\n"
+        f"    IF NOT ({stored_elsewhere}) OR NEW.content <> '' THEN\n"
+        f"        NEW.content_tsv := to_tsvector('{config}'::regconfig, NEW.content);\n"
+        "    END IF;\n"
+        f"    IF {stored_elsewhere} THEN\n"
+        "        NEW.content := '';\n"
+        "    END IF;\n"
+        "    RETURN NEW;\n"
+        "END\n"
+        "$$ LANGUAGE plpgsql"
+    )
+
+
+REFCOUNT_FUNCTION = """
+CREATE OR REPLACE FUNCTION message_blobs_refcount() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.blob_hash IS NOT NULL THEN
+        UPDATE message_blobs SET refcount = refcount + 1 WHERE hash = NEW.blob_hash;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.blob_hash IS NOT NULL THEN
+        UPDATE message_blobs SET refcount = refcount - 1 WHERE hash = OLD.blob_hash;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'message_blobs',
+        sa.Column('hash', sa.LargeBinary(length=32), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('codec', sa.String(length=16), nullable=True),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('refcount', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('messages', sa.Column('blob_hash', sa.LargeBinary(), nullable=True))
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index('ix_messages_blob_hash', 'messages', ['blob_hash'], sqlite_where=sa.text('blob_hash IS NOT NULL'))
+        return
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT fk_messages_blob_hash "
+        "FOREIGN KEY (blob_hash) REFERENCES message_blobs (hash) NOT VALID"
+    )
+    op.execute("ALTER TABLE messages VALIDATE CONSTRAINT fk_messages_blob_hash")
+    op.execute(_index_content_function("NEW.codec IS NOT NULL OR NEW.blob_hash IS NOT NULL"))
+    op.execute("DROP TRIGGER messages_index_content ON messages")
+    op.execute(
+        "CREATE TRIGGER messages_index_content BEFORE INSERT OR UPDATE OF content, codec, blob_hash ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION messages_index_content()"
+    )
+    op.execute(REFCOUNT_FUNCTION)
+    op.execute(
+        "CREATE TRIGGER message_blobs_refcount AFTER INSERT OR DELETE OR UPDATE OF blob_hash ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION message_blobs_refcount()"
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_blob_hash', 'messages', ['blob_hash'],
+            postgresql_where=sa.text('blob_hash IS NOT NULL'), postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        if bind.execute(sa.text("SELECT 1 FROM messages WHERE blob_hash IS NOT NULL LIMIT 1")).first() is not None:
+            raise RuntimeError(
+                "messages references message_blobs; "
+                "run `python -m backend.scripts.message_blobs inline` first"
+            )
+        op.execute("DROP TRIGGER IF EXISTS message_blobs_refcount ON messages")
+        op.execute("DROP FUNCTION IF EXISTS message_blobs_refcount()")
+        op.execute("DROP TRIGGER IF EXISTS messages_index_content ON messages")
+        op.execute(_index_content_function("NEW.codec IS NOT NULL"))
+        op.execute(
+            "CREATE TRIGGER messages_index_content BEFORE INSERT OR UPDATE OF content, codec ON messages "
+            "FOR EACH ROW EXECUTE FUNCTION messages_index_content()"
+        )
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_messages_blob_hash', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.execute("ALTER TABLE messages DROP CONSTRAINT IF EXISTS fk_messages_blob_hash")
+    else:
+        op.drop_index('ix_messages_blob_hash', table_name='messages')
+    op.drop_column('messages', 'blob_hash')
+    op.drop_table('message_blobs')
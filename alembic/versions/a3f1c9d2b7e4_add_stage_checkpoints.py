@@ -0,0 +1,46 @@
+"""add stage checkpoints
+
+Revision ID: a3f1c9d2b7e4
+Revises: 35ea2562119b
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f1c9d2b7e4'
+down_revision: Union[str, Sequence[str], None] = '35ea2562119b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stage_checkpoints',
+    sa.Column('checkpoint_id', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.Integer(), nullable=False),
+    sa.Column('stage', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('inputs', sa.Text(), nullable=True),
+    sa.Column('output', sa.Text(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.session_id'], ),
+    sa.PrimaryKeyConstraint('checkpoint_id'),
+    sa.UniqueConstraint('session_id', 'stage', name='uq_stage_checkpoints_session_stage')
+    )
+    op.create_index(op.f('ix_stage_checkpoints_checkpoint_id'), 'stage_checkpoints', ['checkpoint_id'], unique=False)
+    op.create_index(op.f('ix_stage_checkpoints_session_id'), 'stage_checkpoints', ['session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_stage_checkpoints_session_id'), table_name='stage_checkpoints')
+    op.drop_index(op.f('ix_stage_checkpoints_checkpoint_id'), table_name='stage_checkpoints')
+    op.drop_table('stage_checkpoints')
@@ -0,0 +1,39 @@
+"""add message status and message chunks
+
+Revision ID: c4e8a1f3d9b2
+Revises: b7d2e5f8c1a6
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f3d9b2'
+down_revision: Union[str, Sequence[str], None] = 'b7d2e5f8c1a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('status', sa.String(length=20), server_default='complete', nullable=False))
+    op.create_table('message_chunks',
+    sa.Column('chunk_id', sa.Integer(), nullable=False),
+    sa.Column('message_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['message_id'], ['messages.message_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('chunk_id'),
+    sa.UniqueConstraint('message_id', 'seq', name='uq_message_chunks_message_seq')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('message_chunks')
+    op.drop_column('messages', 'status')
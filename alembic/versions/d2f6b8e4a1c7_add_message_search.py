@@ -0,0 +1,76 @@
+"""add full-text search index on messages
+
+Revision ID: d2f6b8e4a1c7
+Revises: c4e8a1f3d9b2
+Create Date: 2026-10-18 18:00:00.000000
+
+PostgreSQL: generated tsvector column messages.content_tsv with a GIN index
+(built CONCURRENTLY so inserts keep working while it builds). The text search
+configuration is read from SEARCH_TS_CONFIG at upgrade time and must match the
+application's setting. Adding the stored column rewrites the messages table once.
+
+SQLite (local runs): external-content FTS5 table messages_fts kept in sync by
+triggers.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6b8e4a1c7'
+down_revision: Union[str, Sequence[str], None] = 'c4e8a1f3d9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='messages', content_rowid='message_id')",
+    "CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.message_id, new.content); END",
+    "CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.message_id, old.content); END",
+    "CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.message_id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.message_id, new.content); END",
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS messages_fts_au",
+    "DROP TRIGGER IF EXISTS messages_fts_ad",
+    "DROP TRIGGER IF EXISTS messages_fts_ai",
+    "DROP TABLE IF EXISTS messages_fts",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        config = os.getenv('SEARCH_TS_CONFIG', 'simple').replace("'", "")
+        op.execute(
+            "ALTER TABLE messages ADD COLUMN content_tsv tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{config}'::regconfig, content)) STORED"
+        )
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_content_tsv "
+                "ON messages USING gin (content_tsv)"
+            )
+    elif dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_content_tsv")
+        op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS content_tsv")
+    elif dialect == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
@@ -0,0 +1,74 @@
+"""add composite indexes for history queries
+
+Revision ID: e3a7c9f1b5d8
+Revises: d2f6b8e4a1c7
+Create Date: 2026-10-18 20:00:00.000000
+
+History pages by primary key (sessions by user ORDER BY session_id DESC,
+messages by session ORDER BY message_id), so the composite indexes lead with
+the filter column and end with the key. The single-column indexes they
+supersede, and the duplicates of the primary keys, are dropped.
+
+On PostgreSQL every index is created and dropped CONCURRENTLY outside the
+migration transaction, so writes to sessions/messages are not blocked. If a
+concurrent build fails it leaves an INVALID index; drop it and rerun.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a7c9f1b5d8'
+down_revision: Union[str, Sequence[str], None] = 'd2f6b8e4a1c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+STREAMING = sa.text("status = 'streaming'")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_sessions_user_id_session_id', 'sessions', ['user_id', 'session_id'],
+            postgresql_include=['session_name'], postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_messages_session_id_message_id', 'messages', ['session_id', 'message_id'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_messages_streaming', 'messages', ['message_id'],
+            postgresql_where=STREAMING, sqlite_where=STREAMING, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_sessions_user_id', table_name='sessions', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_sessions_session_id', table_name='sessions', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_session_id', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_message_id', table_name='messages', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_message_id', 'messages', ['message_id'], postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_messages_session_id', 'messages', ['session_id'], postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_sessions_session_id', 'sessions', ['session_id'], postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_sessions_user_id', 'sessions', ['user_id'], postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_messages_streaming', table_name='messages', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(
+            'ix_messages_session_id_message_id', table_name='messages', postgresql_concurrently=True, if_exists=True
+        )
+        op.drop_index(
+            'ix_sessions_user_id_session_id', table_name='sessions', postgresql_concurrently=True, if_exists=True
+        )
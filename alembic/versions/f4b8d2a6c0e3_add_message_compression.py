@@ -0,0 +1,94 @@
+"""add compressed message bodies
+
+Revision ID: f4b8d2a6c0e3
+Revises: e3a7c9f1b5d8
+Create Date: 2026-10-18 22:00:00.000000
+
+Adds messages.codec and messages.content_blob. Long bodies are compressed by
+the application (zstd, or zlib when zstandard is not installed) into
+content_blob, and content is left empty.
+
+PostgreSQL: content_tsv can no longer be a generated column, because the text
+of a compressed body is not in the row. It becomes a plain column maintained by
+a BEFORE trigger. The application still sends the original text in content;
+the trigger indexes it, then clears content when codec is set. Existing values
+and the GIN index are kept. content_blob is stored EXTERNAL, so TOAST does not
+try to compress it a second time. DROP EXPRESSION needs PostgreSQL 13+.
+
+Existing rows are compressed in batches by
+`python -m backend.scripts.compress_messages`, not inside this migration. On
+downgrade, run it with --decompress first.
+
+SQLite: only the columns are added. Bodies stay uncompressed there, because the
+FTS5 external-content table reads messages.content.
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b8d2a6c0e3'
+down_revision: Union[str, Sequence[str], None] = 'e3a7c9f1b5d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _ts_config() -> str:
+    return os.getenv('SEARCH_TS_CONFIG', 'simple').replace("'", "")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('codec', sa.String(length=16), nullable=True))
+    op.add_column('messages', sa.Column('content_blob', sa.LargeBinary(), nullable=True))
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("ALTER TABLE messages ALTER COLUMN content_blob SET STORAGE EXTERNAL")
+    op.execute("ALTER TABLE messages ALTER COLUMN content_tsv DROP EXPRESSION")
+    op.execute(
+        "CREATE OR REPLACE FUNCTION messages_index_content() RETURNS trigger AS $$\n"
+        "BEGIN\n"
+        "    IF NEW.codec IS NULL OR NEW.content <> '' THEN\n"
+        f"        NEW.content_tsv := to_tsvector('{_ts_config()}'::regconfig, NEW.content);\n"
+        "    END IF;\n"
+        "    IF NEW.codec IS NOT NULL THEN\n"
+        "        NEW.content := '';\n"
+        "    END IF;\n"
+        "    RETURN NEW;\n"
+        "END\n"
+        "$$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER messages_index_content BEFORE INSERT OR UPDATE OF content, codec ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION messages_index_content()"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        if bind.execute(sa.text("SELECT 1 FROM messages WHERE codec IS NOT NULL LIMIT 1")).first() is not None:
+            raise RuntimeError(
+                "messages contains compressed bodies; "
+                "run `python -m backend.scripts.compress_messages --decompress` first"
+            )
+        op.execute("DROP TRIGGER IF EXISTS messages_index_content ON messages")
+        op.execute("DROP FUNCTION IF EXISTS messages_index_content()")
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_content_tsv")
+        op.execute("ALTER TABLE messages DROP COLUMN content_tsv")
+        op.execute(
+            "ALTER TABLE messages ADD COLUMN content_tsv tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{_ts_config()}'::regconfig, content)) STORED"
+        )
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_content_tsv "
+                "ON messages USING gin (content_tsv)"
+            )
+    op.drop_column('messages', 'content_blob')
+    op.drop_column('messages', 'codec')
@@ -1,132 +1,288 @@
-from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
-from autogen import GroupChat, GroupChatManager
+from .requirement_agent import RequirementAgent
+from .coder_agent import CoderAgent
+from .reviewer_agent import ReviewerAgent
 from .test_agent import TestAgent
-from typing import AsyncGenerator, List
+from .doc_agent import DocAgent
+from .finalizer_agent import FinalizerAgent
+from .summarizer_agent import SummarizerAgent
+from .context_budget import ContextBudget, ContextPart, ContextReport, split_code
+from .workflow_graph import Stage, StageGraph, StageResult
+from .code_extractor import FencedCodeExtractor, CodeArtifact, extract_code
+from ..core.config import settings
+from ..services.model_router import ModelRouting
+from typing import AsyncGenerator, Dict, List
+from autogen_core import CancellationToken
 import asyncio
+import time
 
 class AgentWorkflow:
     """
-    使用AutoGen框架实现的多Agent协作工作流，支持人工介入和动态对话管理。
+    基于阶段依赖图的多Agent协作工作流：
+    requirement → coder → {reviewer, test, doc} → finalizer
+    互不依赖的阶段（审查、测试、文档）并发执行，并记录每个阶段的耗时。
+    开启 pipeline_artifacts 时，审查/测试/文档在coder产出第一个完整代码块后即可开始，
+    不必等coder把后面的说明文字写完；代价是它们看不到之后的代码块，默认关闭。
+    有截止时间时各阶段按 WORKFLOW_STAGE_BUDGETS 分配时间，WORKFLOW_OPTIONAL_STAGES（默认文档）时间不够时跳过。
+    每个Agent的输入不超过 CONTEXT_TOKEN_BUDGET 个token：最新的代码原样保留，较旧的说明文字压缩为摘要。
+    传入 routing 时各阶段按路由表选择模型（如文档和简短的审查走更快的模型）。
     """
-    def __init__(self, model_client):
-        # 配置LLM模型参数
+    # 阶段及其依赖：finalizer 需要 coder 的完整代码和 reviewer 的审查建议
+    STAGES = {
+        "requirement": (),
+        "coder": ("requirement",),
+        "reviewer": ("coder",),
+        "test": ("coder",),
+        "doc": ("coder",),
+        "finalizer": ("coder", "reviewer"),
+    }
+    # 可以在 coder 产出第一个完整代码块后提前开始的阶段
+    EARLY_STAGES = ("reviewer", "test", "doc")
+    def __init__(self, model_client, max_parallel: int = None, pipeline_artifacts: bool = None,
+                 routing: ModelRouting = None):
         self.model_client = model_client
-        llm_config = {
-            "model": model_client.model,
-            "api_key": model_client.api_key,
-            "temperature": 0.7
+        self.max_parallel = max_parallel or settings.WORKFLOW_MAX_PARALLEL
+        if pipeline_artifacts is None:
+            pipeline_artifacts = settings.WORKFLOW_PIPELINE_ARTIFACTS
+        self.pipeline_artifacts = pipeline_artifacts
+
+        # 创建专业Agent（与单Agent接口共用同一套实现）
+        self.requirement_agent = RequirementAgent(model_client, routing)
+        self.coder_agent = CoderAgent(model_client, routing)
+        self.reviewer_agent = ReviewerAgent(model_client, routing)
+        self.test_agent = TestAgent(model_client, routing)
+        self.doc_agent = DocAgent(model_client, routing)
+        self.finalizer_agent = FinalizerAgent(model_client, routing)
+        self.summarizer_agent = SummarizerAgent(model_client, routing)
+
+    async def _run_agent(self, stage: str, agent, *args, on_delta=None, on_artifact=None,
+                         cancellation_token: CancellationToken = None) -> str:
+        """
+        以流式方式调用Agent，在事件循环上直接消费token，不占用线程；
+        同时增量解析输出中的代码块，每闭合一个就通过 on_artifact(stage, artifact) 通知。
+        """
+        chunks = []
+        extractor = FencedCodeExtractor()
+        async for chunk in agent.handle_message_stream(*args, cancellation_token=cancellation_token):
+            chunks.append(chunk)
+            if on_delta is not None:
+                await on_delta(stage, chunk)
+            for artifact in extractor.feed(chunk):
+                if on_artifact is not None:
+                    await on_artifact(stage, artifact)
+        for artifact in extractor.close():
+            if on_artifact is not None:
+                await on_artifact(stage, artifact)
+        return "".join(chunks)
+
+    def build_graph(self, user_requirement: str, on_delta=None, on_artifact=None,
+                    cancellation_token: CancellationToken = None,
+                    context_report: ContextReport = None) -> StageGraph:
+        """
+        声明各阶段及其依赖关系。
+        on_delta(stage, token) 转发各阶段的token增量，on_artifact(stage, artifact) 转发解析出的代码块，
+        cancellation_token 传给各阶段的Agent调用，context_report 记录各阶段输入的压缩情况。
+        """
+        graph: StageGraph = None
+
+        async def summarize(text: str, max_tokens: int) -> str:
+            return await self.summarizer_agent.handle_message(
+                text, max_tokens, cancellation_token=cancellation_token
+            )
+
+        budget = ContextBudget(summarize, report=context_report)
+
+        def code_parts(name: str, output: str, age: int) -> List[ContextPart]:
+            code, notes = split_code(output)
+            return [ContextPart(f"{name}.code", code, kind="code"), ContextPart(f"{name}.notes", notes, age=age)]
+
+        def join_code(texts: Dict[str, str], name: str) -> str:
+            return "\n\n".join(t for t in (texts[f"{name}.code"], texts[f"{name}.notes"]) if t)
+
+        async def fit_code(stage: str, output: str) -> str:
+            """下游阶段的输入是coder的输出：代码原样保留，超出预算时压缩说明文字"""
+            texts, compressed = await budget.fit(stage, code_parts("coder", output, age=1))
+            return join_code(texts, "coder") if compressed else output
+
+        async def publish(stage: str, artifact: CodeArtifact):
+            if artifact.complete:
+                graph.publish_artifact(stage, artifact.code)
+            if on_artifact is not None:
+                await on_artifact(stage, artifact)
+
+        async def run_agent(stage: str, agent, *args) -> str:
+            return await self._run_agent(
+                stage, agent, *args, on_delta=on_delta, on_artifact=publish,
+                cancellation_token=cancellation_token
+            )
+
+        # 输入中的 "user" 可以替换原始需求（重跑阶段时编辑输入）
+        async def requirement(inputs: Dict[str, str]) -> str:
+            return await run_agent("requirement", self.requirement_agent, inputs.get("user", user_requirement))
+
+        async def coder(inputs: Dict[str, str]) -> str:
+            # 原始需求优先保留，较早的任务拆解先被压缩
+            texts, _ = await budget.fit("coder", [
+                ContextPart("user", inputs.get("user", user_requirement), age=0),
+                ContextPart("requirement", inputs["requirement"], age=1),
+            ])
+            task = f"{texts['user']}\n\n开发任务拆解：\n{texts['requirement']}"
+            return await run_agent("coder", self.coder_agent, task)
+
+        async def reviewer(inputs: Dict[str, str]) -> str:
+            return await run_agent("reviewer", self.reviewer_agent, await fit_code("reviewer", inputs["coder"]))
+
+        async def test(inputs: Dict[str, str]) -> str:
+            return await run_agent("test", self.test_agent, await fit_code("test", inputs["coder"]))
+
+        async def doc(inputs: Dict[str, str]) -> str:
+            return await run_agent("doc", self.doc_agent, await fit_code("doc", inputs["coder"]))
+
+        async def finalizer(inputs: Dict[str, str]) -> str:
+            # 审查建议是最新的内容，coder的说明文字更早，超出预算时先压缩后者
+            texts, compressed = await budget.fit("finalizer", code_parts("coder", inputs["coder"], age=1) + [
+                ContextPart("reviewer", inputs["reviewer"], age=0),
+            ])
+            code = join_code(texts, "coder") if compressed else inputs["coder"]
+            return await run_agent("finalizer", self.finalizer_agent, code, texts["reviewer"])
+
+        runners = {
+            "requirement": requirement,
+            "coder": coder,
+            "reviewer": reviewer,
+            "test": test,
+            "doc": doc,
+            "finalizer": finalizer,
         }
+        graph = StageGraph([
+            Stage(
+                name, runners[name], depends_on=deps,
+                start_on_artifact=("coder",) if self.pipeline_artifacts and name in self.EARLY_STAGES else (),
+                budget=settings.WORKFLOW_STAGE_BUDGETS.get(name),
+                optional=name in settings.WORKFLOW_OPTIONAL_STAGES,
+            )
+            for name, deps in self.STAGES.items()
+        ], max_parallel=self.max_parallel)
+        return graph
 
-        # 创建专业Agent
-        self.requirement_agent = AssistantAgent(
-            name="requirement_agent",
-            system_message="你是需求分析专家，负责将用户需求拆解为清晰的开发任务。",
-            llm_config=llm_config
-        )
-        self.coder_agent = AssistantAgent(
-            name="coder_agent",
-            system_message="你是资深程序员，负责根据需求编写高质量代码。",
-            llm_config=llm_config
-        )
-        self.reviewer_agent = AssistantAgent(
-            name="reviewer_agent",
-            system_message="你是代码审查专家，负责找出代码中的问题并提出改进建议。",
-            llm_config=llm_config
-        )
-        self.finalizer_agent = AssistantAgent(
-            name="finalizer_agent",
-            system_message="你是代码整合专家，负责根据审查建议优化代码。",
-            llm_config=llm_config
-        )
-        self.doc_agent = AssistantAgent(
-            name="doc_agent",
-            system_message="你是文档专家，负责为最终代码生成清晰的使用文档。",
-            llm_config=llm_config
-        )
-        
-        # 创建用户代理（支持人工介入）
-        self.user_proxy = UserProxyAgent(
-            name="user_proxy",
-            system_message="人类用户的代理，负责传达需求和提供反馈。",
-            human_input_mode="always",  # 始终请求人工输入
-            is_termination_msg=lambda x: x.get("content", "").strip().endswith("terminate"),
-            code_execution_config=False  # 禁用代码执行
-        )
+    @classmethod
+    def descendants(cls, stage: str) -> list:
+        """依赖 stage 的所有下游阶段"""
+        graph = StageGraph([Stage(name, None, depends_on=deps) for name, deps in cls.STAGES.items()])
+        return graph.descendants(stage)
 
-        # 创建群聊环境
-        self.agents: List[AssistantAgent] = [
-            self.requirement_agent, self.coder_agent, 
-            self.reviewer_agent, self.finalizer_agent, self.doc_agent, self.test_agent
-        ]
-        self.group_chat = GroupChat(
-            agents=self.agents,
-            messages=[],
-            max_round=20,
-            speaker_selection_method="round_robin",  # 轮流向每个Agent提问
-            allow_repeat_speaker=False
-        )
-        self.manager = GroupChatManager(groupchat=self.group_chat, llm_config=llm_config)
+    @staticmethod
+    def _extract_final_code(outputs: Dict[str, str]) -> str:
+        """最终代码取finalizer输出中的代码块，finalizer没有产出时退回coder的代码"""
+        return extract_code(outputs.get("finalizer") or outputs.get("coder", ""))
 
-    async def run(self, user_requirement: str) -> dict:
+    @staticmethod
+    def _extract_test_code(outputs: Dict[str, str]) -> str:
+        return extract_code(outputs.get("test", ""))
+
+    async def run(self, user_requirement: str, restored: Dict[str, str] = None,
+                  input_overrides: Dict[str, Dict[str, str]] = None,
+                  cancellation_token: CancellationToken = None) -> dict:
         """
-        运行AutoGen多Agent工作流
+        运行多Agent工作流
         :param user_requirement: 用户需求
-        :return: 最终结果
+        :param restored: 已完成阶段的输出，这些阶段不再执行
+        :param input_overrides: 按阶段替换输入 {阶段名: {依赖阶段名: 输入}}
+        :param cancellation_token: 取消时中断正在执行的阶段，未开始的阶段不再执行
+        :return: 各阶段输出及耗时统计
         """
-        # 启动群聊对话
-        chat_result = await asyncio.to_thread(
-            self.user_proxy.initiate_chat,
-            self.manager,
-            message=user_requirement,
-            summary_method="reflection_with_llm"
+        context_report = ContextReport()
+        graph = self.build_graph(
+            user_requirement, cancellation_token=cancellation_token, context_report=context_report
         )
-
-        # 提取对话摘要和结果
+        graph_run = await graph.run(
+            restored=restored, input_overrides=input_overrides, cancellation_token=cancellation_token
+        )
+        outputs = {name: result.output for name, result in graph_run.results.items()}
         return {
-            'conversation': chat_result.chat_history,
-            'summary': chat_result.summary,
-            'final_code': self._extract_final_code(chat_result.chat_history),
-            'test_code': self._extract_test_code(chat_result.chat_history)
+            'stages': outputs,
+            'tasks': outputs['requirement'],
+            'suggestions': outputs['reviewer'],
+            'final_code': self._extract_final_code(outputs),
+            'test_code': self._extract_test_code(outputs),
+            'doc': outputs['doc'],
+            'timings': graph_run.timings(),
+            'context': context_report.to_dict()
         }
 
-    async def run_stream(self, user_requirement: str) -> AsyncGenerator[dict, None]:
+    async def run_stream(self, user_requirement: str, restored: Dict[str, str] = None,
+                         input_overrides: Dict[str, Dict[str, str]] = None,
+                         cancellation_token: CancellationToken = None) -> AsyncGenerator[dict, None]:
         """
-        流式运行AutoGen多Agent工作流
+        流式运行多Agent工作流：各阶段的token增量（stage_delta）、解析出的代码块（stage_artifact）
+        与阶段开始/结束事件合并为一个事件流，最后输出耗时统计。整个过程运行在事件循环上，不占用线程池。
         :param user_requirement: 用户需求
+        :param restored: 已完成阶段的输出，这些阶段不再执行，只输出 stage_restored 事件
+        :param input_overrides: 按阶段替换输入 {阶段名: {依赖阶段名: 输入}}
+        :param cancellation_token: 取消时中断正在执行的阶段（stage_cancelled），未开始的阶段不再执行
         :return: 流式结果
         """
-        # 使用队列收集流式输出
-        result_queue = asyncio.Queue()
-
-        def callback(sender, message, recipient, request_id, **kwargs):
-            result_queue.put_nowait({
-                'stage': sender.name,
-                'sender': sender.name,
-                'message': message,
-                'timestamp': asyncio.get_event_loop().time()
+        result_queue: asyncio.Queue = asyncio.Queue()
+        context_report = ContextReport()
+
+        async def on_event(event: str, result: StageResult):
+            has_output = event in ('stage_complete', 'stage_restored')
+            await result_queue.put({
+                'event': event,
+                'stage': result.name,
+                'sender': result.name,
+                'message': result.output if has_output else (result.error or ''),
+                'inputs': result.inputs,
+                'duration': result.duration,
+                'timestamp': time.time()
             })
 
-        # 注册回调函数
-        self.manager.register_callback(callback)
+        async def on_delta(stage: str, token: str):
+            await result_queue.put({
+                'event': 'stage_delta',
+                'stage': stage,
+                'sender': stage,
+                'message': token,
+                'timestamp': time.time()
+            })
 
-        # 在后台线程运行对话
-        asyncio.create_task(
-            asyncio.to_thread(
-                self.user_proxy.initiate_chat,
-                self.manager,
-                message=user_requirement
-            )
-        )
+        async def on_artifact(stage: str, artifact: CodeArtifact):
+            await result_queue.put({
+                'event': 'stage_artifact',
+                'stage': stage,
+                'sender': stage,
+                'message': artifact.code,
+                'artifact': artifact.to_dict(),
+                'timestamp': time.time()
+            })
 
-        # 流式输出结果
-        while True:
+        async def run_graph():
             try:
-                result = await asyncio.wait_for(result_queue.get(), timeout=30)
-                if result.get('stage') == 'terminate':
+                graph = self.build_graph(
+                    user_requirement, on_delta, on_artifact, cancellation_token, context_report
+                )
+                graph_run = await graph.run(
+                    on_event, restored=restored, input_overrides=input_overrides,
+                    cancellation_token=cancellation_token
+                )
+                await result_queue.put({
+                    'event': 'workflow_complete',
+                    'stage': 'terminate',
+                    'sender': 'workflow',
+                    'message': '',
+                    'timings': graph_run.timings(),
+                    'context': context_report.to_dict(),
+                    'timestamp': time.time()
+                })
+            finally:
+                await result_queue.put(None)
+
+        task = asyncio.create_task(run_graph())
+        try:
+            while True:
+                result = await result_queue.get()
+                if result is None:
                     break
                 yield result
-            except asyncio.TimeoutError:
-                break
-
-    
-        
+            await task
+        finally:
+            task.cancel()
@@ -0,0 +1,167 @@
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import TextMessage
+from autogen_core import CancellationToken
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import time
+import httpx
+import openai
+from .context_budget import count_tokens
+from ..services.response_cache import response_cache
+from ..services.single_flight import single_flight
+from ..services.cancellation import cancellation_stats
+from ..services.model_router import ModelRouting, Route, route_stats
+from ..services.admission import llm_limiter
+from ..core.deadline import check_deadline, DeadlineExceeded, remaining
+
+
+# 截止时间到达时传输层按剩余时间收紧的超时（见 services/client_pool.py）以这两种异常之一抛出
+_TRANSPORT_TIMEOUTS = (httpx.TimeoutException, openai.APITimeoutError)
+
+
+def agent_role(agent_name: str) -> str:
+    """路由表中的角色名：CoderAgent -> coder"""
+    return agent_name[:-len("Agent")].lower() if agent_name.endswith("Agent") else agent_name.lower()
+
+
+class StreamingAgent:
+    """
+    单Agent的公共实现，基于AutoGen AssistantAgent。
+    子类只需给出 agent_name、system_message 和 build_prompt，
+    handle_message / handle_message_stream 会先查响应缓存，未命中时与正在进行的相同请求合并，
+    最后才真正调用模型。传入的 cancellation_token 被取消时（如客户端断开）输出提前结束，
+    没有其他请求共享的上游调用会随之取消。超过上下文中的截止时间时抛出 DeadlineExceeded。
+    传入 routing 时按角色和输入大小路由到对应层级的模型（见 services/model_router.py），否则使用 model_client；
+    每次模型调用的延迟、token数和费用按路由统计。
+    模型调用受进程内的并发上限约束（见 services/admission.py），超出时排队等待。
+    """
+    agent_name = ""
+    system_message = ""
+
+    def __init__(self, model_client, routing: ModelRouting = None):
+        self.model_client = model_client
+        self.routing = routing
+
+    def _assistant(self, model_client) -> AssistantAgent:
+        return AssistantAgent(
+            name=self.agent_name,
+            system_message=self.system_message,
+            model_client=model_client,
+            model_client_stream=True
+        )
+
+    def build_prompt(self, *args) -> str:
+        return args[0]
+
+    @property
+    def model_name(self) -> str:
+        return self.model_client.model_info.get("model_name", "unknown")
+
+    @property
+    def role(self) -> str:
+        return agent_role(self.agent_name)
+
+    def route(self, prompt: str) -> Route:
+        if self.routing is None:
+            return Route(self.role, "client", self.model_name, "client")
+        return self.routing.route(self.role, count_tokens(self.system_message) + count_tokens(prompt))
+
+    def cache_key(self, prompt: str, model: str = None) -> str:
+        # 响应缓存有意在用户之间共享：回答只取决于角色、系统提示、模型和提示词，命中时不调用上游，不消耗任何人的配额
+        return response_cache.make_key(self.agent_name, self.system_message, model or self.model_name, prompt)
+
+    def flight_key(self, cache_key: str) -> str:
+        """
+        合并进行中调用的key：在缓存key上加调用方 api_key 的哈希，只合并同一凭据发起的调用，
+        上游的费用、限流和鉴权错误不会落到别的用户身上。没有 routing 时以 model_client 区分（客户端池按 api_key 分配客户端）
+        """
+        if self.routing is not None:
+            caller = hashlib.sha256(self.routing.api_key.encode("utf-8")).hexdigest()
+        else:
+            caller = f"client-{id(self.model_client)}"
+        return f"{cache_key}:{caller}"
+
+    @asynccontextmanager
+    async def _routed_agent(self, route: Route):
+        """
+        每次生成都新建 AssistantAgent：它会在调用之间累积对话上下文，复用时后面的调用会带上之前所有的提示和回答，
+        并发调用还会互相混入。路由到的模型与 model_client 相同时直接使用它，否则从客户端池租用该模型的客户端。
+        """
+        if self.routing is None or route.model == self.model_name:
+            yield self._assistant(self.model_client)
+            return
+        async with self.routing.lease(route) as client:
+            yield self._assistant(client)
+
+    async def handle_message(self, *args, cancellation_token: CancellationToken = None) -> str:
+        chunks = [chunk async for chunk in self.handle_message_stream(*args, cancellation_token=cancellation_token)]
+        return "".join(chunks)
+
+    async def handle_message_stream(self, *args, cancellation_token: CancellationToken = None):
+        prompt = self.build_prompt(*args)
+        route = self.route(prompt)
+        key = self.cache_key(prompt, route.model)
+        # 命中缓存时按分块回放，客户端看到的仍是流式输出
+        cached = await response_cache.get(key)
+        if cached is not None:
+            async for chunk in response_cache.replay(cached):
+                if cancellation_token is not None and cancellation_token.is_cancelled():
+                    return
+                yield chunk
+            return
+        check_deadline()
+        # 同一用户的相同请求正在生成时直接订阅它的输出，不再重复调用模型
+        async for chunk in single_flight.stream(
+            self.flight_key(key), lambda token: self._generate(prompt, key, route, token), cancellation_token
+        ):
+            check_deadline()
+            yield chunk
+
+    def _record_route(self, route: Route, prompt: str, answer_chunks, usage, started: float,
+                      first_token: float, status: str):
+        # 模型没有返回用量（或被取消）时按分词估算
+        if usage is not None and usage.completion_tokens:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens = count_tokens(self.system_message) + count_tokens(prompt)
+            completion_tokens = count_tokens("".join(answer_chunks))
+        route_stats.record(
+            route, time.monotonic() - started,
+            first_token - started if first_token is not None else None,
+            prompt_tokens, completion_tokens, status
+        )
+
+    async def _generate(self, prompt: str, key: str, route: Route, cancellation_token: CancellationToken):
+        answer_chunks = []
+        usage = None
+        started, first_token = time.monotonic(), None
+        try:
+            async with llm_limiter.slot(self.role), self._routed_agent(route) as agent:
+                # 使用on_messages_stream实现流式输出，token取消时中断对模型的HTTP流
+                async for chunk in agent.on_messages_stream(
+                    [TextMessage(content=prompt, source="user")], cancellation_token
+                ):
+                    if isinstance(chunk, Response):
+                        usage = chunk.chat_message.models_usage
+                    elif hasattr(chunk, "content") and chunk.content:
+                        if first_token is None:
+                            first_token = time.monotonic()
+                        answer_chunks.append(chunk.content)
+                        yield chunk.content
+        except asyncio.CancelledError:
+            cancellation_stats.record_cancelled(self.agent_name, len(answer_chunks))
+            self._record_route(route, prompt, answer_chunks, usage, started, first_token, "cancelled")
+            raise
+        except Exception as e:
+            self._record_route(route, prompt, answer_chunks, usage, started, first_token, "error")
+            # 截止时间已过时的传输超时转换为 DeadlineExceeded，调用方据此提示输出被截断
+            left = remaining()
+            if isinstance(e, _TRANSPORT_TIMEOUTS) and left is not None and left <= 0:
+                raise DeadlineExceeded("已超过截止时间") from e
+            raise
+        cancellation_stats.record_completed(self.agent_name, len(answer_chunks))
+        self._record_route(route, prompt, answer_chunks, usage, started, first_token, "completed")
+        # 只缓存完整结束的回答，中途异常不会走到这里
+        await response_cache.set(key, "".join(answer_chunks), agent=self.agent_name, model=route.model)
@@ -0,0 +1,129 @@
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+# 代码块围栏：至少3个 ` 或 ~，后面可以跟语言标记
+_FENCE_OPEN = re.compile(r"^\s*(?P<fence>`{3,}|~{3,})\s*(?P<info>[^`]*)$")
+
+
+def _closes(stripped: str, fence: str) -> bool:
+    # 闭合围栏：与开始围栏同种字符且长度不小于开始围栏，行内没有其他内容
+    return bool(stripped) and set(stripped) == {fence[0]} and len(stripped) >= len(fence)
+
+
+@dataclass
+class CodeArtifact:
+    """从Agent输出中解析出的一个完整代码块"""
+    index: int
+    language: str
+    code: str
+    complete: bool = True      # False 表示输出结束时围栏仍未闭合
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "language": self.language,
+            "code": self.code,
+            "complete": self.complete,
+        }
+
+
+class FencedCodeExtractor:
+    """
+    增量解析流式token中的 markdown 围栏代码块。
+    feed() 每收到一段文本就调用一次，返回在这段文本中闭合的代码块；
+    close() 在输出结束时调用，处理最后一行以及未闭合的代码块。
+    """
+    def __init__(self):
+        self._partial = ""
+        self._fence: Optional[str] = None
+        self._language = ""
+        self._lines: List[str] = []
+        self.artifacts: List[CodeArtifact] = []
+
+    def feed(self, text: str) -> List[CodeArtifact]:
+        self._partial += text
+        if "\n" not in self._partial:
+            return []
+        *lines, self._partial = self._partial.split("\n")
+        emitted = []
+        for line in lines:
+            artifact = self._process_line(line)
+            if artifact is not None:
+                emitted.append(artifact)
+        return emitted
+
+    def close(self) -> List[CodeArtifact]:
+        emitted = []
+        if self._partial:
+            artifact = self._process_line(self._partial)
+            self._partial = ""
+            if artifact is not None:
+                emitted.append(artifact)
+        if self._fence is not None and self._lines:
+            emitted.append(self._emit(complete=False))
+        self._fence = None
+        return emitted
+
+    def _process_line(self, line: str) -> Optional[CodeArtifact]:
+        stripped = line.strip()
+        if self._fence is None:
+            match = _FENCE_OPEN.match(line)
+            if match:
+                self._fence = match.group("fence")
+                info = match.group("info").strip()
+                self._language = info.split()[0].lower() if info else ""
+                self._lines = []
+            return None
+        if _closes(stripped, self._fence):
+            artifact = self._emit(complete=True)
+            self._fence = None
+            return artifact
+        self._lines.append(line)
+        return None
+
+    def _emit(self, complete: bool) -> CodeArtifact:
+        artifact = CodeArtifact(
+            index=len(self.artifacts),
+            language=self._language,
+            code="\n".join(self._lines),
+            complete=complete,
+        )
+        self.artifacts.append(artifact)
+        self._lines = []
+        return artifact
+
+
+def extract_code_blocks(text: str) -> List[CodeArtifact]:
+    """一次性解析完整文本中的全部代码块"""
+    extractor = FencedCodeExtractor()
+    extractor.feed(text)
+    extractor.close()
+    return extractor.artifacts
+
+
+def iter_fenced_lines(text: str) -> Iterator[Tuple[str, bool]]:
+    """逐行给出 (行, 是否属于围栏代码块)，围栏行本身也算在代码块内；未闭合的代码块一直延续到结尾"""
+    fence = None
+    for line in text.split("\n"):
+        if fence is None:
+            match = _FENCE_OPEN.match(line)
+            if match:
+                fence = match.group("fence")
+            yield line, match is not None
+        else:
+            if _closes(line.strip(), fence):
+                fence = None
+            yield line, True
+
+
+def extract_code(text: str, languages=("python", "py", "")) -> str:
+    """
+    取出文本中指定语言的代码并拼接；没有任何围栏代码块时认为整段输出就是代码
+    （CoderAgent 被要求直接输出可执行的python，文字部分写在注释里）。
+    """
+    artifacts = extract_code_blocks(text)
+    if not artifacts:
+        return text.strip()
+    selected = [a.code for a in artifacts if a.language in languages] or [a.code for a in artifacts]
+    return "\n\n".join(selected)
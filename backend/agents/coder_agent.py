@@ -1,36 +1,17 @@
-import asyncio
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import TextMessage
-from autogen_core import CancellationToken
+from .base_agent import StreamingAgent
 
 
-class CoderAgent:
+class CoderAgent(StreamingAgent):
     """
     代码生成Agent，基于AutoGen AssistantAgent实现。
     支持异步消息处理，便于多Agent协作。
     """
-    def __init__(self,model_client):
-        self.agent = AssistantAgent(
-            name="CoderAgent",
-            system_message="你是一个代码生成专家，根据用户需求编写高质量的 Python 代码，\
-                要求答案以可直接执行的python格式给出（文字部分通过注释形式回答）。",
-            model_client=model_client,
-            model_client_stream=True
-        )
+    agent_name = "CoderAgent"
+    system_message = "你是一个代码生成专家，根据用户需求编写高质量的 Python 代码，\
+                要求答案以可直接执行的python格式给出（文字部分通过注释形式回答）。"
 
-    async def handle_message(self, task: str) -> str:
+    def build_prompt(self, task: str) -> str:
         """
-        根据任务描述生成代码，调用AutoGen Agent。
+        根据任务描述生成代码的prompt，直接使用用户需求。
         """
-        response = await self.agent.on_messages(
-            [TextMessage(content=task, source="user")], CancellationToken()
-        )
-        return response.chat_message.to_text()
-
-    async def handle_message_stream(self, task: str):
-        # 使用on_messages_stream实现流式输出
-        async for chunk in self.agent.on_messages_stream(
-            [TextMessage(content=task, source="user")], CancellationToken()
-        ):
-            if hasattr(chunk, "content") and chunk.content:
-                yield chunk.content
+        return task
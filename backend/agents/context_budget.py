@@ -0,0 +1,194 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .code_extractor import iter_fenced_lines
+from ..core.config import settings
+from ..core.metrics import register_metrics
+
+try:
+    import tiktoken
+except ImportError:  # 未安装时按字符数估算
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """懒加载分词器；加载失败（如离线环境下载不到词表）时退回按字符估算，只尝试一次"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(settings.CONTEXT_TOKENIZER)
+        except Exception as e:
+            _encoding_failed = True
+            logger.warning("加载分词器 %s 失败，按字符数估算token: %s", settings.CONTEXT_TOKENIZER, e)
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        # 中文约一个字一个token，英文按字符计偏保守，宁可多压缩也不超预算
+        return len(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """保留开头和结尾，截去中间部分，使结果不超过 max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    head_size, tail_size = max_tokens * 2 // 3, max_tokens // 3
+    encoding = _get_encoding()
+    if encoding is None:
+        head, tail = text[:head_size], text[len(text) - tail_size:] if tail_size else ""
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        head = encoding.decode(tokens[:head_size])
+        tail = encoding.decode(tokens[len(tokens) - tail_size:]) if tail_size else ""
+    return f"{head}\n……（中间省略）……\n{tail}"
+
+
+def split_code(text: str) -> Tuple[str, str]:
+    """
+    拆出Agent输出中的代码和其余说明文字。
+    所有围栏代码块按原顺序、连同围栏原样保留在代码部分（coder 的回答可能分成多个模块或文件，只保留最后一块会丢代码），
+    未闭合的代码块一直保留到结尾；只有代码块之外的说明文字会被压缩。
+    没有围栏代码块时整段视为代码（CoderAgent 被要求直接输出可执行的python）。
+    """
+    code_blocks, prose_lines, previous = [], [], False
+    for line, inside in iter_fenced_lines(text):
+        if not inside:
+            prose_lines.append(line)
+        elif previous:
+            code_blocks[-1].append(line)
+        else:
+            code_blocks.append([line])
+        previous = inside
+    if not code_blocks:
+        return text, ""
+    return "\n\n".join("\n".join(block) for block in code_blocks), "\n".join(prose_lines).strip()
+
+
+@dataclass
+class ContextPart:
+    """
+    Agent输入中的一段内容。
+    kind 为 code 时原样保留；text 按 age 从旧到新依次压缩（age 越大越旧）。
+    """
+    name: str
+    text: str
+    kind: str = "text"
+    age: int = 0
+
+
+@dataclass
+class ContextReport:
+    """一次工作流运行中各阶段输入的压缩情况"""
+    stages: Dict[str, dict] = field(default_factory=dict)
+
+    def record(self, stage: str, original: int, final: int, summarized: List[str], truncated: List[str]):
+        self.stages[stage] = {
+            "original_tokens": original,
+            "final_tokens": final,
+            "saved_tokens": max(0, original - final),
+            "summarized": summarized,
+            "truncated": truncated,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "budget": settings.CONTEXT_TOKEN_BUDGET,
+            "stages": self.stages,
+            "saved_tokens": sum(s["saved_tokens"] for s in self.stages.values()),
+        }
+
+
+class ContextBudget:
+    """
+    把每个Agent的输入限制在 token 预算以内：
+    代码原样保留，较旧的说明文字先替换为摘要（摘要调用走响应缓存，相同内容只生成一次），
+    仍然超出时再截断较新的文字。
+    summarize(text, max_tokens) 返回摘要。
+    """
+    def __init__(self, summarize: Callable[[str, int], Awaitable[str]], budget: Optional[int] = None,
+                 report: Optional[ContextReport] = None):
+        self.summarize = summarize
+        self.budget = budget or settings.CONTEXT_TOKEN_BUDGET
+        self.report = report or ContextReport()
+
+    async def fit(self, stage: str, parts: List[ContextPart]) -> Tuple[Dict[str, str], bool]:
+        """返回 ({名称: 压缩后的内容}, 是否有压缩)；没有超出预算时内容原样返回"""
+        tokens = {part.name: count_tokens(part.text) for part in parts}
+        texts = {part.name: part.text for part in parts}
+        original = sum(tokens.values())
+        summarized, truncated = [], []
+        if original > self.budget:
+            code_tokens = sum(tokens[p.name] for p in parts if p.kind == "code")
+            text_parts = sorted((p for p in parts if p.kind != "code"), key=lambda p: -p.age)
+            # 代码本身超出预算时无法再压缩，文字部分至少保留摘要长度
+            available = max(self.budget - code_tokens, settings.CONTEXT_SUMMARY_TOKENS * len(text_parts))
+            for part in text_parts:
+                if sum(tokens[p.name] for p in text_parts) <= available:
+                    break
+                if tokens[part.name] <= settings.CONTEXT_SUMMARY_TOKENS:
+                    continue
+                try:
+                    summary = await self.summarize(part.text, settings.CONTEXT_SUMMARY_TOKENS)
+                except Exception as e:
+                    logger.warning("阶段 %s 的输入 %s 摘要失败，改为截断: %s", stage, part.name, e)
+                    summary = truncate_tokens(part.text, settings.CONTEXT_SUMMARY_TOKENS)
+                texts[part.name] = summary
+                tokens[part.name] = count_tokens(summary)
+                summarized.append(part.name)
+            # 摘要后仍超出时，从最新的文字开始截断到平均份额
+            overflow = sum(tokens[p.name] for p in text_parts) - available
+            for part in reversed(text_parts):
+                if overflow <= 0:
+                    break
+                share = max(settings.CONTEXT_SUMMARY_TOKENS, tokens[part.name] - overflow)
+                if share < tokens[part.name]:
+                    texts[part.name] = truncate_tokens(texts[part.name], share)
+                    new_tokens = count_tokens(texts[part.name])
+                    overflow -= tokens[part.name] - new_tokens
+                    tokens[part.name] = new_tokens
+                    truncated.append(part.name)
+        final = sum(tokens.values())
+        self.report.record(stage, original, final, summarized, truncated)
+        context_stats.record(original, final, len(summarized))
+        return texts, bool(summarized or truncated)
+
+
+class ContextStats:
+    def __init__(self):
+        self.inputs = 0
+        self.compressed = 0
+        self.summaries = 0
+        self.tokens_in = 0
+        self.tokens_saved = 0
+
+    def record(self, original: int, final: int, summaries: int):
+        self.inputs += 1
+        self.tokens_in += original
+        if final < original:
+            self.compressed += 1
+            self.tokens_saved += original - final
+        self.summaries += summaries
+
+    def stats(self) -> dict:
+        return {
+            "tokenizer": settings.CONTEXT_TOKENIZER if _encoding is not None else "chars",
+            "budget": settings.CONTEXT_TOKEN_BUDGET,
+            "inputs": self.inputs,
+            "compressed": self.compressed,
+            "summaries": self.summaries,
+            "tokens_in": self.tokens_in,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+context_stats = ContextStats()
+register_metrics("context_budget", context_stats.stats)
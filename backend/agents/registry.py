@@ -0,0 +1,55 @@
+# 单Agent注册表：/agent/{name}/stream 接口和后台任务都从这里取Agent及其请求字段，
+# 新增Agent只需实现 StreamingAgent 子类并在此调用 register_agent。
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Sequence, Type
+
+from .base_agent import StreamingAgent
+from .requirement_agent import RequirementAgent
+from .coder_agent import CoderAgent
+from .reviewer_agent import ReviewerAgent
+from .test_agent import TestAgent
+from .doc_agent import DocAgent
+from .finalizer_agent import FinalizerAgent
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    """
+    name: 接口路径和任务类型中的名称；title: 会话名前缀；
+    fields: 依次传给 build_prompt 的请求字段；user_message: 由这些字段的值生成存入数据库的用户消息，默认取第一个字段
+    """
+    name: str
+    agent_cls: Type[StreamingAgent]
+    title: str
+    fields: Sequence[str] = ("description",)
+    user_message: Optional[Callable[..., str]] = None
+
+    def values(self, data: dict) -> list:
+        return [data.get(field, "") for field in self.fields]
+
+    def user_content(self, values: list) -> str:
+        return self.user_message(*values) if self.user_message else values[0]
+
+    def session_name(self, values: list) -> str:
+        return f"{self.title}: {values[0][:30]}"  # 取前30字符作为会话名
+
+
+AGENTS: Dict[str, AgentSpec] = {}
+
+
+def register_agent(spec: AgentSpec) -> AgentSpec:
+    """注册一个Agent，名称重复时覆盖"""
+    AGENTS[spec.name] = spec
+    return spec
+
+
+register_agent(AgentSpec("requirement", RequirementAgent, "需求分析"))
+register_agent(AgentSpec("doc", DocAgent, "文档生成"))
+register_agent(AgentSpec("coder", CoderAgent, "代码生成"))
+register_agent(AgentSpec("reviewer", ReviewerAgent, "代码审查"))
+# 请求字段与旧版 /agent/test/stream 保持一致
+register_agent(AgentSpec("test", TestAgent, "测试生成", fields=("requirement",)))
+register_agent(AgentSpec(
+    "finalizer", FinalizerAgent, "代码整合", fields=("description", "suggestions"),
+    user_message=lambda code, suggestions: f"原始代码：\n{code}\n优化建议：\n{suggestions}",
+))
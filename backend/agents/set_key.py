@@ -1,12 +1,14 @@
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 
-def set_deepseek_api_key(api_key):
+def set_deepseek_api_key(api_key, model="deepseek-chat", http_client=None):
+    # http_client 由客户端池传入，使所有客户端共享同一个连接池；单独调用时由openai自行创建
+    extra_kwargs = {"http_client": http_client} if http_client is not None else {}
     client = OpenAIChatCompletionClient(
-        model="deepseek-chat",
+        model=model,
         api_key=api_key,    # 'sk-45052c02bba348c78f53739546ff3c3c'
         base_url="https://api.deepseek.com/v1",
         model_info={
-            "model_name": "deepseek-chat",
+            "model_name": model,
             "max_tokens": 32768,
             "capabilities": ["chat_completion"],
             "tokenizer": "cl100k_base",
@@ -15,6 +17,9 @@ def set_deepseek_api_key(api_key):
             "json_output": True,
             "structured_output": True,
             "family": "unknown"
-        }
+        },
+        # 流式输出结束时返回本次调用的token用量，用于按路由统计费用
+        stream_options={"include_usage": True},
+        **extra_kwargs
     )
-    return client
\ No newline at end of file
+    return client
@@ -0,0 +1,14 @@
+from .base_agent import StreamingAgent
+
+
+class SummarizerAgent(StreamingAgent):
+    """
+    摘要Agent，基于AutoGen AssistantAgent实现。
+    工作流中某个Agent的输入超出token预算时，用它压缩较旧的说明文字；结果走响应缓存，相同内容只摘要一次。
+    """
+    agent_name = "SummarizerAgent"
+    system_message = "你是技术内容摘要专家，请压缩给定内容，保留需求要点、接口约定、约束条件、发现的问题和修改建议，\
+                不要输出代码，不要添加原文没有的信息。"
+
+    def build_prompt(self, text: str, max_tokens: int) -> str:
+        return f"请把以下内容压缩为不超过{max_tokens}个token的摘要：\n{text}"
@@ -0,0 +1,283 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+from autogen_core import CancellationToken
+from ..core.deadline import remaining, deadline_scope
+
+
+@dataclass
+class Stage:
+    """
+    工作流中的一个阶段。
+    run 接收其依赖阶段的输出 {阶段名: 输出}，返回本阶段的输出文本。
+    start_on_artifact 中列出的依赖一旦产出第一个完整代码块，本阶段就可以开始，
+    此时收到的输入是该代码块而不是依赖阶段的完整输出。
+    budget 为本阶段最多可用的时间占整次运行预算的比例；optional 的阶段在时间不足或超出预算时跳过（降级），
+    不算失败。
+    """
+    name: str
+    run: Callable[[Dict[str, str]], Awaitable[str]]
+    depends_on: Sequence[str] = ()
+    start_on_artifact: Sequence[str] = ()
+    budget: Optional[float] = None
+    optional: bool = False
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str = "pending"          # pending / running / completed / failed / skipped / cancelled
+    output: str = ""
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    early_inputs: List[str] = field(default_factory=list)   # 以代码块提前开始时依赖的阶段
+    inputs: Dict[str, str] = field(default_factory=dict)
+    restored: bool = False          # 从检查点恢复，本次没有实际执行
+    degraded: bool = False          # 可选阶段因时间预算不足被跳过
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "status": self.status,
+            "error": self.error,
+            "duration": round(self.duration, 3),
+            "early_inputs": self.early_inputs,
+            "restored": self.restored,
+            "degraded": self.degraded,
+        }
+
+
+@dataclass
+class GraphRun:
+    results: Dict[str, StageResult] = field(default_factory=dict)
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    budget: Optional[float] = None      # 开始时距截止时间的秒数，没有截止时间时为 None
+
+    @property
+    def wall_clock(self) -> float:
+        return self.finished_at - self.started_at
+
+    @property
+    def serial_time(self) -> float:
+        """所有阶段串行执行时的耗时之和，用来对比并行带来的节省"""
+        return sum(r.duration for r in self.results.values())
+
+    def timings(self) -> dict:
+        return {
+            "stages": [r.to_dict() for r in self.results.values()],
+            "wall_clock": round(self.wall_clock, 3),
+            "serial_time": round(self.serial_time, 3),
+            "saved": round(max(0.0, self.serial_time - self.wall_clock), 3),
+            "budget": round(self.budget, 3) if self.budget is not None else None,
+        }
+
+
+class StageGraph:
+    """
+    声明式的阶段依赖图（DAG）执行器。
+    没有依赖关系的阶段并发执行，同时运行的阶段数不超过 max_parallel；
+    某个阶段失败时，依赖它的下游阶段标记为 skipped，其余分支照常执行；
+    整次运行被取消时，正在执行的阶段中断，尚未开始的阶段不再执行，均标记为 cancelled。
+    当前上下文有截止时间（见 core.deadline）时，每个阶段按 budget 比例分得一段时间，且不超过剩余时间。
+    """
+    def __init__(self, stages: List[Stage], max_parallel: int = 3):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("阶段名称重复")
+        self.max_parallel = max(1, max_parallel)
+        self.order = self._topological_order()
+        self._first_artifact: Dict[str, asyncio.Future] = {}
+
+    def _topological_order(self) -> List[str]:
+        for stage in self.stages.values():
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"阶段 {stage.name} 依赖了不存在的阶段 {dep}")
+        order: List[str] = []
+        visiting, visited = set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"阶段依赖存在环: {name}")
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def descendants(self, name: str) -> List[str]:
+        """直接或间接依赖 name 的所有阶段（按拓扑序）"""
+        affected = {name}
+        for stage_name in self.order:
+            if any(dep in affected for dep in self.stages[stage_name].depends_on):
+                affected.add(stage_name)
+        return [stage_name for stage_name in self.order if stage_name in affected and stage_name != name]
+
+    def publish_artifact(self, stage: str, code: str):
+        """阶段运行过程中产出完整代码块时调用，只有第一个代码块会触发下游提前开始"""
+        future = self._first_artifact.get(stage)
+        if future is not None and not future.done():
+            future.set_result(code)
+
+    async def run(
+        self,
+        on_event: Optional[Callable[[str, StageResult], Awaitable[None]]] = None,
+        restored: Optional[Dict[str, str]] = None,
+        input_overrides: Optional[Dict[str, Dict[str, str]]] = None,
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> GraphRun:
+        """
+        执行整张图。on_event(event, result) 会在阶段开始（stage_start）
+        和结束（stage_complete / stage_failed / stage_skipped / stage_cancelled / stage_restored）时被调用。
+        restored: {阶段名: 输出}，这些阶段直接使用给定输出，不再执行（从检查点恢复）
+        input_overrides: {阶段名: {依赖阶段名: 输入}}，用编辑过的输入替换依赖阶段的输出，被替换的依赖不再等待
+        cancellation_token: 取消时中断正在执行的阶段，尚未开始的阶段不再执行
+        """
+        token = cancellation_token or CancellationToken()
+        restored = restored or {}
+        input_overrides = input_overrides or {}
+        loop = asyncio.get_running_loop()
+        graph_run = GraphRun(results={name: StageResult(name) for name in self.order})
+        done: Dict[str, asyncio.Future] = {name: loop.create_future() for name in self.order}
+        self._first_artifact = {name: loop.create_future() for name in self.order}
+        semaphore = asyncio.Semaphore(self.max_parallel)
+
+        async def emit(event: str, result: StageResult):
+            if on_event is not None:
+                await on_event(event, result)
+
+        graph_run.budget = remaining()
+
+        def stage_timeout(stage: Stage) -> Optional[float]:
+            left = remaining()
+            limits = [] if left is None else [left]
+            if stage.budget and graph_run.budget is not None:
+                limits.append(stage.budget * graph_run.budget)
+            return max(0.0, min(limits)) if limits else None
+
+        async def degrade_stage(result: StageResult, reason: str):
+            result.status = "skipped"
+            result.degraded = True
+            result.error = reason
+            await emit("stage_skipped", result)
+
+        async def cancel_stage(result: StageResult):
+            result.status = "cancelled"
+            await emit("stage_cancelled", result)
+
+        async def run_stage(name: str):
+            stage = self.stages[name]
+            result = graph_run.results[name]
+            try:
+                if name in restored:
+                    result.status = "completed"
+                    result.output = restored[name]
+                    result.restored = True
+                    await emit("stage_restored", result)
+                    return
+                overrides = input_overrides.get(name, {})
+                inputs: Dict[str, str] = {}
+                for dep in stage.depends_on:
+                    if dep in overrides:
+                        inputs[dep] = overrides[dep]
+                        continue
+                    if dep in stage.start_on_artifact:
+                        artifact = self._first_artifact[dep]
+                        await asyncio.wait([done[dep], artifact], return_when=asyncio.FIRST_COMPLETED)
+                        if artifact.done() and not artifact.cancelled() and not done[dep].done():
+                            inputs[dep] = artifact.result()
+                            result.early_inputs.append(dep)
+                            continue
+                    dep_result = await done[dep]
+                    if dep_result.status != "completed":
+                        if token.is_cancelled():
+                            await cancel_stage(result)
+                            return
+                        result.status = "skipped"
+                        await emit("stage_skipped", result)
+                        return
+                    inputs[dep] = dep_result.output
+                # 覆盖项中也可以有不对应依赖阶段的额外输入（如原始需求）
+                inputs.update(overrides)
+                result.inputs = inputs
+                async with semaphore:
+                    if token.is_cancelled():
+                        await cancel_stage(result)
+                        return
+                    timeout = stage_timeout(stage)
+                    if stage.optional and stage.budget and timeout is not None \
+                            and timeout < stage.budget * graph_run.budget:
+                        await degrade_stage(result, f"剩余时间 {timeout:.1f}s 不足，跳过")
+                        return
+                    result.status = "running"
+                    result.started_at = time.perf_counter()
+                    await emit("stage_start", result)
+                    try:
+                        if timeout is None:
+                            result.output = await stage.run(inputs)
+                        else:
+                            # 阶段内的LLM调用从上下文读取收紧后的截止时间
+                            with deadline_scope(timeout):
+                                result.output = await asyncio.wait_for(stage.run(inputs), timeout)
+                        result.status = "cancelled" if token.is_cancelled() else "completed"
+                    except asyncio.TimeoutError:
+                        result.error = f"超出时间预算 {timeout:.1f}s"
+                        if stage.optional:
+                            result.status = "skipped"
+                            result.degraded = True
+                        else:
+                            result.status = "failed"
+                    except asyncio.CancelledError:
+                        # 只吞掉由本次运行的取消令牌引起的取消
+                        if not token.is_cancelled():
+                            raise
+                        result.status = "cancelled"
+                    except Exception as e:
+                        result.status = "failed"
+                        result.error = str(e)
+                    finally:
+                        result.finished_at = time.perf_counter()
+                await emit({
+                    "completed": "stage_complete",
+                    "cancelled": "stage_cancelled",
+                    "skipped": "stage_skipped",
+                }.get(result.status, "stage_failed"), result)
+            finally:
+                if not done[name].done():
+                    done[name].set_result(result)
+
+        graph_run.started_at = time.perf_counter()
+        tasks = {name: asyncio.create_task(run_stage(name)) for name in self.order}
+
+        def on_cancel():
+            # 在令牌的锁内执行，只安排取消，不回调令牌；等待依赖的阶段醒来后会看到已取消
+            for name, task in tasks.items():
+                if graph_run.results[name].status == "running":
+                    task.cancel()
+
+        token.add_callback(on_cancel)
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            for future in self._first_artifact.values():
+                future.cancel()
+            graph_run.finished_at = time.perf_counter()
+        return graph_run
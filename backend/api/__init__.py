@@ -2,13 +2,11 @@ from fastapi import APIRouter
 from .messages import router as messages_router
 from .auth import router as auth_router
 from .workflow_api import router as workflow_router
-from .requirement_api import router as requirement_router
 from .set_key import router as set_key_router
-from .doc_api import router as doc_agent_router
-from .coder_api import router as coder_agent_router
-from .reviewer_api import router as reviewer_agent_router
-from .test_api import router as test_agent_router
-from .finalizer_api import router as finalizer_agent_router
+from .metrics_api import router as metrics_router
+from .jobs_api import router as jobs_router
+from .agent_endpoint import agent_router
+from ..agents.registry import AGENTS
 
 router = APIRouter()
 
@@ -16,16 +14,12 @@ router = APIRouter()
 router.include_router(messages_router, tags=['Messages'])
 router.include_router(auth_router, prefix="/auth", tags=["Auth"])
 router.include_router(workflow_router, prefix="/workflow", tags=["Workflow"])
+router.include_router(metrics_router, prefix="/metrics", tags=["Metrics"])
+router.include_router(jobs_router, prefix="/jobs", tags=["Jobs"])
 
-# 注册需求相关API (包含流式接口)
-router.include_router(requirement_router, prefix="/agent/requirement", tags=["RequirementAgent"])
-
-# 注册各个Agent的独立路由
-router.include_router(doc_agent_router, prefix="/agent/doc", tags=["DocAgent"])
-router.include_router(coder_agent_router, prefix="/agent/coder", tags=["CoderAgent"])
-router.include_router(reviewer_agent_router, prefix="/agent/reviewer", tags=["ReviewerAgent"])
-router.include_router(test_agent_router, prefix="/agent/test", tags=["TestAgent"])
-router.include_router(finalizer_agent_router, prefix="/agent/finalizer", tags=["FinalizerAgent"])
+# 注册各个Agent的独立路由（/agent/{name}/stream），新增Agent在 agents/registry.py 中注册即可
+for spec in AGENTS.values():
+    router.include_router(agent_router(spec), prefix=f"/agent/{spec.name}", tags=[spec.agent_cls.agent_name])
 
 # 注册API Key设置路由
 routers = [
@@ -0,0 +1,146 @@
+import time
+from collections import deque
+from typing import Dict
+
+from fastapi import APIRouter, Depends, Request, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..agents.registry import AgentSpec
+from ..models.user import User as UserModel
+from ..services.client_pool import model_client_pool
+from ..services.model_router import ModelRouting
+from ..services.cancellation import watch_disconnect
+from ..services.sessions import create_session_with_message
+from ..services.chunk_store import ChunkWriter
+from ..services.stream_coalescer import coalesced_response
+from ..services.admission import admit_request
+from ..core.config import settings
+from ..core.database import get_db
+from ..core.deadline import deadline_scope, DeadlineExceeded, DEADLINE_NOTICE
+from ..core.metrics import register_metrics
+from ..core.utils import get_current_user
+
+
+class EndpointStats:
+    """
+    各单Agent接口的首token时间（TTFT，从进入处理函数到输出第一个token）及其中建会话所用的时间。
+    分位数按最近 window 个请求计算。
+    """
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._endpoints: Dict[str, dict] = {}
+
+    def _entry(self, name: str) -> dict:
+        return self._endpoints.setdefault(name, {
+            "requests": 0, "setup": deque(maxlen=self.window), "ttft": deque(maxlen=self.window),
+        })
+
+    def record_setup(self, name: str, seconds: float):
+        entry = self._entry(name)
+        entry["requests"] += 1
+        entry["setup"].append(seconds)
+
+    def record_ttft(self, name: str, seconds: float):
+        self._entry(name)["ttft"].append(seconds)
+
+    @staticmethod
+    def _summary(samples) -> dict:
+        if not samples:
+            return {"avg": None, "p50": None, "p95": None}
+        ordered = sorted(samples)
+        return {
+            "avg": round(sum(ordered) / len(ordered), 4),
+            "p50": round(ordered[len(ordered) // 2], 4),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        }
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "requests": entry["requests"],
+                "setup": self._summary(entry["setup"]),
+                "ttft": self._summary(entry["ttft"]),
+            }
+            for name, entry in self._endpoints.items()
+        }
+
+
+endpoint_stats = EndpointStats()
+register_metrics("agent_endpoints", endpoint_stats.stats)
+
+
+def agent_router(spec: AgentSpec) -> APIRouter:
+    """
+    为注册的Agent生成 POST /stream 接口：流式返回回答，并存入数据库（sessions和messages表）。
+    会话和用户消息一次写入（见 services/sessions.py），之后立即开始生成，减少首token前的数据库往返。
+    流式输出期间不占用请求的数据库连接；回答边生成边按分块追加写入（见 services/chunk_store.py），
+    生成中途即可在历史记录中看到，客户端断开或出错时保留已生成的部分。
+    发送给客户端的token按 STREAM_COALESCE 中该Agent的配置合并后再发送。
+    请求先经过准入控制（见 services/admission.py），超出速率或排队已满时返回429；
+    响应头 X-Queue-Position 为接纳时模型调用的排队位置（0 表示无需排队）。
+    """
+    router = APIRouter()
+
+    @router.post(
+        "/stream", name=f"{spec.name}_stream",
+        description=f"流式{spec.title}API，返回内容并存入数据库（sessions和messages表）"
+    )
+    async def stream(
+        request: Request,
+        current_user: UserModel = Depends(get_current_user),
+        queue_position: int = Depends(admit_request),
+        db: AsyncSession = Depends(get_db)
+    ):
+        started = time.monotonic()
+        data = await request.json()
+        # 可选的 model 字段覆盖路由表选择的模型（层级名或模型名）
+        try:
+            routing = ModelRouting(current_user.api_key, data.get("model"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        values = spec.values(data)
+
+        # 1. 创建会话及用户消息
+        session_id = await create_session_with_message(
+            db, current_user.id, spec.session_name(values), spec.user_content(values)
+        )
+        endpoint_stats.record_setup(spec.name, time.monotonic() - started)
+        # 流式输出可能持续数分钟，立即归还数据库连接（current_user 等已加载的属性仍可访问）
+        await db.close()
+
+        # 2. 生成AI回答并流式返回，同时收集完整回答
+        async def event_stream():
+            writer = ChunkWriter(session_id)
+            first_token = True
+            status = "partial"
+            try:
+                # 从客户端池租用当前用户的model_client，流结束后自动归还；客户端断开时取消模型调用
+                try:
+                    with deadline_scope(settings.AGENT_DEADLINE):
+                        async with watch_disconnect(request) as cancellation, \
+                                model_client_pool.lease(current_user.api_key) as client:
+                            agent = spec.agent_cls(client, routing)
+                            async for token in agent.handle_message_stream(*values, cancellation_token=cancellation):
+                                if first_token:
+                                    endpoint_stats.record_ttft(spec.name, time.monotonic() - started)
+                                    first_token = False
+                                await writer.append(token)
+                                yield token
+                except DeadlineExceeded:
+                    # 超过时间预算：保留已生成的部分，提示输出被截断，并保存为超时的部分回答
+                    status = "timeout"
+                    await writer.append(DEADLINE_NOTICE)
+                    yield DEADLINE_NOTICE
+                else:
+                    if not cancellation.is_cancelled():
+                        status = "complete"
+            finally:
+                # 3. 把分块合并进Message表；客户端断开或出错时保存为部分回答
+                writer.close_in_background(status)
+
+        return coalesced_response(
+            spec.name, request, event_stream(), media_type="text/plain",
+            headers={"X-Queue-Position": str(queue_position)}
+        )
+
+    return router
@@ -68,17 +68,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/userinfo", response_model=UserOut)
-async def get_userinfo(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    return await get_current_user(db,token)
+async def get_userinfo(current_user: UserModel = Depends(get_current_user)):
+    return current_user
 
 @router.get("/validate_token")
-async def validate_token(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    payload = decode_access_token(token)
-    username = payload.get("sub")
-    if not username:
-        raise HTTPException(status_code=401, detail="无效token")
-    result = await db.execute(select(UserModel).filter(UserModel.username == username))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=401, detail="无效token")
-    return {"valid": True, "username": username}
+async def validate_token(current_user: UserModel = Depends(get_current_user)):
+    return {"valid": True, "username": current_user.username}
@@ -0,0 +1,107 @@
+from fastapi import APIRouter, Depends, Request, HTTPException, Header
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Optional
+from ..models.job import Job
+from ..models.user import User as UserModel
+from ..services.job_queue import submit_job, get_job, job_event_stream, job_to_dict
+from ..services.job_worker import JOB_KINDS
+from ..agents.registry import AGENTS
+from ..services.event_stream import parse_last_event_id
+from ..services.stream_coalescer import coalesced_response
+from ..services.workflow_runner import create_workflow_session
+from ..services.model_router import parse_model_overrides
+from ..services.admission import admit_request
+from ..core.database import get_db
+from ..core.utils import get_current_user
+
+router = APIRouter()
+
+# 事件流响应头：禁止缓存和代理缓冲，保证事件实时到达
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@router.post("/")
+async def create_job(
+    request: Request,
+    current_user: UserModel = Depends(get_current_user),
+    _: int = Depends(admit_request),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    提交后台任务，立即返回 job_id。任务由独立的worker进程执行，与HTTP连接无关；
+    请求体为 {"kind": "workflow" 或单Agent名称, ...与对应 /stream 接口相同的字段}。
+    """
+    data = await request.json()
+    kind = data.pop("kind", "workflow")
+    if kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"不支持的任务类型: {kind}")
+    try:
+        parse_model_overrides(data.get("model"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if kind == "workflow":
+        content = data.get("description", "")
+        session_name = None
+    else:
+        spec = AGENTS[kind]
+        values = spec.values(data)
+        content, session_name = spec.user_content(values), spec.session_name(values)
+
+    # 会话和用户消息在提交时创建，worker执行完成后写入assistant消息
+    session_id = await create_workflow_session(db, current_user.id, content, session_name=session_name)
+    job = await submit_job(db, current_user.id, kind, data, session_id=session_id)
+    return {"job_id": job.job_id, "session_id": session_id, "status": job.status}
+
+
+@router.get("/")
+async def list_jobs(
+    limit: int = 20,
+    current_user: UserModel = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """当前用户最近提交的任务"""
+    jobs = (await db.execute(
+        select(Job)
+        .filter_by(user_id=current_user.id)
+        .order_by(Job.created_at.desc())
+        .limit(min(max(limit, 1), 100))
+    )).scalars().all()
+    return [job_to_dict(job) for job in jobs]
+
+
+@router.get("/{job_id}")
+async def read_job(
+    job_id: str,
+    current_user: UserModel = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """查询任务状态，完成后包含执行结果"""
+    job = await get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job_to_dict(job)
+
+
+@router.get("/{job_id}/stream")
+async def stream_job(
+    request: Request,
+    job_id: str,
+    last_event_id: Optional[str] = Header(None),
+    current_user: UserModel = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    附着到任务的事件流（text/event-stream），可以在任务运行中或结束后随时附着；
+    携带 Last-Event-ID 时从该序号之后继续推送。
+    """
+    job = await get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    # 事件流轮询时按需取连接，不占用本请求的数据库会话
+    await db.close()
+    after_seq = parse_last_event_id(last_event_id)
+    headers = {**SSE_HEADERS, "X-Job-Id": job_id}
+    return coalesced_response(
+        "jobs", request, job_event_stream(job_id, after_seq), media_type="text/event-stream", headers=headers
+    )
@@ -1,52 +1,224 @@
-from fastapi import APIRouter, Depends
-from typing import List
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import Dict, List, Optional
+from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..core.database import get_db
 from ..core.utils import get_current_user
 from ..models.session import Session as Session_History
 from ..models.user import User
 from ..models.message import Message
+from ..services.chunk_store import streaming_contents
+from ..services.message_search import search_messages, SearchUnavailable
+from ..services.message_codec import decode_content
+from ..services.blob_store import blob_contents
+from ..core.config import settings
 
 router = APIRouter()
 
+# 每页最多的会话数 / 每个会话最多返回的消息数
+MAX_PAGE_SIZE = 100
+
+
+def _clamp(value: int, upper: int = MAX_PAGE_SIZE) -> int:
+    return min(max(value, 1), upper)
+
+
+def _message_columns(preview: int) -> list:
+    """
+    消息的查询列。preview > 0 时只取正文的前 preview+1 个字符（多取一个用于判断是否被截断），
+    PostgreSQL 对 substr 只解压需要的前缀，长回答不必整条读出。
+    压缩保存的正文（codec 不为空）取出 content_blob 在应用中解压，去重保存的正文（blob_hash 不为空）另外读取。
+    """
+    content = func.substr(Message.content, 1, preview + 1) if preview else Message.content
+    return [
+        Message.message_id, Message.session_id, Message.role, Message.status, Message.created_at,
+        content.label("content"), Message.codec, Message.content_blob, Message.blob_hash,
+    ]
+
+
+def _message_dict(row, contents: Dict[int, str], preview: int) -> dict:
+    content = contents[row.message_id]
+    message = {
+        "id": row.message_id,
+        "content": content,
+        "role": row.role,
+        "status": row.status,
+        "created_at": row.created_at,
+    }
+    if preview:
+        message["content"] = content[:preview]
+        message["truncated"] = len(content) > preview
+    return message
+
+
+async def _contents(db: AsyncSession, rows) -> Dict[int, str]:
+    """
+    各消息的完整正文 {message_id: 内容}：解压或从 message_blobs 读取，正在生成的消息加上已写入的分块。
+    没有 streaming 消息或去重保存的正文时不额外查询。
+    """
+    partial = await streaming_contents(db, [row.message_id for row in rows if row.status == "streaming"])
+    blobs = await blob_contents(db, [row.blob_hash for row in rows])
+    return {
+        row.message_id: (
+            blobs[row.blob_hash] if row.blob_hash is not None
+            else decode_content(row.content, row.codec, row.content_blob)
+        ) + partial.get(row.message_id, "")
+        for row in rows
+    }
+
+
 @router.get("/messages/", response_model=List[dict])
 async def list_user_messages(
-    db: AsyncSession = Depends(get_db), 
+    response: Response,
+    limit: int = 10,
+    cursor: Optional[int] = None,
+    messages_limit: int = 50,
+    preview: int = 0,
+    db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user)
 ):
     """
-    获取某个用户的最新10条历史会话信息，包括Session_History和Message表内容
-    返回格式: List[{"session_id": int, "session_name": str, "messages": List[{"id": int, "content": str, "role": str, "created_at": datetime}]}]
+    获取用户的历史会话及其消息，按会话从新到旧分页：每页 limit 个会话，
+    响应头 X-Next-Cursor 为下一页的 cursor（没有更多会话时不返回）。
+    会话和消息的主键按创建顺序递增，按主键做键集分页，翻页不受新写入的影响，也不需要 OFFSET。
+    每个会话最多返回前 messages_limit 条消息，更多的消息用会话的 next_message_cursor 调用 GET /messages/sessions/{session_id} 继续读取。
+    preview > 0 时每条消息只返回前 preview 个字符（truncated 表示是否被截断），完整内容用 GET /messages/{message_id} 按需加载。
+    无论多少个会话，一页只需两次查询（会话一次、消息一次，用窗口函数限制每个会话的条数），有正在生成的消息、去重保存的正文时各再加一次。
+    返回格式: List[{"session_id": int, "session_name": str, "next_message_cursor": int | None,
+                    "messages": List[{"id": int, "content": str, "role": str, "status": str, "created_at": datetime}]}]
+    status 为 streaming 的消息正在生成，content 是目前已生成的部分；partial 表示生成中断。
     """
-    # 获取用户最新的10条会话，按创建时间倒序排列
+    limit = _clamp(limit)
+    messages_limit = _clamp(messages_limit)
+    preview = max(preview, 0)
+
+    query = select(Session_History.session_id, Session_History.session_name).filter_by(user_id=user.id)
+    if cursor is not None:
+        query = query.where(Session_History.session_id < cursor)
     sessions = (await db.execute(
-        select(Session_History)
-        .filter_by(user_id=user.id)
-        .order_by(Session_History.created_at.desc())
-        .limit(10)
-    )).scalars().all()
-    
+        query.order_by(Session_History.session_id.desc()).limit(limit + 1)
+    )).all()
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        response.headers["X-Next-Cursor"] = str(sessions[-1].session_id)
+    if not sessions:
+        return []
+
+    # 每个会话按消息顺序编号，只取前 messages_limit + 1 条（多取一条用于判断是否还有更多）
+    numbered = (
+        select(
+            *_message_columns(preview),
+            func.row_number().over(partition_by=Message.session_id, order_by=Message.message_id).label("rn"),
+        )
+        .where(Message.session_id.in_([session.session_id for session in sessions]))
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(numbered)
+        .where(numbered.c.rn <= messages_limit + 1)
+        .order_by(numbered.c.session_id, numbered.c.message_id)
+    )).all()
+    contents = await _contents(db, rows)
+
+    by_session: Dict[int, list] = {session.session_id: [] for session in sessions}
+    for row in rows:
+        by_session[row.session_id].append(row)
     result = []
     for session in sessions:
-        messages = (await db.execute(
-            select(Message)
-            .filter_by(session_id=session.session_id)
-            .order_by(Message.created_at)
-        )).scalars().all()
-        
-        msg_list = [
-            {
-                "id": msg.message_id,
-                "content": msg.content,
-                "role": msg.role,
-                "created_at": msg.created_at
-            }
-            for msg in messages
-        ]
+        session_rows = by_session[session.session_id]
+        more = len(session_rows) > messages_limit
+        session_rows = session_rows[:messages_limit]
         result.append({
             "session_id": session.session_id,
-            "session_name": getattr(session, "session_name", ""),
-            "messages": msg_list
+            "session_name": session.session_name or "",
+            "next_message_cursor": session_rows[-1].message_id if more else None,
+            "messages": [_message_dict(row, contents, preview) for row in session_rows],
         })
-    return result
\ No newline at end of file
+    return result
+
+
+@router.get("/messages/sessions/{session_id:int}", response_model=List[dict])
+async def list_session_messages(
+    session_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: int = 50,
+    preview: int = 0,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """
+    按顺序分页读取一个会话的消息：返回 cursor 之后的 limit 条，响应头 X-Next-Cursor 为下一页的 cursor。
+    preview 的含义与 GET /messages/ 相同。
+    """
+    limit = _clamp(limit)
+    preview = max(preview, 0)
+    query = (
+        select(*_message_columns(preview))
+        .join(Session_History, Session_History.session_id == Message.session_id)
+        .where(Message.session_id == session_id, Session_History.user_id == user.id)
+    )
+    if cursor is not None:
+        query = query.where(Message.message_id > cursor)
+    rows = (await db.execute(query.order_by(Message.message_id).limit(limit + 1))).all()
+    if not rows:
+        # 区分会话不存在（或不属于当前用户）与已经读完
+        owned = (await db.execute(
+            select(Session_History.session_id).filter_by(session_id=session_id, user_id=user.id)
+        )).scalar_one_or_none()
+        if owned is None:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        return []
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].message_id)
+    contents = await _contents(db, rows)
+    return [_message_dict(row, contents, preview) for row in rows]
+
+
+@router.get("/messages/search", response_model=dict)
+async def search_user_messages(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    role: Optional[str] = None,
+    session_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """
+    在当前用户的历史消息中全文搜索，按相关度排序；可以按角色（user / assistant）或会话过滤。
+    每条结果带命中位置附近的摘要（snippet，已转义的HTML，命中的词用 <mark> 标出），完整内容用 GET /messages/{message_id} 读取。
+    返回 {"query", "results", "has_more", "took_ms", "backend"}，took_ms 为数据库查询耗时。
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="搜索内容不能为空")
+    if role is not None and role not in ("user", "assistant"):
+        raise HTTPException(status_code=400, detail=f"不支持的角色: {role}")
+    try:
+        result = await search_messages(
+            db, user.id, q, limit=_clamp(limit, settings.SEARCH_MAX_RESULTS), offset=min(max(offset, 0), 1000),
+            role=role, session_id=session_id
+        )
+    except SearchUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"query": q, **result}
+
+
+@router.get("/messages/{message_id:int}", response_model=dict)
+async def read_message(
+    message_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """读取一条消息的完整内容，配合 preview 按需加载"""
+    row = (await db.execute(
+        select(*_message_columns(0))
+        .join(Session_History, Session_History.session_id == Message.session_id)
+        .where(Message.message_id == message_id, Session_History.user_id == user.id)
+    )).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="消息不存在")
+    message = _message_dict(row, await _contents(db, [row]), 0)
+    message["session_id"] = row.session_id
+    return message
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from ..core.metrics import collect_metrics
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_metrics():
+    """返回进程内各模块的运行指标（客户端池命中率、连接数等）"""
+    return collect_metrics()
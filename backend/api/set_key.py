@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
 from backend.models.user import User as UserModel
+from ..auth.user_cache import user_cache
 from ..core.database import get_db
 from ..core.utils import get_current_user
 from fastapi.security import OAuth2PasswordBearer
@@ -14,11 +16,12 @@ class SetKeyRequest(BaseModel):
     api_key: str
 
 @router.post("/set_key")
-def set_api_key(
+async def set_api_key(
     data: SetKeyRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
-    current_user.api_key = data.api_key
-    db.commit()
-    return {"api_key": current_user.api_key}
+    # current_user 来自用户缓存，不属于当前会话，直接按id更新；提交后使缓存失效，下个请求读到新的api_key
+    await db.execute(update(UserModel).where(UserModel.id == current_user.id).values(api_key=data.api_key))
+    await user_cache.commit_and_invalidate(db, current_user.username)
+    return {"api_key": data.api_key}
@@ -1,19 +1,36 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, HTTPException, Header
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional, Union
+from sqlalchemy import select
+import asyncio
+import json
 from ..models.session import Session as Session_History
 from ..models.message import Message
 from ..agents.agent_workflow import AgentWorkflow
 from ..models.user import User as UserModel
-from ..agents.set_key import set_deepseek_api_key
+from ..services.event_stream import workflow_runs, sse_stream, parse_last_event_id
+from ..services.blob_store import read_content
+from ..services.checkpoints import load_checkpoints, completed_outputs, checkpoint_to_dict
+from ..services.workflow_runner import run_workflow, create_workflow_session, make_batch_worker, prepare_rerun
+from ..services.batch_runner import BatchRunner, parse_batch_items
+from ..services.cancellation import cancel_when_abandoned
+from ..services.model_router import parse_model_overrides
+from ..services.stream_coalescer import coalesced_response
+from ..services.admission import admit_request
+from autogen_core import CancellationToken
 from ..core.database import get_db
+from ..core.config import settings
+from ..core.deadline import deadline_scope
 from ..core.utils import get_current_user
-from .set_key import get_current_user
 from pydantic import BaseModel
 
 
 router = APIRouter()
 
+# 事件流响应头：禁止缓存和代理缓冲，保证事件实时到达
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 class WorkflowRequest(BaseModel):
     requirement: str
 
@@ -25,54 +42,190 @@ class WorkflowResponse(BaseModel):
     doc: str
     test_code: str
 
+# 后台运行中的工作流任务，保留引用防止被垃圾回收
+_background_tasks = set()
+
+def start_workflow_run(request: Request, current_user: UserModel, requirement: str, session_id: int,
+                       restored: Dict[str, str] = None,
+                       input_overrides: Dict[str, Dict[str, str]] = None,
+                       model_overrides=None, queue_position: int = 0) -> StreamingResponse:
+    """
+    在后台启动一次运行，返回该运行的事件流响应。
+    客户端全部断开且超过 WORKFLOW_DISCONNECT_GRACE 秒没有续传时取消运行，未开始的阶段不再执行。
+    model_overrides 不合法时返回400。queue_position 为准入时模型调用的排队位置，放在响应头 X-Queue-Position 中，
+    运行中阶段排队的位置变化以 queued 事件推送。
+    """
+    try:
+        model_overrides = parse_model_overrides(model_overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    log = workflow_runs.create(owner_id=current_user.id)
+    log.append("run_start", None, session_id=session_id)
+    token = CancellationToken()
+    # 后台任务创建时复制当前上下文，继承工作流的截止时间（不晚于请求头声明的截止时间）
+    with deadline_scope(settings.WORKFLOW_DEADLINE):
+        run = asyncio.create_task(run_workflow(
+            log, current_user.api_key, requirement, session_id, restored, input_overrides, token,
+            model_overrides
+        ))
+    tasks = [run, asyncio.create_task(cancel_when_abandoned(log, token))]
+    for task in tasks:
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    headers = {**SSE_HEADERS, "X-Run-Id": log.run_id, "X-Queue-Position": str(queue_position)}
+    return coalesced_response("workflow", request, sse_stream(log), media_type="text/event-stream", headers=headers)
+
+
+async def get_owned_session(db: AsyncSession, session_id: int, user: UserModel):
+    """取出属于当前用户的会话及其原始需求（会话中第一条用户消息）"""
+    session = (await db.execute(
+        select(Session_History).filter_by(session_id=session_id, user_id=user.id)
+    )).scalar_one_or_none()
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    first_message = (await db.execute(
+        select(Message)
+        .filter_by(session_id=session_id, role="user")
+        .order_by(Message.message_id)
+        .limit(1)
+    )).scalar_one_or_none()
+    return session, await read_content(db, first_message) if first_message else ""
+
+
 @router.post("/stream")
 async def workflow_stream(
-    request: Request, 
+    request: Request,
     current_user: UserModel = Depends(get_current_user),
+    queue_position: int = Depends(admit_request),
     db: AsyncSession = Depends(get_db)
 ):
-    """流式Agent Workflow API，返回内容并存入数据库（sessions和messages表）"""
+    """
+    流式Agent Workflow API（text/event-stream），返回内容并存入数据库（sessions和messages表）。
+    每条事件带有递增的 id（序号），断线后可用 Last-Event-ID 调用 GET /workflow/stream/{run_id} 续传。
+    可选的 model 字段覆盖路由表：层级/模型名，或 {阶段名: 层级或模型}。
+    """
     data = await request.json()
     requirement = data.get("description", "")
-    
-    # 用当前用户的api_key创建model_client
-    client = set_deepseek_api_key(current_user.api_key)
-    workflow = AgentWorkflow(client)
-
-    # 1. 创建新的Session_History记录
-    new_session = Session_History(
-        user_id=current_user.id,
-        session_name=f"Agent Workflow: {requirement[:30]}"  # 取前30字符作为会话名
+    try:
+        parse_model_overrides(data.get("model"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 1. 创建会话及用户需求消息
+    session_id = await create_workflow_session(db, current_user.id, requirement)
+    # 事件流期间不再使用数据库，立即归还连接
+    await db.close()
+
+    # 2. 在后台运行工作流，事件写入回放缓冲区
+    return start_workflow_run(
+        request, current_user, requirement, session_id, model_overrides=data.get("model"), queue_position=queue_position
+    )
+
+
+@router.post("/batch")
+async def workflow_batch(
+    request: Request,
+    concurrency: Optional[int] = None,
+    current_user: UserModel = Depends(get_current_user),
+    _: int = Depends(admit_request)
+):
+    """
+    批量执行工作流。请求体为NDJSON，每行一条需求（description / requirement / title + body，可带 id）；
+    响应为 application/x-ndjson，逐行输出条目开始、阶段进度、条目结果，以及吞吐量和预计剩余时间。
+    每条需求单独建立会话并存入数据库。concurrency 可以进一步限制本批次的并发数。
+    """
+    body = (await request.body()).decode("utf-8")
+    try:
+        items = parse_batch_items(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    runner = BatchRunner(make_batch_worker(current_user), concurrency=concurrency)
+
+    async def ndjson_stream():
+        yield json.dumps({"type": "batch_start", "total": len(items)}, ensure_ascii=False) + "\n"
+        async for record in runner.run(items, current_user.id):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
+
+@router.get("/stream/{run_id}")
+async def workflow_stream_resume(
+    request: Request,
+    run_id: str,
+    last_event_id: Optional[str] = Header(None),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """断线续传：从 Last-Event-ID 之后的事件继续推送，不重新执行工作流"""
+    log = workflow_runs.get(run_id)
+    if log is None or log.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="运行不存在或已过期")
+    workflow_runs.resumes += 1
+    after_seq = parse_last_event_id(last_event_id)
+    headers = {**SSE_HEADERS, "X-Run-Id": log.run_id}
+    return coalesced_response(
+        "workflow", request, sse_stream(log, after_seq), media_type="text/event-stream", headers=headers
     )
-    db.add(new_session)
-    await db.commit()
-    await db.refresh(new_session)
-    session_id = new_session.session_id
-
-    # 2. 创建用户问题的Message记录
-    user_message = Message(
-        session_id=session_id,
-        content=requirement,
-        role="user"
+
+
+@router.get("/{session_id}/checkpoints")
+async def list_checkpoints(
+    session_id: int,
+    current_user: UserModel = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """查看会话中各阶段的检查点"""
+    await get_owned_session(db, session_id, current_user)
+    return [checkpoint_to_dict(cp) for cp in await load_checkpoints(session_id)]
+
+
+@router.post("/{session_id}/resume")
+async def workflow_resume(
+    request: Request,
+    session_id: int,
+    current_user: UserModel = Depends(get_current_user),
+    queue_position: int = Depends(admit_request),
+    db: AsyncSession = Depends(get_db)
+):
+    """从检查点恢复：已完成的阶段直接复用输出，只执行失败或未执行的阶段"""
+    _, requirement = await get_owned_session(db, session_id, current_user)
+    await db.close()
+    restored = await completed_outputs(session_id)
+    return start_workflow_run(
+        request, current_user, requirement, session_id, restored=restored, queue_position=queue_position
+    )
+
+
+class StageRerunRequest(BaseModel):
+    inputs: Dict[str, str] = {}     # {依赖阶段名: 编辑后的输入}，"user" 表示原始需求
+    downstream: bool = True         # 是否同时重跑依赖该阶段的下游阶段
+    model: Union[str, Dict[str, str], None] = None     # 覆盖路由表选择的模型
+
+
+@router.post("/{session_id}/stages/{stage}/rerun")
+async def workflow_rerun_stage(
+    request: Request,
+    session_id: int,
+    stage: str,
+    data: StageRerunRequest,
+    current_user: UserModel = Depends(get_current_user),
+    queue_position: int = Depends(admit_request),
+    db: AsyncSession = Depends(get_db)
+):
+    """用编辑过的输入重跑单个阶段，其他已完成阶段从检查点复用"""
+    _, requirement = await get_owned_session(db, session_id, current_user)
+    await db.close()
+    if stage not in AgentWorkflow.STAGES:
+        raise HTTPException(status_code=404, detail=f"阶段不存在: {stage}")
+    # 先校验再删除检查点，请求不合法时不影响已有的检查点
+    try:
+        parse_model_overrides(data.model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    restored = await prepare_rerun(session_id, stage, data.downstream)
+    return start_workflow_run(
+        request, current_user, requirement, session_id,
+        restored=restored, input_overrides={stage: data.inputs}, model_overrides=data.model,
+        queue_position=queue_position
     )
-    db.add(user_message)
-    await db.commit()
-    await db.refresh(user_message)
-
-    # 3. 生成AI回答并流式返回，同时收集完整回答
-    async def event_stream():
-        answer_chunks = []
-        async for token in workflow.run_stream(requirement):
-            answer_chunks.append(token)
-            yield token
-        # 4. 回答生成完毕后，存入Message表
-        full_answer = "".join(answer_chunks)
-        assistant_message = Message(
-            session_id=session_id,
-            content=full_answer,
-            role="assistant"
-        )
-        db.add(assistant_message)
-        await db.commit()
-
-    return StreamingResponse(event_stream(), media_type="text/plain")
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal, engine
+from ..core.metrics import register_metrics
+from ..models.user import User as UserModel
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL LISTEN/NOTIFY 频道，负载为用户名
+CHANNEL = "user_cache_invalidate"
+
+
+def _snapshot(user: UserModel) -> UserModel:
+    """复制出一个不属于任何数据库会话的 User 对象：可以跨请求共享，修改它不会写回数据库"""
+    return UserModel(**{column.key: getattr(user, column.key) for column in UserModel.__table__.columns})
+
+
+class UserCache:
+    """
+    进程内的用户缓存，按token中的用户名（sub）缓存 User，每个请求的鉴权不再查询数据库。
+    条目在 ttl 秒后过期；用户信息修改后调用 commit_and_invalidate 立即失效。
+    多个worker进程时开启 USER_CACHE_BROADCAST，失效消息通过 PostgreSQL NOTIFY 广播给所有进程；
+    未开启时其他进程最多在 ttl 秒内读到旧数据。
+    缓存的 User 对象只读，需要修改用户时在请求自己的数据库会话中更新（见 api/set_key.py）。
+    """
+    def __init__(self, ttl: float = None, max_size: int = None):
+        self.ttl = settings.USER_CACHE_TTL if ttl is None else ttl
+        self.max_size = max_size or settings.USER_CACHE_MAX_SIZE
+        self._entries: Dict[str, Tuple[UserModel, float]] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        # 每次失效加一：加载期间发生过失效时，加载结果不放入缓存
+        self._generation = 0
+        self.listening = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+        self.hit_time = 0.0
+        self.miss_time = 0.0
+
+    async def get_user(self, username: str) -> Optional[UserModel]:
+        """返回用户，不存在时返回 None"""
+        started = time.perf_counter()
+        entry = self._entries.get(username)
+        if entry is not None and entry[1] > time.monotonic():
+            self.hits += 1
+            self.hit_time += time.perf_counter() - started
+            return entry[0]
+        self.misses += 1
+        # 同一用户并发未命中时只查询一次
+        future = self._loading.get(username)
+        if future is None:
+            future = asyncio.ensure_future(self._load(username))
+            self._loading[username] = future
+            future.add_done_callback(lambda _: self._loading.pop(username, None))
+        user = await asyncio.shield(future)
+        self.miss_time += time.perf_counter() - started
+        return user
+
+    async def _load(self, username: str) -> Optional[UserModel]:
+        generation = self._generation
+        async with AsyncSessionLocal() as db:
+            user = (await db.execute(
+                select(UserModel).filter(UserModel.username == username)
+            )).scalar_one_or_none()
+        if user is None:
+            return None
+        user = _snapshot(user)
+        if self.ttl > 0 and generation == self._generation:
+            if len(self._entries) >= self.max_size:
+                self._evict()
+            self._entries[username] = (user, time.monotonic() + self.ttl)
+        return user
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [username for username, (_, expires) in self._entries.items() if expires <= now]
+        for username in expired:
+            del self._entries[username]
+        if len(self._entries) >= self.max_size:
+            # 没有过期条目时丢掉最早放入的（dict 保持插入顺序）
+            del self._entries[next(iter(self._entries))]
+
+    def invalidate(self, username: str):
+        """使本进程中该用户的缓存失效"""
+        self._generation += 1
+        self.invalidations += 1
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    async def commit_and_invalidate(self, db: AsyncSession, username: str):
+        """
+        提交对用户的修改并使缓存失效，修改用户信息的接口用它代替 db.commit()。
+        开启广播时在同一事务中发出 NOTIFY，提交成功后其他进程才会收到。
+        """
+        if settings.USER_CACHE_BROADCAST and db.bind.dialect.name == "postgresql":
+            await db.execute(select(func.pg_notify(CHANNEL, username)))
+        await db.commit()
+        self.invalidate(username)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.remote_invalidations += 1
+        self.invalidate(payload)
+
+    async def listen(self, reconnect_delay: float = 5.0):
+        """
+        在API进程中运行：占用一个数据库连接 LISTEN 失效频道，连接断开后重连。
+        断开期间可能错过通知，所以每次（重新）连上时清空本地缓存。
+        """
+        if engine.dialect.name != "postgresql":
+            logger.warning("用户缓存失效广播需要PostgreSQL，当前数据库为 %s，仅依赖过期时间", engine.dialect.name)
+            return
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    driver = raw.driver_connection
+                    await driver.add_listener(CHANNEL, self._on_notify)
+                    self.clear()
+                    self.listening = True
+                    try:
+                        while not driver.is_closed():
+                            await asyncio.sleep(reconnect_delay)
+                    finally:
+                        self.listening = False
+                        if not driver.is_closed():
+                            await driver.remove_listener(CHANNEL, self._on_notify)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("用户缓存失效广播连接失败，%s 秒后重连: %s", reconnect_delay, e)
+            await asyncio.sleep(reconnect_delay)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "broadcast": settings.USER_CACHE_BROADCAST,
+            "listening": self.listening,
+            "avg_hit_us": round(self.hit_time / self.hits * 1e6, 2) if self.hits else None,
+            "avg_miss_ms": round(self.miss_time / self.misses * 1e3, 3) if self.misses else None,
+        }
+
+
+user_cache = UserCache()
+register_metrics("user_cache", user_cache.stats)
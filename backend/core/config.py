@@ -1,8 +1,152 @@
 # 系统配置文件
+import os
+
 
 class Settings:
     PROJECT_NAME = "Multi-Agent 协作平台"
     VERSION = "0.1.0"
+
+    # LLM客户端池：按 (api_key, model) 复用客户端，所有客户端共享一个有界HTTP连接池
+    LLM_CLIENT_POOL_SIZE = int(os.getenv("LLM_CLIENT_POOL_SIZE", "64"))        # 最多缓存的客户端数
+    LLM_CLIENT_IDLE_TTL = float(os.getenv("LLM_CLIENT_IDLE_TTL", "600"))       # 客户端空闲多少秒后被回收
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30"))
+
+    # 单Agent响应缓存：内存LRU + 多worker共享的磁盘存储(SQLite)
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))               # 缓存有效期（秒）
+    RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "512"))
+    RESPONSE_CACHE_DISK_PATH = os.getenv("RESPONSE_CACHE_DISK_PATH", "backend/.cache/response_cache.sqlite3")
+    RESPONSE_CACHE_DISK_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+    RESPONSE_CACHE_REPLAY_CHUNK = int(os.getenv("RESPONSE_CACHE_REPLAY_CHUNK", "16"))   # 回放时每个分块的字符数
+
+    # 多Agent工作流：同时执行的阶段数上限
+    WORKFLOW_MAX_PARALLEL = int(os.getenv("WORKFLOW_MAX_PARALLEL", "3"))
+    # 审查/测试/文档是否在coder产出第一个完整代码块后就开始（流水线执行）。
+    # 开启后这些阶段更早结束，但只看到第一个代码块，coder之后写出的代码不会被审查、测试或写进文档；
+    # 默认关闭，等coder完整输出后再开始
+    WORKFLOW_PIPELINE_ARTIFACTS = os.getenv("WORKFLOW_PIPELINE_ARTIFACTS", "0") == "1"
+    # 工作流事件回放缓冲区：运行结束后保留多少秒，供断线客户端续传
+    WORKFLOW_REPLAY_TTL = float(os.getenv("WORKFLOW_REPLAY_TTL", "600"))
+    # 阻塞IO专用线程池大小（磁盘缓存等），与 asyncio 默认线程池隔离
+    BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "8"))
+    # 批量工作流：全局与每个用户同时执行的条目数上限，单批最多条目数
+    BATCH_GLOBAL_CONCURRENCY = int(os.getenv("BATCH_GLOBAL_CONCURRENCY", "8"))
+    BATCH_PER_USER_CONCURRENCY = int(os.getenv("BATCH_PER_USER_CONCURRENCY", "2"))
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    # 后台任务队列：每个worker进程同时执行的任务数、空闲时轮询间隔、心跳与失联判定
+    JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+    JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))        # 心跳超过该秒数未更新视为worker已失联
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # 任务事件批量写入job_events：最多攒多少条、最长等待多少秒
+    JOB_EVENT_BATCH_SIZE = int(os.getenv("JOB_EVENT_BATCH_SIZE", "50"))
+    JOB_EVENT_FLUSH_INTERVAL = float(os.getenv("JOB_EVENT_FLUSH_INTERVAL", "0.2"))
+    # 客户端断开检测：轮询间隔；工作流事件流无人订阅多少秒后取消运行（期间可断线续传）
+    DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+    WORKFLOW_DISCONNECT_GRACE = float(os.getenv("WORKFLOW_DISCONNECT_GRACE", "30"))
+    # 时间预算（秒）：单Agent请求、整个工作流；请求头 X-Request-Timeout 可以进一步收紧，最长不超过 REQUEST_TIMEOUT_MAX
+    AGENT_DEADLINE = float(os.getenv("AGENT_DEADLINE", "180"))
+    WORKFLOW_DEADLINE = float(os.getenv("WORKFLOW_DEADLINE", "900"))
+    REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "3600"))
+    # 各阶段最多可以使用工作流总预算的比例（并行阶段各自计算，总和可以超过1）
+    WORKFLOW_STAGE_BUDGETS = {
+        name.strip(): float(share)
+        for name, share in (
+            item.split(":") for item in os.getenv(
+                "WORKFLOW_STAGE_BUDGETS",
+                "requirement:0.15,coder:0.45,reviewer:0.25,test:0.25,doc:0.2,finalizer:0.35"
+            ).split(",") if item.strip()
+        )
+    }
+    # 可降级的阶段：剩余时间不足或超出预算时跳过，而不是让整个工作流失败
+    WORKFLOW_OPTIONAL_STAGES = tuple(
+        name.strip() for name in os.getenv("WORKFLOW_OPTIONAL_STAGES", "doc").split(",") if name.strip()
+    )
+    # 工作流中每个Agent输入的token预算，超出时压缩较旧的说明文字（代码原样保留）
+    CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+    CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "400"))   # 每段摘要的目标长度
+    # 模型路由：层级 -> 模型；路由表按角色和输入token数选择层级（见 services/model_router.py），请求可以覆盖
+    MODEL_TIERS = {
+        name.strip(): model.strip()
+        for name, model in (
+            item.split(":") for item in os.getenv(
+                "MODEL_TIERS", "fast:deepseek-chat,standard:deepseek-chat,strong:deepseek-reasoner"
+            ).split(",") if item.strip()
+        )
+    }
+    MODEL_DEFAULT_TIER = os.getenv("MODEL_DEFAULT_TIER", "standard")
+    MODEL_ROUTES = os.getenv(
+        "MODEL_ROUTES",
+        "requirement:fast,summarizer:fast,doc:fast,reviewer<2000:fast,reviewer:standard,"
+        "test:standard,coder:standard,finalizer:standard"
+    )
+    # 各模型每百万token的输入/输出单价（美元），用于按路由统计费用
+    MODEL_PRICES = {
+        name.strip(): tuple(float(price) for price in prices.split("/"))
+        for name, prices in (
+            item.split(":") for item in os.getenv(
+                "MODEL_PRICES", "deepseek-chat:0.27/1.10,deepseek-reasoner:0.55/2.19"
+            ).split(",") if item.strip()
+        )
+    }
+    # 消息写后队列：流式接口结束后消息入队由后台批量写入，不再占用请求的数据库连接
+    WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))   # 队列上限，满了之后入队等待
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05"))
+    WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+    WRITE_BEHIND_RETRY_BACKOFF = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF", "0.2"))   # 首次重试前等待的秒数，之后翻倍
+    WRITE_BEHIND_SHUTDOWN_TIMEOUT = float(os.getenv("WRITE_BEHIND_SHUTDOWN_TIMEOUT", "30"))
+    # 流式回答增量落库：攒够多少字符或多少秒写一个分块；多少秒没有新分块的 streaming 消息视为生成进程已退出
+    MESSAGE_CHUNK_FLUSH_CHARS = int(os.getenv("MESSAGE_CHUNK_FLUSH_CHARS", "2000"))
+    MESSAGE_CHUNK_FLUSH_INTERVAL = float(os.getenv("MESSAGE_CHUNK_FLUSH_INTERVAL", "1.0"))
+    MESSAGE_CHUNK_STALE_AFTER = float(os.getenv("MESSAGE_CHUNK_STALE_AFTER", "600"))
+    # 流式响应合并：按接口配置 "接口:字节数/秒数"，攒够字节数或超过等待时间才发送一次，* 为默认值，0/0 表示逐个发送
+    # 接口名为单Agent名称（coder、doc 等）、workflow、jobs
+    STREAM_COALESCE = {
+        name.strip(): (int(limits.split("/")[0]), float(limits.split("/")[1]))
+        for name, limits in (
+            item.split(":") for item in os.getenv("STREAM_COALESCE", "*:256/0.05").split(",") if item.strip()
+        )
+    }
+    # 允许按 gzip 压缩输出的接口（客户端需声明 Accept-Encoding: gzip），* 表示全部
+    STREAM_GZIP = tuple(name.strip() for name in os.getenv("STREAM_GZIP", "").split(",") if name.strip())
+    STREAM_GZIP_LEVEL = int(os.getenv("STREAM_GZIP_LEVEL", "6"))
+    # 鉴权用户缓存：缓存秒数（0 表示不缓存）、最多缓存的用户数；
+    # 多个worker进程时开启广播（需要PostgreSQL），用户信息修改后通过 LISTEN/NOTIFY 通知所有进程失效
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+    USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+    USER_CACHE_BROADCAST = os.getenv("USER_CACHE_BROADCAST", "0") == "1"
+    # 准入控制：每个用户与全局的请求速率（令牌桶，每秒补充的请求数/最多积攒的突发请求数，速率为0表示不限）
+    ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "0.5"))
+    ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "5"))
+    ADMISSION_GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", "20"))
+    ADMISSION_GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST", "50"))
+    # 每个进程同时进行的模型调用数：初始值与上下限，模型服务返回429时乘以 LLM_CONCURRENCY_DECREASE
+    # （LLM_CONCURRENCY_COOLDOWN 秒内只降一次），之后逐步加回；超出的调用排队，最多 LLM_QUEUE_MAX 个
+    LLM_CONCURRENCY_INITIAL = int(os.getenv("LLM_CONCURRENCY_INITIAL", "16"))
+    LLM_CONCURRENCY_MIN = int(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+    LLM_CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", "64"))
+    LLM_CONCURRENCY_DECREASE = float(os.getenv("LLM_CONCURRENCY_DECREASE", "0.5"))
+    LLM_CONCURRENCY_COOLDOWN = float(os.getenv("LLM_CONCURRENCY_COOLDOWN", "5"))
+    LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "200"))
+    # 消息全文搜索：PostgreSQL 的文本搜索配置（须与迁移时生成 messages.content_tsv 所用的一致）、单页最多结果数
+    SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "simple")
+    SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "50"))
+    # 消息正文压缩（仅 PostgreSQL）：编码 zstd / zlib / none（未安装 zstandard 时 zstd 退回 zlib）、
+    # 超过多少字节才压缩、压缩级别；压缩后不小于原来的 MESSAGE_COMPRESSION_MAX_RATIO 时按原文保存
+    MESSAGE_COMPRESSION = os.getenv("MESSAGE_COMPRESSION", "zstd")
+    MESSAGE_COMPRESSION_MIN_BYTES = int(os.getenv("MESSAGE_COMPRESSION_MIN_BYTES", "4096"))
+    MESSAGE_COMPRESSION_LEVEL = int(os.getenv("MESSAGE_COMPRESSION_LEVEL", "3"))
+    MESSAGE_COMPRESSION_MAX_RATIO = float(os.getenv("MESSAGE_COMPRESSION_MAX_RATIO", "0.9"))
+    # 正文去重（仅 PostgreSQL）：超过多少字节的正文按内容哈希存入 message_blobs（0 表示不去重）；
+    # 无引用正文的垃圾回收间隔（秒）与每批删除的行数
+    MESSAGE_BLOB_MIN_BYTES = int(os.getenv("MESSAGE_BLOB_MIN_BYTES", "1024"))
+    MESSAGE_BLOB_GC_INTERVAL = float(os.getenv("MESSAGE_BLOB_GC_INTERVAL", "3600"))
+    MESSAGE_BLOB_GC_BATCH = int(os.getenv("MESSAGE_BLOB_GC_BATCH", "1000"))
     # 可扩展更多配置
 
 settings = Settings()
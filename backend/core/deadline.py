@@ -0,0 +1,105 @@
+# 请求级截止时间：通过 contextvars 从HTTP层一路传到工作流阶段、LLM客户端和MCP调用。
+# asyncio.create_task 会复制当前上下文，后台任务和各阶段任务自动继承创建时的截止时间。
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 流式输出因超过截止时间被截断时追加的提示
+DEADLINE_NOTICE = "\n\n[已超过时间限制，输出被截断]"
+
+# 截止时间（time.monotonic() 的绝对值），None 表示不限
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """已超过截止时间"""
+
+
+def remaining() -> Optional[float]:
+    """距截止时间的剩余秒数（可能为负），没有截止时间时返回 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("已超过截止时间")
+
+
+def clamp_timeout(timeout: Optional[float]) -> Optional[float]:
+    """取 timeout 与剩余时间中较小者，两者都没有时返回 None"""
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(0.0, left)
+    return left if timeout is None else min(timeout, left)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    在当前上下文中设置 seconds 秒后的截止时间，只会收紧、不会放宽外层已有的截止时间。
+    seconds 为空或不大于0时不做改变。返回本作用域的剩余秒数。
+    """
+    if not seconds or seconds <= 0:
+        yield remaining()
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline - time.monotonic()
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            # 异步生成器在别的上下文中被关闭时无法reset，恢复外层的值即可
+            _deadline.set(current)
+
+
+async def wait_within_deadline(awaitable: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """等待 awaitable，最长不超过 timeout 与剩余时间中较小者，超时抛出 DeadlineExceeded"""
+    limit = clamp_timeout(timeout)
+    if limit is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, limit)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"等待超过 {limit:.1f}s")
+
+
+class DeadlineMiddleware:
+    """
+    ASGI中间件：客户端可以用请求头 X-Request-Timeout（秒）声明本请求的时间预算，
+    设为整个请求（包括流式响应和由它启动的后台运行）的截止时间，最长不超过 max_seconds。
+    """
+    def __init__(self, app, max_seconds: Optional[float] = None, header: bytes = b"x-request-timeout"):
+        self.app = app
+        self.max_seconds = max_seconds
+        self.header = header
+
+    def _budget(self, scope) -> Optional[float]:
+        for name, value in scope.get("headers", []):
+            if name == self.header:
+                try:
+                    seconds = float(value.decode())
+                except ValueError:
+                    return None
+                if self.max_seconds:
+                    seconds = min(seconds, self.max_seconds)
+                return seconds
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with deadline_scope(self._budget(scope)):
+            await self.app(scope, receive, send)
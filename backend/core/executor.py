@@ -0,0 +1,38 @@
+# 阻塞IO专用线程池：磁盘缓存等短小的阻塞操作放在这里执行，
+# 不占用 asyncio 默认线程池，也不会被其他长时间占用线程的任务挤占
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import settings
+from .metrics import register_metrics
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io"
+)
+_stats = {"submitted": 0, "running": 0}
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在阻塞IO线程池中执行 func(*args, **kwargs) 并等待结果"""
+    loop = asyncio.get_running_loop()
+    _stats["submitted"] += 1
+
+    def call():
+        _stats["running"] += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _stats["running"] -= 1
+
+    return await loop.run_in_executor(_executor, call)
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+register_metrics("blocking_io", lambda: {
+    "max_workers": settings.BLOCKING_IO_WORKERS,
+    "submitted": _stats["submitted"],
+    "running": _stats["running"],
+})
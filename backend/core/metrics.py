@@ -0,0 +1,20 @@
+# 进程内指标注册表：各模块注册一个返回dict的回调，由 /metrics/ 接口统一导出
+from typing import Callable, Dict
+
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], dict]):
+    """注册一组指标，name 重复时覆盖旧的回调"""
+    _providers[name] = provider
+
+
+def collect_metrics() -> dict:
+    """汇总所有已注册的指标，单个回调出错不影响其他指标"""
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
@@ -1,15 +1,16 @@
 from backend.auth.process_token import decode_access_token
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from backend.auth.user_cache import user_cache
 from fastapi import Depends, HTTPException
-from .database import get_db, oauth2_scheme
-from backend.models.user import User as UserModel
+from .database import oauth2_scheme
 
-async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    """
+    按token中的用户名取当前用户，优先读进程内缓存（见 auth/user_cache.py），命中时不占用数据库连接。
+    返回的 User 对象不属于请求的数据库会话，只读。
+    """
     payload = decode_access_token(token)
     username = payload.get("sub")
-    result = await db.execute(select(UserModel).filter(UserModel.username == username))
-    user = result.scalar_one_or_none()
+    user = await user_cache.get_user(username) if username else None
     if not user:
         raise HTTPException(status_code=401, detail="无效token")
-    return user
\ No newline at end of file
+    return user
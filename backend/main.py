@@ -1,8 +1,17 @@
+import asyncio
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from .api import router as api_router
+from .services.client_pool import model_client_pool
+from .services.write_behind import message_writer
+from .services.chunk_store import run_stale_compactor
+from .services.blob_store import run_blob_gc
+from .auth.user_cache import user_cache
+from .core.executor import shutdown_executor
+from .core.deadline import DeadlineMiddleware
+from .core.config import settings
 from dotenv import load_dotenv
 
 app = FastAPI(title="Multi-Agent 协作平台")
@@ -16,9 +25,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求头 X-Request-Timeout 声明的时间预算作为整个请求的截止时间
+app.add_middleware(DeadlineMiddleware, max_seconds=settings.REQUEST_TIMEOUT_MAX)
+
 # 注册API路由
 app.include_router(api_router)
 
+# 后台任务，保留引用防止被垃圾回收
+_background_tasks = set()
+
+@app.on_event("startup")
+async def startup_event():
+    # 定期把生成进程已退出的 streaming 消息合并为部分回答
+    task = asyncio.create_task(run_stale_compactor())
+    _background_tasks.add(task)
+    # 定期回收没有消息引用的正文（message_blobs）
+    _background_tasks.add(asyncio.create_task(run_blob_gc()))
+    # 多进程部署时监听用户缓存失效广播
+    if settings.USER_CACHE_BROADCAST:
+        _background_tasks.add(asyncio.create_task(user_cache.listen()))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 写完写后队列中剩余的消息
+    await message_writer.aclose()
+    for task in _background_tasks:
+        task.cancel()
+    # 关闭池中所有LLM客户端及共享的HTTP连接池
+    await model_client_pool.aclose()
+    shutdown_executor()
+
 dotenv_path = 'backend/.env'
 print('dotenv_path:',dotenv_path)
 load_dotenv(dotenv_path)
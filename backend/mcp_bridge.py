@@ -12,12 +12,15 @@ import uuid
 import subprocess
 import asyncio
 import signal
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import logging
 import shutil
 import pathlib
 
+from .core.deadline import clamp_timeout, DeadlineExceeded
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp-bridge")
@@ -36,6 +39,21 @@ RISK_LEVEL_DESCRIPTION = {
     RISK_LEVEL["HIGH"]: "High risk - Docker execution required"
 }
 
+# Each server has one stdout and one stderr reader that block for the lifetime of
+# the server, so readers get their own thread pool instead of pinning (or being starved by)
+# threads from asyncio's default executor
+reader_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MCP_READER_THREADS", "32")),
+    thread_name_prefix="mcp-reader"
+)
+
+async def read_line(stream):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(reader_executor, stream.readline)
+
+# Upper bound for a single MCP request; a shorter request deadline takes precedence
+MCP_REQUEST_TIMEOUT = float(os.getenv("MCP_REQUEST_TIMEOUT", "10"))
+
 # Server state management
 server_processes: Dict[str, Dict] = {}
 pending_confirmations: Dict[str, Dict] = {}
@@ -286,22 +304,43 @@ async def start_server(server_id: str, config: Dict[str, Any]):
         'process': process,
         'risk_level': risk_level,
         'pid': process.pid,
-        'config': config
+        'config': config,
+        'pending': {}
     }
 
-    # Set up initialization handler
-    async def initialization_handler():
+    # Responses are routed to the waiting request by JSON-RPC id
+    pending: Dict[Any, asyncio.Future] = server_processes[server_id]['pending']
+
+    def complete_initialization():
+        logger.info(f"Server {server_id} initialization completed successfully")
+
+        # Mark server as initialized
+        server_initialization_state[server_id] = 'initialized'
+
+        # Send initialized notification to complete the handshake
+        initialized_notification = {
+            'jsonrpc': '2.0',
+            'method': 'notifications/initialized'
+        }
+
         try:
-            # Wait for initialization response with timeout
-            start_time = datetime.now()
-            while (datetime.now() - start_time) < timedelta(seconds=30):
-                if process.stdout.closed:
-                    break
+            process.stdin.write(json.dumps(initialized_notification) + '\n')
+            process.stdin.flush()
+            logger.info(f"Sent initialized notification to {server_id}")
+        except Exception as e:
+            logger.error(f"Error during initialization of {server_id}: {str(e)}")
+            server_initialization_state[server_id] = 'error'
+            process.terminate()
 
-                line = await asyncio.to_thread(process.stdout.readline)
+    # The only reader of stdout for the lifetime of the server. A request that times
+    # out just stops waiting for its id; no read is left behind to swallow the next
+    # response, and a late response is logged and dropped
+    async def output_handler():
+        try:
+            while True:
+                line = await read_line(process.stdout)
                 if not line:
-                    await asyncio.sleep(0.1)
-                    continue
+                    break  # EOF: the process exited or closed stdout
 
                 line = line.strip()
                 if not line:
@@ -309,56 +348,47 @@ async def start_server(server_id: str, config: Dict[str, Any]):
 
                 try:
                     response = json.loads(line)
-                    # Check if this is the initialize response
-                    if response.get('id') == 1 and response.get('result') and response['result'].get('protocolVersion'):
-                        logger.info(f"Server {server_id} initialization completed successfully")
-
-                        # Mark server as initialized
-                        server_initialization_state[server_id] = 'initialized'
-
-                        # Send initialized notification to complete the handshake
-                        initialized_notification = {
-                            'jsonrpc': '2.0',
-                            'method': 'notifications/initialized'
-                        }
-
-                        process.stdin.write(json.dumps(initialized_notification) + '\n')
-                        process.stdin.flush()
-                        logger.info(f"Sent initialized notification to {server_id}")
-
-                        # Set up regular output handler
-                        async def output_handler():
-                            while not process.stdout.closed:
-                                line = await asyncio.to_thread(process.stdout.readline)
-                                if line:
-                                    logger.info(f"[{server_id}] STDOUT: {line.strip()}")
-
-                        async def error_handler():
-                            while not process.stderr.closed:
-                                line = await asyncio.to_thread(process.stderr.readline)
-                                if line:
-                                    logger.error(f"[{server_id}] STDERR: {line.strip()}")
-
-                        asyncio.create_task(output_handler())
-                        asyncio.create_task(error_handler())
-                        return
                 except json.JSONDecodeError:
-                    # Ignore JSON parsing errors during initialization
+                    logger.info(f"[{server_id}] STDOUT: {line}")
                     continue
 
-            # If we get here, initialization timed out
+                response_id = response.get('id') if isinstance(response, dict) else None
+                future = pending.pop(response_id, None) if isinstance(response_id, (str, int)) else None
+                if future is not None:
+                    if not future.done():
+                        future.set_result(response)
+                elif (server_initialization_state.get(server_id) == 'starting' and response_id == 1
+                        and isinstance(response.get('result'), dict) and response['result'].get('protocolVersion')):
+                    # Check if this is the initialize response
+                    complete_initialization()
+                else:
+                    logger.info(f"[{server_id}] STDOUT: {line}")
+        except Exception as e:
+            logger.error(f"Error reading output of {server_id}: {str(e)}")
+        finally:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(Exception(f"Server {server_id} closed its output"))
+            pending.clear()
+
+    async def error_handler():
+        while True:
+            line = await read_line(process.stderr)
+            if not line:
+                break
+            logger.error(f"[{server_id}] STDERR: {line.strip()}")
+
+    # Wait for initialization response with timeout
+    async def initialization_timeout():
+        await asyncio.sleep(30)
+        if server_initialization_state.get(server_id) == 'starting':
             logger.error(f"Server {server_id} initialization timed out")
             server_initialization_state[server_id] = 'timeout'
             process.terminate()
-            raise Exception(f"Server {server_id} initialization timed out")
-        except Exception as e:
-            logger.error(f"Error during initialization of {server_id}: {str(e)}")
-            server_initialization_state[server_id] = 'error'
-            process.terminate()
-            raise
 
-    # Start initialization handler
-    asyncio.create_task(initialization_handler())
+    asyncio.create_task(output_handler())
+    asyncio.create_task(error_handler())
+    asyncio.create_task(initialization_timeout())
 
     # Set up process monitoring
     async def monitor_process():
@@ -459,57 +489,47 @@ async def send_mcp_request(server_id: str, method: str, params: Dict[str, Any] =
 
     logger.info(f"Sending request to {server_id}: {method} {json.dumps(params)}")
 
-    # Send request
+    # Register before sending so the reader cannot see the response first
+    response_future = asyncio.get_running_loop().create_future()
+    pending = server_info['pending']
+    pending[request_id] = response_future
     try:
-        process.stdin.write(json.dumps(request) + '\n')
-        process.stdin.flush()
-    except Exception as e:
-        logger.error(f"Failed to send request to {server_id}: {str(e)}")
-        raise
-
-    # Wait for response with timeout
-    start_time = datetime.now()
-    while (datetime.now() - start_time) < timedelta(seconds=10):
-        if process.stdout.closed:
-            break
-
-        # 使用 asyncio.to_thread 异步调用 process.stdout.readline() 方法，
-        # 从子进程的标准输出中读取一行内容。此操作会阻塞直到读取到一行内容或流关闭，
-        # 为了避免阻塞异步事件循环，使用 to_thread 方法将其放到单独的线程中执行。
-        line = await asyncio.to_thread(process.stdout.readline)
-        if not line:
-            await asyncio.sleep(0.1)
-            continue
-
-        line = line.strip()
-        if not line:
-            continue
+        # Send request
+        try:
+            process.stdin.write(json.dumps(request) + '\n')
+            process.stdin.flush()
+        except Exception as e:
+            logger.error(f"Failed to send request to {server_id}: {str(e)}")
+            raise
 
+        # Wait for response with timeout, bounded by the caller's deadline (see core.deadline).
+        # Only this wait is cancelled on timeout; the server's reader keeps running
+        timeout = clamp_timeout(MCP_REQUEST_TIMEOUT)
         try:
-            response = json.loads(line)
-            if response.get('id') == request_id:
-                logger.info(f"Received response from {server_id} for request {request_id}")
-                if 'error' in response:
-                    raise Exception(response['error'].get('message', 'Unknown error'))
-
-                # For high risk level, add information about docker execution
-                if risk_level is not None and risk_level == RISK_LEVEL["HIGH"]:
-                    result = response.get('result', {})
-                    return {
-                        **result,
-                        'execution_environment': {
-                            'risk_level': risk_level,
-                            'risk_description': RISK_LEVEL_DESCRIPTION[risk_level],
-                            'docker': True,
-                            'docker_image': config.get('docker', {}).get('image', 'unknown')
-                        }
-                    }
-
-                return response.get('result', {})
-        except json.JSONDecodeError:
-            continue
-
-    raise Exception(f"Request to {server_id} timed out")
+            response = await asyncio.wait_for(response_future, max(timeout, 0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Request to {server_id} timed out after {timeout:.1f}s")
+    finally:
+        pending.pop(request_id, None)
+
+    logger.info(f"Received response from {server_id} for request {request_id}")
+    if 'error' in response:
+        raise Exception(response['error'].get('message', 'Unknown error'))
+
+    # For high risk level, add information about docker execution
+    if risk_level is not None and risk_level == RISK_LEVEL["HIGH"]:
+        result = response.get('result', {})
+        return {
+            **result,
+            'execution_environment': {
+                'risk_level': risk_level,
+                'risk_description': RISK_LEVEL_DESCRIPTION[risk_level],
+                'docker': True,
+                'docker_image': config.get('docker', {}).get('image', 'unknown')
+            }
+        }
+
+    return response.get('result', {})
 
 # API Routes
 @app.on_event("startup")
@@ -15,6 +15,7 @@ from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
 import logging
 
+from .core.deadline import DeadlineMiddleware
 from .mcp_bridge import (
     load_server_config, init_servers, shutdown_server, send_mcp_request,
     server_processes, server_initialization_state, pending_confirmations
@@ -36,6 +37,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Honour the client's X-Request-Timeout header as a deadline for MCP calls
+app.add_middleware(DeadlineMiddleware)
+
 # Pydantic models for request/response
 base_model_config = {
     "json_schema_extra": {
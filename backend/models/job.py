@@ -0,0 +1,40 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, UniqueConstraint, func
+from ..core.database import Base
+
+class Job(Base):
+    __tablename__ = "jobs"
+    job_id = Column(String(32), primary_key=True)                 # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.session_id"), nullable=True)
+    kind = Column(String(30), nullable=False)                     # 'workflow' 或单Agent名称
+    payload = Column(Text, nullable=False)                        # 请求参数，JSON
+    status = Column(String(20), nullable=False, default="queued")  # queued / running / completed / failed
+    result = Column(Text, nullable=True)                          # 执行结果，JSON
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    worker_id = Column(String(64), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # worker按创建顺序领取排队中的任务
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
+
+
+class JobEvent(Base):
+    __tablename__ = "job_events"
+    event_id = Column(Integer, primary_key=True)
+    job_id = Column(String(32), ForeignKey("jobs.job_id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)           # 任务内递增的事件序号，即SSE的id
+    type = Column(String(30), nullable=False)
+    stage = Column(String(50), nullable=True)
+    data = Column(Text, nullable=True)              # 事件附加字段，JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("job_id", "seq", name="uq_job_events_job_seq"),
+    )
@@ -1,10 +1,66 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Text, LargeBinary, DateTime, ForeignKey, Index, UniqueConstraint, func, text
 from ..core.database import Base
 
 class Message(Base):
     __tablename__ = "messages"
-    message_id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("sessions.session_id"), nullable=False, index=True)
+    message_id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey("sessions.session_id"), nullable=False)
     role = Column(String(20), nullable=False)  # 'user' 或 'assistant'
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
\ No newline at end of file
+    # 较长的正文压缩保存在 content_blob 中，codec 为压缩编码（zstd / zlib），此时 content 为空；
+    # codec 为空时 content 即原文。读写统一经过 services/message_codec.py
+    codec = Column(String(16), nullable=True)
+    content_blob = Column(LargeBinary, nullable=True)
+    # 超过 MESSAGE_BLOB_MIN_BYTES 的正文按内容哈希保存在 message_blobs 中，相同的正文只存一份，此时 content 为空
+    blob_hash = Column(LargeBinary, ForeignKey("message_blobs.hash"), nullable=True)
+    # complete: 内容完整；streaming: 正在生成，已生成的部分在 message_chunks 中；partial: 生成中断，只有部分内容
+    status = Column(String(20), nullable=False, default="complete", server_default="complete")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # 全文搜索索引不在模型中声明：PostgreSQL 上为触发器维护的 content_tsv 列（GIN索引），SQLite 上为 FTS5 表 messages_fts，
+    # 均由迁移创建，见 services/message_search.py
+
+    __table_args__ = (
+        # 会话内的消息按顺序读取与分页（ORDER BY message_id）
+        Index("ix_messages_session_id_message_id", "session_id", "message_id"),
+        # 只索引正在生成的消息，过期分块清理不必扫描整张表
+        Index(
+            "ix_messages_streaming", "message_id",
+            postgresql_where=text("status = 'streaming'"), sqlite_where=text("status = 'streaming'")
+        ),
+        # 垃圾回收与引用计数校验按 blob_hash 查找引用它的消息
+        Index("ix_messages_blob_hash", "blob_hash", postgresql_where=text("blob_hash IS NOT NULL")),
+    )
+
+
+class MessageChunk(Base):
+    """流式回答的追加写分块，生成结束后合并进 messages.content 并删除"""
+    __tablename__ = "message_chunks"
+    chunk_id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, ForeignKey("messages.message_id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)        # 消息内从1开始的序号
+    content = Column(Text, nullable=False)
+    # 较长的正文压缩保存在 content_blob 中，codec 为压缩编码（zstd / zlib），此时 content 为空；
+    # codec 为空时 content 即原文。读写统一经过 services/message_codec.py
+    codec = Column(String(16), nullable=True)
+    content_blob = Column(LargeBinary, nullable=True)
+    # 超过 MESSAGE_BLOB_MIN_BYTES 的正文按内容哈希保存在 message_blobs 中，相同的正文只存一份，此时 content 为空
+    blob_hash = Column(LargeBinary, ForeignKey("message_blobs.hash"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("message_id", "seq", name="uq_message_chunks_message_seq"),
+    )
+
+
+class MessageBlob(Base):
+    """
+    按内容寻址的消息正文：hash 为原文的 SHA-256，同一段正文（如先后提交给多个Agent的同一份代码）只保存一份。
+    refcount 为引用它的消息数，由数据库触发器随 messages 的写入和删除维护，为0的行由垃圾回收删除。
+    """
+    __tablename__ = "message_blobs"
+    hash = Column(LargeBinary(32), primary_key=True)
+    size = Column(Integer, nullable=False)                # 原文的字节数
+    codec = Column(String(16), nullable=True)             # 为空时 data 是UTF-8原文，否则为压缩后的数据
+    data = Column(LargeBinary, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
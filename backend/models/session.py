@@ -1,11 +1,16 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, func
 from ..core.database import Base
 
 class Session(Base):
     __tablename__ = "sessions"
-    session_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     session_name = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_activity = Column(DateTime(timezone=True), server_default=func.now())
-    is_active = Column(Boolean, default=True) 
\ No newline at end of file
+    is_active = Column(Boolean, default=True)
+
+    __table_args__ = (
+        # 历史记录按用户分页（ORDER BY session_id DESC）：索引中带上会话名，PostgreSQL 上可以只扫描索引
+        Index("ix_sessions_user_id_session_id", "user_id", "session_id", postgresql_include=["session_name"]),
+    )
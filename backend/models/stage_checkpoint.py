@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, UniqueConstraint, func
+from ..core.database import Base
+
+class StageCheckpoint(Base):
+    __tablename__ = "stage_checkpoints"
+    checkpoint_id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.session_id"), nullable=False, index=True)
+    stage = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False)  # completed / failed / cancelled / skipped
+    inputs = Column(Text, nullable=True)         # 阶段输入，JSON: {依赖阶段名: 输出}
+    output = Column(Text, nullable=False, default="")
+    error = Column(Text, nullable=True)
+    duration = Column(Float, nullable=True)      # 阶段耗时（秒）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("session_id", "stage", name="uq_stage_checkpoints_session_stage"),
+    )
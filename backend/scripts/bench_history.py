@@ -0,0 +1,294 @@
+"""
+历史记录查询的性能基准与查询计划回归检查（PostgreSQL）。
+
+用法：
+    python -m backend.scripts.bench_history --seed --users 2000 --sessions-per-user 50 --messages-per-session 20
+    python -m backend.scripts.bench_history --iterations 200 -o report.json --baseline last_report.json
+
+--seed 在独立的 schema（默认 bench_history）中按 public 下的表结构（LIKE ... INCLUDING ALL，包括迁移建立的索引）
+重建 users / sessions / messages / message_chunks 并写入测试数据，默认约10万个会话、200万条消息；不加 --seed 时复用已有数据。
+请在 alembic upgrade head 之后运行，数据和查询都不会触及 public 下的业务数据。
+
+每个历史查询调用接口函数本身执行 --iterations 次（随机用户），统计 p50 / p95 / 最大延迟；
+再对接口发出的每条SQL执行一次 EXPLAIN (ANALYZE, BUFFERS)，记录用到的索引和读取的页数。
+查询计划中对 sessions / messages 出现顺序扫描、p95 超过 --max-p95-ms，或比 --baseline 报告慢 --tolerance 倍以上时，
+以退出码1结束，可以放进CI或发布前检查。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+from fastapi import Response
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from backend.core.database import SQLALCHEMY_DATABASE_URL
+from backend.models.user import User
+from backend.api.messages import list_user_messages, list_session_messages, read_message, search_user_messages
+from backend.api.workflow_api import get_owned_session
+
+TABLES = ("users", "sessions", "messages", "message_chunks")
+# 这些表出现在顺序扫描节点中视为回归
+HISTORY_TABLES = ("sessions", "messages")
+
+
+async def seed(engine, schema: str, users: int, sessions_per_user: int, messages_per_session: int, batch: int):
+    total_sessions = users * sessions_per_user
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {schema}"))
+        for table in TABLES:
+            await conn.execute(text(f"CREATE TABLE {schema}.{table} (LIKE public.{table} INCLUDING ALL)"))
+        # LIKE 不复制触发器：全文索引列由触发器维护时（迁移 f4b8d2a6c0e3 之后）同样装上
+        if (await conn.execute(text("SELECT to_regprocedure('public.messages_index_content()')"))).scalar_one():
+            await conn.execute(text(
+                f"CREATE TRIGGER messages_index_content BEFORE INSERT OR UPDATE OF content, codec ON {schema}.messages "
+                "FOR EACH ROW EXECUTE FUNCTION public.messages_index_content()"
+            ))
+        await conn.execute(text(f"CREATE TABLE {schema}.bench_meta (users int, sessions_per_user int, messages_per_session int)"))
+        await conn.execute(
+            text(f"INSERT INTO {schema}.bench_meta VALUES (:users, :spu, :mps)"),
+            {"users": users, "spu": sessions_per_user, "mps": messages_per_session},
+        )
+        await conn.execute(text(
+            f"INSERT INTO {schema}.users (id, username, password, email, is_active, created_at) "
+            "SELECT g, 'bench' || g, 'x', 'bench' || g || '@example.com', true, now() FROM generate_series(1, :users) g"
+        ), {"users": users})
+
+    # 会话按用户轮流写入（同一用户的会话分散在整张表中，与真实写入顺序一致）；每批一个事务
+    started = time.perf_counter()
+    for first in range(1, total_sessions + 1, batch):
+        last = min(first + batch - 1, total_sessions)
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                f"INSERT INTO {schema}.sessions (session_id, user_id, session_name, created_at, last_activity, is_active) "
+                "SELECT g, 1 + (g - 1) % :users, 'bench session ' || g, "
+                "now() - (:total - g) * interval '1 second', now(), true FROM generate_series(:first, :last) g"
+            ), {"users": users, "total": total_sessions, "first": first, "last": last})
+            # 正文为长度不等的md5串（32字节到约1.3KB），用户消息与回答交替；每1000个会话有一条正在生成的回答
+            await conn.execute(text(
+                f"INSERT INTO {schema}.messages (message_id, session_id, role, content, status, created_at) "
+                "SELECT (s - 1) * :mps + k, s, CASE WHEN k % 2 = 1 THEN 'user' ELSE 'assistant' END, "
+                "repeat(md5((s * k)::text) || ' ', 1 + (s * k) % 40), "
+                "CASE WHEN s % 1000 = 0 AND k = :mps THEN 'streaming' ELSE 'complete' END, "
+                "now() - (:total - s) * interval '1 second' "
+                "FROM generate_series(:first, :last) s, generate_series(1, :mps) k"
+            ), {"mps": messages_per_session, "total": total_sessions, "first": first, "last": last})
+        done = last * messages_per_session
+        print(f"已写入 {last}/{total_sessions} 个会话，{done} 条消息（{time.perf_counter() - started:.0f}s）", file=sys.stderr)
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in TABLES:
+            await conn.execute(text(f"VACUUM ANALYZE {schema}.{table}"))
+
+
+async def load_meta(engine, schema: str) -> Dict[str, int]:
+    async with engine.connect() as conn:
+        row = (await conn.execute(text(f"SELECT * FROM {schema}.bench_meta"))).one()
+    return {"users": row.users, "sessions_per_user": row.sessions_per_user, "messages_per_session": row.messages_per_session}
+
+
+def build_queries(meta: Dict[str, int], has_search: bool) -> Dict[str, Callable]:
+    """各历史查询：接收数据库会话和随机数发生器，调用对应的接口函数"""
+    users, spu, mps = meta["users"], meta["sessions_per_user"], meta["messages_per_session"]
+
+    def pick_user(rng) -> User:
+        return User(id=rng.randint(1, users), username="bench")
+
+    def pick_session(rng, user: User) -> int:
+        return user.id + users * rng.randrange(spu)
+
+    async def history_first_page(db, rng):
+        await list_user_messages(Response(), 10, None, 50, 0, db, pick_user(rng))
+
+    async def history_deep_page(db, rng):
+        user = pick_user(rng)
+        await list_user_messages(Response(), 10, pick_session(rng, user), 50, 0, db, user)
+
+    async def history_preview_page(db, rng):
+        await list_user_messages(Response(), 10, None, 50, 200, db, pick_user(rng))
+
+    async def session_messages(db, rng):
+        user = pick_user(rng)
+        await list_session_messages(pick_session(rng, user), Response(), None, 50, 0, db, user)
+
+    async def single_message(db, rng):
+        user = pick_user(rng)
+        session_id = pick_session(rng, user)
+        await read_message((session_id - 1) * mps + rng.randint(1, mps), db, user)
+
+    async def owned_session(db, rng):
+        user = pick_user(rng)
+        await get_owned_session(db, pick_session(rng, user), user)
+
+    async def search(db, rng):
+        user = pick_user(rng)
+        session_id = pick_session(rng, user)
+        term = hashlib.md5(str(session_id * rng.randint(1, mps)).encode()).hexdigest()
+        await search_user_messages(term, 20, 0, None, None, db, user)
+
+    queries = {
+        "history_first_page": history_first_page,
+        "history_deep_page": history_deep_page,
+        "history_preview_page": history_preview_page,
+        "session_messages": session_messages,
+        "single_message": single_message,
+        "owned_session": owned_session,
+    }
+    if has_search:
+        queries["search"] = search
+    return queries
+
+
+def summarize_plan(plan: dict) -> dict:
+    """从 EXPLAIN (FORMAT JSON) 的结果中取出扫描方式、用到的索引、读取的页数和执行时间"""
+    scans, indexes = [], set()
+
+    def walk(node: dict):
+        relation = node.get("Relation Name")
+        if relation:
+            scans.append(f"{node['Node Type']} on {relation}")
+        if node.get("Index Name"):
+            indexes.add(node["Index Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    root = plan["Plan"]
+    walk(root)
+    return {
+        "scans": scans,
+        "indexes": sorted(indexes),
+        "seq_scans": [scan for scan in scans if scan.startswith("Seq Scan") and scan.split(" on ")[1] in HISTORY_TABLES],
+        "shared_hit": root.get("Shared Hit Blocks", 0),
+        "shared_read": root.get("Shared Read Blocks", 0),
+        "execution_ms": plan.get("Execution Time"),
+    }
+
+
+async def explain(engine, factory, query: Callable, rng) -> List[dict]:
+    """执行一次查询并记录它发出的SQL，再逐条 EXPLAIN ANALYZE"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with factory() as db:
+            await query(db, rng)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    plans = []
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters)
+            plan = result.scalar_one()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            plans.append({"sql": " ".join(statement.split()), **summarize_plan(plan[0])})
+    return plans
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+
+async def run(args):
+    engine = create_async_engine(
+        args.database_url, pool_size=1, max_overflow=0,
+        connect_args={"server_settings": {"search_path": args.schema}},
+    )
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        if args.seed:
+            await seed(engine, args.schema, args.users, args.sessions_per_user, args.messages_per_session, args.batch)
+        meta = await load_meta(engine, args.schema)
+        async with engine.connect() as conn:
+            has_search = (await conn.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = :schema AND table_name = 'messages' AND column_name = 'content_tsv'"
+            ), {"schema": args.schema})).first() is not None
+            counts = {
+                table: (await conn.execute(text(f"SELECT count(*) FROM {table}"))).scalar_one()
+                for table in ("sessions", "messages")
+            }
+        print(f"数据量: {counts}", file=sys.stderr)
+
+        rng = random.Random(args.random_seed)
+        report = {"schema": args.schema, "rows": counts, "iterations": args.iterations, "queries": {}}
+        for name, query in build_queries(meta, has_search).items():
+            if args.only and name not in args.only:
+                continue
+            async with factory() as db:
+                for _ in range(args.warmup):
+                    await query(db, rng)
+                latencies = []
+                for _ in range(args.iterations):
+                    started = time.perf_counter()
+                    await query(db, rng)
+                    latencies.append((time.perf_counter() - started) * 1000)
+            ordered = sorted(latencies)
+            report["queries"][name] = {
+                "p50_ms": percentile(ordered, 0.5),
+                "p95_ms": percentile(ordered, 0.95),
+                "max_ms": round(ordered[-1], 3),
+                "plans": await explain(engine, factory, query, rng),
+            }
+            entry = report["queries"][name]
+            indexes = sorted({index for plan in entry["plans"] for index in plan["indexes"]})
+            print(f"{name:22s} p50 {entry['p50_ms']:8.2f}ms  p95 {entry['p95_ms']:8.2f}ms  索引: {', '.join(indexes) or '-'}",
+                  file=sys.stderr)
+    finally:
+        await engine.dispose()
+
+    failures = check_regressions(report, args)
+    report["failures"] = failures
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    for failure in failures:
+        print(f"回归: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def check_regressions(report: dict, args) -> List[str]:
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("queries", {})
+    failures = []
+    for name, entry in report["queries"].items():
+        for plan in entry["plans"]:
+            for scan in plan["seq_scans"]:
+                failures.append(f"{name}: {scan}（{plan['sql'][:120]}）")
+        if entry["p95_ms"] > args.max_p95_ms:
+            failures.append(f"{name}: p95 {entry['p95_ms']}ms 超过 {args.max_p95_ms}ms")
+        previous = baseline.get(name)
+        if previous and entry["p95_ms"] > previous["p95_ms"] * args.tolerance:
+            failures.append(f"{name}: p95 {entry['p95_ms']}ms，基准为 {previous['p95_ms']}ms")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="历史记录查询的性能基准与查询计划回归检查")
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--schema", default="bench_history", help="测试数据所在的schema")
+    parser.add_argument("--seed", action="store_true", help="重建测试数据")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--sessions-per-user", type=int, default=50)
+    parser.add_argument("--messages-per-session", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=10000, help="写入测试数据时每个事务的会话数")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--random-seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="只运行这些查询")
+    parser.add_argument("--max-p95-ms", type=float, default=50.0)
+    parser.add_argument("--baseline", help="之前的报告，p95 比它慢 --tolerance 倍以上视为回归")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("-o", "--output", help="把报告写入JSON文件")
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,131 @@
+"""
+分批压缩已有的消息正文（PostgreSQL，需先执行迁移 f4b8d2a6c0e3）。
+
+用法：
+    python -m backend.scripts.compress_messages --batch 500
+    python -m backend.scripts.compress_messages --decompress      # 回滚迁移前把压缩过的正文还原
+
+按 message_id 顺序每次处理 --batch 条，每批一个事务，可以在服务运行时执行，中断后重新运行会从头跳过已处理的行。
+只处理超过 MESSAGE_COMPRESSION_MIN_BYTES 的已完成消息；进度和节省的字节数输出到stderr。
+表中被替换的旧行在 VACUUM 之后才能复用，要把空间还给操作系统需要 VACUUM FULL 或 pg_repack。
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import bindparam, func, select, text, update
+
+from backend.core.config import settings
+from backend.core.database import AsyncSessionLocal
+from backend.models.message import Message
+from backend.services.message_codec import active_codec, compression_enabled, decode_content, encode_content
+
+messages = Message.__table__
+
+_COMPRESS = (
+    update(messages)
+    .where(messages.c.message_id == bindparam("b_id"), messages.c.codec.is_(None))
+    .values(content="", codec=bindparam("b_codec"), content_blob=bindparam("b_blob"))
+)
+# 还原时写回原文，触发器据此重新生成全文索引
+_DECOMPRESS = (
+    update(messages)
+    .where(messages.c.message_id == bindparam("b_id"))
+    .values(content=bindparam("b_content"), codec=None, content_blob=None)
+)
+
+
+async def table_size(db) -> int:
+    return (await db.execute(text("SELECT pg_total_relation_size('messages')"))).scalar_one()
+
+
+async def compress_batch(db, after: int, batch: int, min_bytes: int):
+    rows = (await db.execute(
+        select(Message.message_id, Message.content)
+        .where(
+            Message.message_id > after,
+            Message.codec.is_(None),
+            Message.status != "streaming",
+            func.octet_length(Message.content) >= min_bytes,
+        )
+        .order_by(Message.message_id)
+        .limit(batch)
+    )).all()
+    updates, before, stored = [], 0, 0
+    for row in rows:
+        values = encode_content(row.content, "postgresql")
+        if values["codec"] is None:
+            continue
+        updates.append({"b_id": row.message_id, "b_codec": values["codec"], "b_blob": values["content_blob"]})
+        before += len(row.content.encode("utf-8"))
+        stored += len(values["content_blob"])
+    if updates:
+        await db.execute(_COMPRESS, updates)
+    await db.commit()
+    return rows[-1].message_id if rows else None, len(rows), len(updates), before, stored
+
+
+async def decompress_batch(db, after: int, batch: int, min_bytes: int):
+    rows = (await db.execute(
+        select(Message.message_id, Message.codec, Message.content_blob)
+        .where(Message.message_id > after, Message.codec.is_not(None))
+        .order_by(Message.message_id)
+        .limit(batch)
+    )).all()
+    updates, before, stored = [], 0, 0
+    for row in rows:
+        content = decode_content("", row.codec, row.content_blob)
+        updates.append({"b_id": row.message_id, "b_content": content})
+        before += len(row.content_blob)
+        stored += len(content.encode("utf-8"))
+    if updates:
+        await db.execute(_DECOMPRESS, updates)
+    await db.commit()
+    return rows[-1].message_id if rows else None, len(rows), len(updates), before, stored
+
+
+async def main(args):
+    async with AsyncSessionLocal() as db:
+        dialect = db.bind.dialect.name
+        if not args.decompress and not compression_enabled(dialect):
+            sys.exit(f"当前配置不压缩消息（数据库 {dialect}，MESSAGE_COMPRESSION={settings.MESSAGE_COMPRESSION}）")
+        size_before = await table_size(db)
+    process = decompress_batch if args.decompress else compress_batch
+    min_bytes = args.min_bytes or settings.MESSAGE_COMPRESSION_MIN_BYTES
+    after, scanned, changed, bytes_before, bytes_after = 0, 0, 0, 0, 0
+    started = time.perf_counter()
+    while True:
+        async with AsyncSessionLocal() as db:
+            last, count, updated, before, stored = await process(db, after, args.batch, min_bytes)
+        if last is None:
+            break
+        after = last
+        scanned += count
+        changed += updated
+        bytes_before += before
+        bytes_after += stored
+        print(
+            f"已处理到 message_id {after}：检查 {scanned} 条，{'还原' if args.decompress else '压缩'} {changed} 条，"
+            f"{bytes_before} -> {bytes_after} 字节（{time.perf_counter() - started:.0f}s）",
+            file=sys.stderr,
+        )
+        if args.sleep:
+            await asyncio.sleep(args.sleep)
+    async with AsyncSessionLocal() as db:
+        size_after = await table_size(db)
+    print(
+        f"完成：{'还原' if args.decompress else f'用 {active_codec()} 压缩'} {changed} 条消息，"
+        f"正文 {bytes_before} -> {bytes_after} 字节；messages 表（含TOAST和索引）{size_before} -> {size_after} 字节，"
+        "VACUUM 后旧行占用的空间才能复用",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分批压缩（或还原）已有的消息正文")
+    parser.add_argument("--batch", type=int, default=500, help="每个事务处理的消息数")
+    parser.add_argument("--min-bytes", type=int, default=None, help="只压缩超过该字节数的正文，默认 MESSAGE_COMPRESSION_MIN_BYTES")
+    parser.add_argument("--sleep", type=float, default=0.0, help="每批之间暂停的秒数，降低对线上写入的影响")
+    parser.add_argument("--decompress", action="store_true", help="把压缩过的正文还原为原文")
+    asyncio.run(main(parser.parse_args()))
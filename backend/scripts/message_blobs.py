@@ -0,0 +1,144 @@
+"""
+消息正文去重表 message_blobs 的维护（PostgreSQL，需先执行迁移 7c2e4a9f1d3b）。
+
+用法：
+    python -m backend.scripts.message_blobs migrate --batch 500   # 把已有的长正文移入 message_blobs
+    python -m backend.scripts.message_blobs inline --batch 500    # 回滚迁移前把正文写回 messages
+    python -m backend.scripts.message_blobs gc                    # 立即回收无引用的正文（API进程中也会定期执行）
+    python -m backend.scripts.message_blobs verify [--fix]        # 核对引用计数，--fix 时修正（期间新消息的写入会等待）
+
+migrate / inline 按 message_id 顺序每次处理 --batch 条，每批一个事务，可以在服务运行时执行，中断后重新运行即可。
+结束时输出 message_blobs 的行数、被引用的原文总字节数和实际保存的字节数，以及 messages 表大小的变化；
+被替换的旧行在 VACUUM 之后才能复用，要把空间还给操作系统需要 VACUUM FULL 或 pg_repack。
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import bindparam, func, or_, select, text, update
+
+from backend.core.config import settings
+from backend.core.database import AsyncSessionLocal
+from backend.models.message import Message
+from backend.services.blob_store import (
+    blob_contents, blobs_enabled, collect_garbage, reconcile_refcounts, store_contents, table_snapshot,
+)
+from backend.services.message_codec import decode_content
+
+messages = Message.__table__
+
+# 正文移入 message_blobs 后消息行只保留哈希；引用计数由触发器增加，全文索引保持不变
+_TO_BLOB = (
+    update(messages)
+    .where(messages.c.message_id == bindparam("b_id"), messages.c.blob_hash.is_(None))
+    .values(content="", codec=None, content_blob=None, blob_hash=bindparam("b_hash"))
+)
+# 写回原文，触发器据此重新生成全文索引并减少引用计数
+_INLINE = (
+    update(messages)
+    .where(messages.c.message_id == bindparam("b_id"))
+    .values(content=bindparam("b_content"), codec=None, content_blob=None, blob_hash=None)
+)
+
+
+async def table_size(db) -> int:
+    return (await db.execute(text("SELECT pg_total_relation_size('messages')"))).scalar_one()
+
+
+async def migrate_batch(db, after: int, batch: int):
+    rows = (await db.execute(
+        select(Message.message_id, Message.content, Message.codec, Message.content_blob)
+        .where(
+            Message.message_id > after,
+            Message.blob_hash.is_(None),
+            Message.status != "streaming",
+            or_(Message.codec.is_not(None), func.octet_length(Message.content) >= settings.MESSAGE_BLOB_MIN_BYTES),
+        )
+        .order_by(Message.message_id)
+        .limit(batch)
+    )).all()
+    columns = await store_contents(db, [decode_content(row.content, row.codec, row.content_blob) for row in rows])
+    updates = [
+        {"b_id": row.message_id, "b_hash": column["blob_hash"]}
+        for row, column in zip(rows, columns) if column["blob_hash"] is not None
+    ]
+    if updates:
+        await db.execute(_TO_BLOB, updates)
+    await db.commit()
+    return rows[-1].message_id if rows else None, len(rows), len(updates)
+
+
+async def inline_batch(db, after: int, batch: int):
+    rows = (await db.execute(
+        select(Message.message_id, Message.blob_hash)
+        .where(Message.message_id > after, Message.blob_hash.is_not(None))
+        .order_by(Message.message_id)
+        .limit(batch)
+    )).all()
+    blobs = await blob_contents(db, [row.blob_hash for row in rows])
+    updates = [{"b_id": row.message_id, "b_content": blobs[row.blob_hash]} for row in rows]
+    if updates:
+        await db.execute(_INLINE, updates)
+    await db.commit()
+    return rows[-1].message_id if rows else None, len(rows), len(updates)
+
+
+async def rewrite(args):
+    async with AsyncSessionLocal() as db:
+        dialect = db.bind.dialect.name
+        if args.command == "migrate" and not blobs_enabled(dialect):
+            sys.exit(f"当前配置不去重（数据库 {dialect}，MESSAGE_BLOB_MIN_BYTES={settings.MESSAGE_BLOB_MIN_BYTES}）")
+        size_before = await table_size(db)
+    process = migrate_batch if args.command == "migrate" else inline_batch
+    after, scanned, changed = 0, 0, 0
+    started = time.perf_counter()
+    while True:
+        async with AsyncSessionLocal() as db:
+            last, count, updated = await process(db, after, args.batch)
+        if last is None:
+            break
+        after = last
+        scanned += count
+        changed += updated
+        print(f"已处理到 message_id {after}：检查 {scanned} 条，改写 {changed} 条（{time.perf_counter() - started:.0f}s）",
+              file=sys.stderr)
+        if args.sleep:
+            await asyncio.sleep(args.sleep)
+    if args.command == "inline":
+        print(f"回收了 {await collect_garbage()} 条无引用的正文", file=sys.stderr)
+    async with AsyncSessionLocal() as db:
+        size_after = await table_size(db)
+    print(f"完成：改写 {changed} 条消息；messages 表（含TOAST和索引）{size_before} -> {size_after} 字节，"
+          "VACUUM 后旧行占用的空间才能复用", file=sys.stderr)
+
+
+async def main(args):
+    if args.command in ("migrate", "inline"):
+        await rewrite(args)
+    elif args.command == "gc":
+        print(f"回收了 {await collect_garbage(args.batch)} 条无引用的正文", file=sys.stderr)
+    elif args.command == "verify":
+        if args.fix:
+            print(f"修正了 {await reconcile_refcounts()} 条正文的引用计数", file=sys.stderr)
+        else:
+            async with AsyncSessionLocal() as db:
+                drifted = (await db.execute(text(
+                    "SELECT count(*) FROM message_blobs b "
+                    "WHERE b.refcount <> (SELECT count(*) FROM messages m WHERE m.blob_hash = b.hash)"
+                ))).scalar_one()
+            print(f"{drifted} 条正文的引用计数与实际引用不一致" + ("，可用 --fix 修正" if drifted else ""), file=sys.stderr)
+    snapshot = await table_snapshot()
+    saved = snapshot["logical_bytes"] - snapshot["stored_bytes"]
+    print(f"message_blobs：{snapshot['blobs']} 条正文，被引用 {snapshot['refs']} 次，"
+          f"原文共 {snapshot['logical_bytes']} 字节，实际保存 {snapshot['stored_bytes']} 字节（节省 {saved} 字节）",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="消息正文去重表的迁移、回收与校验")
+    parser.add_argument("command", choices=["migrate", "inline", "gc", "verify"])
+    parser.add_argument("--batch", type=int, default=500, help="每个事务处理的消息数（gc 时为每批删除的正文数）")
+    parser.add_argument("--sleep", type=float, default=0.0, help="每批之间暂停的秒数，降低对线上写入的影响")
+    parser.add_argument("--fix", action="store_true", help="verify 时修正不一致的引用计数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""
+批量执行多Agent工作流。
+
+用法：
+    python -m backend.scripts.run_batch requests.jsonl -o results.ndjson --user user1 --concurrency 4
+
+输入为NDJSON（每行一条需求），结果逐行写入输出文件，进度、吞吐量和预计剩余时间输出到stderr。
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from sqlalchemy import select
+
+from backend.core.database import AsyncSessionLocal
+from backend.models.user import User
+from backend.services.batch_runner import BatchRunner, parse_batch_items
+from backend.services.client_pool import model_client_pool
+from backend.services.write_behind import message_writer
+from backend.services.workflow_runner import make_batch_worker
+
+
+def format_progress(record: dict) -> str:
+    eta = f"{record['eta']:.0f}s" if record["eta"] is not None else "-"
+    return (
+        f"[{record['done']}/{record['total']}] 成功 {record['completed']} 失败 {record['failed']} "
+        f"| {record['throughput']:.2f} 条/分钟 | 已用 {record['elapsed']:.0f}s | 预计剩余 {eta}"
+    )
+
+
+async def main(args):
+    with open(args.input, encoding="utf-8") as f:
+        items = parse_batch_items(f.read())
+
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).filter_by(username=args.user))).scalar_one_or_none()
+    if user is None:
+        sys.exit(f"用户不存在: {args.user}")
+    if not user.api_key:
+        sys.exit(f"用户 {args.user} 尚未设置API Key")
+
+    runner = BatchRunner(make_batch_worker(user), concurrency=args.concurrency)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for record in runner.run(items, user.id):
+            if record["type"] == "result":
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                status = "完成" if record["status"] == "completed" else f"失败: {record['error']}"
+                print(f"{record['id']} {status} ({record['duration']:.1f}s)", file=sys.stderr)
+            elif record["type"] == "item_start":
+                print(f"{record['id']} 开始", file=sys.stderr)
+            elif record["type"] in ("progress", "summary"):
+                print(format_progress(record), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await message_writer.aclose()
+        await model_client_pool.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量执行多Agent工作流")
+    parser.add_argument("input", help="NDJSON格式的需求文件")
+    parser.add_argument("-o", "--output", help="结果输出文件（NDJSON），默认输出到stdout")
+    parser.add_argument("--user", required=True, help="以哪个用户的身份执行（使用其API Key，会话记在其名下）")
+    parser.add_argument("--concurrency", type=int, default=None, help="本批次并发数（不超过每用户上限）")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,35 @@
+"""
+启动后台任务worker，从 jobs 表领取并执行 /jobs/ 提交的任务。
+
+用法：
+    python -m backend.scripts.run_worker --concurrency 4
+
+可以在多台机器上启动多个worker进程，与API副本分开扩容；收到 SIGTERM / SIGINT 后停止领取新任务，
+等已领取的任务执行完再退出。
+"""
+import argparse
+import asyncio
+import signal
+
+from backend.services.client_pool import model_client_pool
+from backend.services.job_worker import JobWorker
+from backend.services.write_behind import message_writer
+
+
+async def main(args):
+    worker = JobWorker(concurrency=args.concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    print(f"[job worker] {worker.worker_id} 已启动，并发数 {worker.concurrency}")
+    try:
+        await worker.run()
+    finally:
+        await message_writer.aclose()
+        await model_client_pool.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后台任务worker")
+    parser.add_argument("--concurrency", type=int, default=None, help="同时执行的任务数，默认 JOB_WORKER_CONCURRENCY")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,322 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Hashable, Optional
+
+from fastapi import Depends, HTTPException
+
+from ..core.config import settings
+from ..core.deadline import wait_within_deadline
+from ..core.metrics import register_metrics
+from ..core.utils import get_current_user
+from ..models.user import User as UserModel
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳：reason 为 user_rate / global_rate / queue_full，retry_after 为建议的重试等待秒数"""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"{reason}, retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积攒 burst 个；rate 不大于0时不限速"""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """取一个令牌，成功返回0，否则返回还需等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def idle(self) -> bool:
+        """桶已补满，丢弃后重建没有区别"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """模型服务返回 429（openai.RateLimitError 等带 status_code 的异常，包括被包装过的）"""
+    while error is not None:
+        if getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError":
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+# 排队位置回调 (角色, 位置)，由工作流在上下文中设置，各阶段的模型调用排队时据此上报进度
+_position_reporter: ContextVar[Optional[Callable[[str, int], None]]] = ContextVar("queue_position_reporter", default=None)
+
+
+@contextmanager
+def report_queue_position(callback: Callable[[str, int], None]):
+    """在当前上下文（及其中创建的任务）中，模型调用排队时用 callback(角色, 位置) 上报位置，位置从1开始"""
+    token = _position_reporter.set(callback)
+    try:
+        yield
+    finally:
+        _position_reporter.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("future", "on_position")
+
+    def __init__(self, future: asyncio.Future, on_position: Optional[Callable[[int], None]]):
+        self.future = future
+        self.on_position = on_position
+
+
+class AdaptiveLimiter:
+    """
+    模型调用的并发上限，按 AIMD 调整：模型服务返回 429 时上限乘以 decrease（cooldown 秒内只降一次，
+    同一波 429 不会把上限连续砍到底），并发用满时每次调用成功上限增加 1/上限（约每一轮加1）。
+    超出上限的调用在有界的先进先出队列中等待，队列满时抛出 AdmissionRejected。
+    """
+    def __init__(self, initial: int, min_limit: int, max_limit: int, max_queue: int,
+                 decrease: float, cooldown: float):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.max_queue = max_queue
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.running = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._last_decrease = 0.0
+        self._avg_hold: Optional[float] = None
+        self.completed = 0
+        self.queued_total = 0
+        self.wait_total = 0.0
+        self.rejected = 0
+        self.overloads = 0
+        self.decreases = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def queue_full(self) -> bool:
+        return len(self._waiters) >= self.max_queue
+
+    def retry_after(self) -> float:
+        """按平均占用时长估算排队的调用全部开始所需的秒数"""
+        hold = self._avg_hold if self._avg_hold is not None else 5.0
+        return max(1.0, hold * (len(self._waiters) + 1) / self.capacity)
+
+    def position(self) -> int:
+        """新调用此时到来需要排队的位置，0 表示可以立即开始"""
+        if self.running < self.capacity and not self._waiters:
+            return 0
+        return len(self._waiters) + 1
+
+    def _report_positions(self):
+        for index, waiter in enumerate(self._waiters, start=1):
+            if waiter.on_position is not None:
+                waiter.on_position(index)
+
+    def _grant(self):
+        granted = False
+        while self._waiters and self.running < self.capacity:
+            waiter = self._waiters.popleft()
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(None)
+            self.running += 1
+            granted = True
+        if granted:
+            self._report_positions()
+
+    def _release(self):
+        self.running -= 1
+        self._grant()
+
+    def _on_success(self, saturated: bool):
+        if saturated:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _on_overload(self):
+        self.overloads += 1
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self._last_decrease = now
+            self.decreases += 1
+
+    @asynccontextmanager
+    async def slot(self, role: str = ""):
+        """占用一个并发槽位执行模型调用；排队等待不超过上下文中的截止时间"""
+        if self.running < self.capacity and not self._waiters:
+            self.running += 1
+        else:
+            if self.queue_full():
+                self.rejected += 1
+                raise AdmissionRejected("queue_full", self.retry_after())
+            reporter = _position_reporter.get()
+            waiter = _Waiter(
+                asyncio.get_running_loop().create_future(),
+                (lambda position: reporter(role, position)) if reporter is not None else None
+            )
+            self._waiters.append(waiter)
+            self.queued_total += 1
+            if waiter.on_position is not None:
+                waiter.on_position(len(self._waiters))
+            enqueued = time.monotonic()
+            try:
+                await wait_within_deadline(asyncio.shield(waiter.future))
+            except BaseException:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # 刚分到槽位就被取消或超时，让给下一个
+                    self._release()
+                else:
+                    waiter.future.cancel()
+                    self._waiters.remove(waiter)
+                    self._report_positions()
+                raise
+            self.wait_total += time.monotonic() - enqueued
+        started = time.monotonic()
+        saturated = False
+        try:
+            yield
+            saturated = self.running >= self.capacity or bool(self._waiters)
+            self._on_success(saturated)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self._on_overload()
+            raise
+        finally:
+            hold = time.monotonic() - started
+            self._avg_hold = hold if self._avg_hold is None else self._avg_hold * 0.9 + hold * 0.1
+            self.completed += 1
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "capacity": self.capacity,
+            "running": self.running,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "queued_total": self.queued_total,
+            "avg_wait": round(self.wait_total / self.queued_total, 4) if self.queued_total else 0.0,
+            "avg_hold": round(self._avg_hold, 4) if self._avg_hold is not None else None,
+            "rejected": self.rejected,
+            "overloads": self.overloads,
+            "decreases": self.decreases,
+        }
+
+
+class AdmissionController:
+    """
+    智能体接口的准入控制：每个用户和全局各有一个令牌桶限制请求速率，
+    模型调用排队已满时也直接拒绝，而不是让请求在队列外无限堆积。
+    """
+    def __init__(self, limiter: AdaptiveLimiter, user_rate: float, user_burst: float,
+                 global_rate: float, global_burst: float, max_users: int = 10000):
+        self.limiter = limiter
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_users = max_users
+        self._global = TokenBucket(global_rate, global_burst)
+        self._users: Dict[Hashable, TokenBucket] = {}
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"user_rate": 0, "global_rate": 0, "queue_full": 0}
+
+    def _user_bucket(self, user_key: Hashable) -> TokenBucket:
+        bucket = self._users.get(user_key)
+        if bucket is None:
+            if len(self._users) >= self.max_users:
+                for key in [key for key, b in self._users.items() if b.idle()]:
+                    del self._users[key]
+            bucket = self._users[user_key] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def admit(self, user_key: Hashable) -> int:
+        """接纳一个请求，返回其模型调用此时的排队位置（0 表示无需排队）；不能接纳时抛出 AdmissionRejected"""
+        if self.limiter.queue_full():
+            self._reject("queue_full", self.limiter.retry_after())
+        bucket = self._user_bucket(user_key)
+        wait = bucket.take()
+        if wait:
+            self._reject("user_rate", wait)
+        wait = self._global.take()
+        if wait:
+            bucket.refund()
+            self._reject("global_rate", wait)
+        self.admitted += 1
+        return self.limiter.position()
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "users": len(self._users),
+            "user_rate": self.user_rate,
+            "user_burst": self.user_burst,
+            "llm": self.limiter.stats(),
+        }
+
+
+llm_limiter = AdaptiveLimiter(
+    initial=settings.LLM_CONCURRENCY_INITIAL,
+    min_limit=settings.LLM_CONCURRENCY_MIN,
+    max_limit=settings.LLM_CONCURRENCY_MAX,
+    max_queue=settings.LLM_QUEUE_MAX,
+    decrease=settings.LLM_CONCURRENCY_DECREASE,
+    cooldown=settings.LLM_CONCURRENCY_COOLDOWN,
+)
+admission = AdmissionController(
+    llm_limiter,
+    user_rate=settings.ADMISSION_USER_RATE,
+    user_burst=settings.ADMISSION_USER_BURST,
+    global_rate=settings.ADMISSION_GLOBAL_RATE,
+    global_burst=settings.ADMISSION_GLOBAL_BURST,
+)
+register_metrics("admission", admission.stats)
+
+
+def rejection_response(error: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"请求过多（{error.reason}），请稍后重试",
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+async def admit_request(current_user: UserModel = Depends(get_current_user)) -> int:
+    """
+    智能体接口的依赖项：通过准入控制后返回模型调用的排队位置（0 表示无需排队），
+    不能接纳时返回 429 并在 Retry-After 中给出建议的重试秒数。
+    """
+    try:
+        return admission.admit(current_user.id)
+    except AdmissionRejected as e:
+        raise rejection_response(e)
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Hashable, List
+
+from ..core.config import settings
+from ..core.metrics import register_metrics
+
+
+@dataclass
+class BatchItem:
+    """批量任务中的一条需求"""
+    line: int            # 在NDJSON输入中的行号（从1开始）
+    item_id: str
+    requirement: str
+
+
+def parse_batch_items(text: str, max_items: int = None) -> List[BatchItem]:
+    """
+    解析NDJSON格式的批量需求，每行一个JSON对象，空行忽略。
+    需求取 description / requirement 字段，或 title + body（与 requests.jsonl 格式兼容）；
+    条目id取 id / request_id 字段，没有时用行号。格式错误时抛出 ValueError 并指明行号。
+    """
+    max_items = max_items or settings.BATCH_MAX_ITEMS
+    items: List[BatchItem] = []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第{line_no}行不是合法的JSON: {e.msg}")
+        if not isinstance(data, dict):
+            raise ValueError(f"第{line_no}行应为JSON对象")
+        requirement = data.get("description") or data.get("requirement")
+        if not requirement and (data.get("title") or data.get("body")):
+            requirement = "\n\n".join(part for part in (data.get("title"), data.get("body")) if part)
+        if not requirement or not isinstance(requirement, str):
+            raise ValueError(f"第{line_no}行缺少需求内容（description / requirement / title + body）")
+        item_id = data.get("id") or data.get("request_id") or str(line_no)
+        items.append(BatchItem(line=line_no, item_id=str(item_id), requirement=requirement))
+        if len(items) > max_items:
+            raise ValueError(f"单批最多 {max_items} 条需求")
+    if not items:
+        raise ValueError("没有可执行的需求")
+    return items
+
+
+class ConcurrencyLimiter:
+    """
+    两级并发限制：所有批次共享一个全局上限，每个用户另有自己的上限，
+    防止单个用户的大批量任务占满全部执行槽。
+    """
+    def __init__(self, global_limit: int, per_user_limit: int):
+        self.global_limit = max(1, global_limit)
+        self.per_user_limit = max(1, per_user_limit)
+        self._global = asyncio.Semaphore(self.global_limit)
+        self._users: Dict[Hashable, asyncio.Semaphore] = {}
+        self._holders: Dict[Hashable, int] = {}
+        self.running = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self, user_key: Hashable):
+        semaphore = self._users.get(user_key)
+        if semaphore is None:
+            semaphore = self._users[user_key] = asyncio.Semaphore(self.per_user_limit)
+        self._holders[user_key] = self._holders.get(user_key, 0) + 1
+        self.waiting += 1
+        acquired = False
+        try:
+            # 先占用户槽再占全局槽，排队中的条目不会占着全局槽等待
+            async with semaphore:
+                async with self._global:
+                    self.waiting -= 1
+                    acquired = True
+                    self.running += 1
+                    try:
+                        yield
+                    finally:
+                        self.running -= 1
+        finally:
+            if not acquired:
+                self.waiting -= 1
+            self._holders[user_key] -= 1
+            if not self._holders[user_key]:
+                del self._holders[user_key]
+                del self._users[user_key]
+
+
+# 条目执行函数：worker(item, emit) 返回结果dict，emit(type, **data) 上报条目内部进度
+Emit = Callable[..., Awaitable[None]]
+Worker = Callable[[BatchItem, Emit], Awaitable[dict]]
+
+
+class BatchRunner:
+    """
+    执行一批需求。条目并发执行，受全局和每用户并发上限约束，
+    run() 以事件流的形式依次产出：item_start / item_stage（条目内部进度）/ result / progress / summary。
+    """
+    def __init__(self, worker: Worker, limiter: "ConcurrencyLimiter" = None, concurrency: int = None):
+        self.worker = worker
+        self.limiter = limiter or batch_limiter
+        # 单个批次自身的并发上限（不超过每用户上限）
+        self.concurrency = max(1, concurrency) if concurrency else None
+
+    async def run(self, items: List[BatchItem], user_key: Hashable) -> AsyncGenerator[dict, None]:
+        total = len(items)
+        started_at = time.perf_counter()
+        counts = {"completed": 0, "failed": 0}
+        queue: asyncio.Queue = asyncio.Queue()
+        local = asyncio.Semaphore(self.concurrency) if self.concurrency else None
+        not_started = {item.line for item in items}
+        batch_stats.batches += 1
+        batch_stats.queued += total
+
+        def progress() -> dict:
+            done = counts["completed"] + counts["failed"]
+            elapsed = time.perf_counter() - started_at
+            throughput = done / elapsed if elapsed > 0 else 0.0
+            eta = (total - done) / throughput if throughput > 0 else None
+            return {
+                "type": "progress",
+                "done": done,
+                "completed": counts["completed"],
+                "failed": counts["failed"],
+                "total": total,
+                "elapsed": round(elapsed, 3),
+                "throughput": round(throughput * 60, 3),     # 条/分钟
+                "eta": round(eta, 1) if eta is not None else None,
+            }
+
+        async def run_item(item: BatchItem):
+            async def emit(type: str, **data):
+                await queue.put({"type": type, "id": item.item_id, **data})
+
+            if local is not None:
+                await local.acquire()
+            try:
+                async with self.limiter.slot(user_key):
+                    not_started.discard(item.line)
+                    batch_stats.queued -= 1
+                    item_started = time.perf_counter()
+                    await queue.put({"type": "item_start", "id": item.item_id, "line": item.line})
+                    try:
+                        result = await self.worker(item, emit)
+                        status = result.pop("status", "completed")
+                        error = result.pop("error", None)
+                    except Exception as e:
+                        result, status, error = {}, "failed", str(e)
+            finally:
+                if local is not None:
+                    local.release()
+            counts["completed" if status == "completed" else "failed"] += 1
+            batch_stats.record(status)
+            await queue.put({
+                "type": "result",
+                "id": item.item_id,
+                "line": item.line,
+                "status": status,
+                "error": error,
+                "duration": round(time.perf_counter() - item_started, 3),
+                **result,
+            })
+            await queue.put(progress())
+
+        tasks = [asyncio.create_task(run_item(item)) for item in items]
+        waiter = asyncio.create_task(asyncio.wait(tasks))
+        try:
+            while not (waiter.done() and queue.empty()):
+                getter = asyncio.create_task(queue.get())
+                await asyncio.wait([getter, waiter], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            summary = progress()
+            summary["type"] = "summary"
+            yield summary
+        finally:
+            # 客户端中途断开时取消尚未完成的条目
+            for task in tasks:
+                task.cancel()
+            waiter.cancel()
+            batch_stats.queued -= len(not_started)
+
+
+class BatchStats:
+    def __init__(self):
+        self.batches = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+
+    def record(self, status: str):
+        if status == "completed":
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queued": self.queued,
+            "running": batch_limiter.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "global_limit": batch_limiter.global_limit,
+            "per_user_limit": batch_limiter.per_user_limit,
+        }
+
+
+batch_limiter = ConcurrencyLimiter(settings.BATCH_GLOBAL_CONCURRENCY, settings.BATCH_PER_USER_CONCURRENCY)
+batch_stats = BatchStats()
+register_metrics("workflow_batch", batch_stats.stats)
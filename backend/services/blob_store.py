@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Iterable, List
+
+from sqlalchemy import false, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal, engine
+from ..core.metrics import register_metrics
+from ..models.message import MessageBlob
+from .message_codec import decode_content, encode_content, message_content
+
+logger = logging.getLogger(__name__)
+
+# 删除没有消息引用的正文：跳过正被写入方锁住的行（刚插入或正要被引用），
+# 以 messages 中实际的引用为准，引用计数有偏差时也不会误删
+_COLLECT_GARBAGE = text("""
+WITH victims AS (
+    SELECT hash FROM message_blobs WHERE refcount <= 0
+    LIMIT :batch
+    FOR UPDATE SKIP LOCKED
+)
+DELETE FROM message_blobs b
+USING victims v
+WHERE b.hash = v.hash AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.blob_hash = b.hash)
+RETURNING octet_length(b.data)
+""")
+
+_SNAPSHOT = text("""
+SELECT count(*) AS blobs,
+       coalesce(sum(refcount), 0) AS refs,
+       coalesce(sum(size::bigint * refcount), 0) AS logical_bytes,
+       coalesce(sum(octet_length(data)), 0) AS stored_bytes
+FROM message_blobs
+""")
+
+# 按 messages 中的实际引用重算引用计数；期间锁住 message_blobs，新消息的写入会等待
+_RECONCILE = text("""
+UPDATE message_blobs b
+SET refcount = c.refs
+FROM (
+    SELECT b2.hash, count(m.message_id) AS refs
+    FROM message_blobs b2 LEFT JOIN messages m ON m.blob_hash = b2.hash
+    GROUP BY b2.hash
+) c
+WHERE b.hash = c.hash AND b.refcount <> c.refs
+RETURNING b.hash
+""")
+
+
+class BlobStats:
+    """去重写入的次数与字节数、垃圾回收情况，以及最近一次统计的 message_blobs 表大小"""
+    def __init__(self):
+        self.writes = 0
+        self.new_blobs = 0
+        self.dedup_hits = 0
+        self.bytes_written = 0
+        self.bytes_deduplicated = 0
+        self.gc_runs = 0
+        self.gc_deleted = 0
+        self.gc_deleted_bytes = 0
+        self.snapshot = None
+
+    def stats(self) -> dict:
+        return {
+            "min_bytes": settings.MESSAGE_BLOB_MIN_BYTES,
+            "writes": self.writes,
+            "new_blobs": self.new_blobs,
+            "dedup_hits": self.dedup_hits,
+            "bytes_written": self.bytes_written,
+            "bytes_deduplicated": self.bytes_deduplicated,
+            "gc_runs": self.gc_runs,
+            "gc_deleted": self.gc_deleted,
+            "gc_deleted_bytes": self.gc_deleted_bytes,
+            "table": self.snapshot,
+        }
+
+
+blob_stats = BlobStats()
+register_metrics("message_blobs", blob_stats.stats)
+
+
+def blobs_enabled(dialect: str) -> bool:
+    """只在 PostgreSQL 上去重：引用计数和全文索引由迁移创建的触发器维护，SQLite 的 FTS5 表直接读取 messages.content"""
+    return dialect == "postgresql" and settings.MESSAGE_BLOB_MIN_BYTES > 0
+
+
+async def store_contents(db: AsyncSession, contents: List[str]) -> List[dict]:
+    """
+    一组消息正文的写入列 [{"content", "codec", "content_blob", "blob_hash"}]，须与插入消息在同一事务中调用。
+    超过 MESSAGE_BLOB_MIN_BYTES 的正文按 SHA-256 写入 message_blobs（已存在时不重复写入），消息只保存哈希；
+    其余的按 encode_content 保存在消息行中。引用计数由插入消息时的触发器增加。
+    """
+    dialect = db.bind.dialect.name
+    columns, blobs = [], {}
+    for content in contents:
+        data = content.encode("utf-8")
+        if not blobs_enabled(dialect) or len(data) < settings.MESSAGE_BLOB_MIN_BYTES:
+            columns.append({**encode_content(content, dialect), "blob_hash": None})
+            continue
+        digest = hashlib.sha256(data).digest()
+        if digest not in blobs:
+            encoded = encode_content(content, dialect)
+            blobs[digest] = {
+                "hash": digest,
+                "size": len(data),
+                "codec": encoded["codec"],
+                "data": encoded["content_blob"] if encoded["codec"] else data,
+            }
+        # content 仍传原文，供触发器生成全文索引，随后被清空
+        columns.append({"content": content, "codec": None, "content_blob": None, "blob_hash": digest})
+    if blobs:
+        # 按哈希排序写入，并发事务按相同顺序加锁，不会互相死锁
+        rows = [blobs[digest] for digest in sorted(blobs)]
+        stmt = pg_insert(MessageBlob).values(rows)
+        # 已存在的行不更新，只加行锁，防止垃圾回收在本事务提交前删除它
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MessageBlob.hash], set_={"refcount": MessageBlob.refcount}, where=false()
+        ).returning(MessageBlob.hash)
+        inserted = set((await db.execute(stmt)).scalars().all())
+        blob_stats.new_blobs += len(inserted)
+        blob_stats.bytes_written += sum(len(row["data"]) for row in rows if row["hash"] in inserted)
+        for column in columns:
+            if column["blob_hash"] is not None:
+                blob_stats.writes += 1
+                if column["blob_hash"] in inserted:
+                    inserted.discard(column["blob_hash"])
+                else:
+                    blob_stats.dedup_hits += 1
+                    blob_stats.bytes_deduplicated += blobs[column["blob_hash"]]["size"]
+    return columns
+
+
+async def blob_contents(db: AsyncSession, hashes: Iterable[bytes]) -> Dict[bytes, str]:
+    """按哈希读取正文 {hash: 原文}，同一页中引用同一正文的消息只读取、解压一次；没有哈希时不查询"""
+    hashes = {digest for digest in hashes if digest is not None}
+    if not hashes:
+        return {}
+    rows = (await db.execute(
+        select(MessageBlob.hash, MessageBlob.codec, MessageBlob.data).where(MessageBlob.hash.in_(hashes))
+    )).all()
+    return {row.hash: _blob_text(row) for row in rows}
+
+
+def _blob_text(row) -> str:
+    if row.codec is None:
+        return row.data.decode("utf-8")
+    return decode_content("", row.codec, row.data)
+
+
+async def read_content(db: AsyncSession, message) -> str:
+    """Message 对象的完整正文，正文在 message_blobs 中时查询一次"""
+    if message.blob_hash is None:
+        return message_content(message)
+    return (await blob_contents(db, [message.blob_hash]))[message.blob_hash]
+
+
+async def table_snapshot() -> dict:
+    """message_blobs 的行数、引用数、被引用的原文总字节数与实际保存的字节数"""
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(_SNAPSHOT)).one()
+    snapshot = {
+        "blobs": row.blobs,
+        "refs": int(row.refs),
+        "logical_bytes": int(row.logical_bytes),
+        "stored_bytes": int(row.stored_bytes),
+    }
+    blob_stats.snapshot = snapshot
+    return snapshot
+
+
+async def collect_garbage(batch: int = None) -> int:
+    """删除没有消息引用的正文，每批一个事务，返回删除的行数；多个进程同时执行时互不重复"""
+    if engine.dialect.name != "postgresql":
+        return 0
+    batch = batch or settings.MESSAGE_BLOB_GC_BATCH
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            sizes = (await db.execute(_COLLECT_GARBAGE, {"batch": batch})).scalars().all()
+            await db.commit()
+        total += len(sizes)
+        blob_stats.gc_deleted += len(sizes)
+        blob_stats.gc_deleted_bytes += sum(sizes)
+        if len(sizes) < batch:
+            break
+    blob_stats.gc_runs += 1
+    return total
+
+
+async def reconcile_refcounts() -> int:
+    """按 messages 中的实际引用修正引用计数（如手工修改过数据后），返回修正的行数"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("LOCK TABLE message_blobs IN SHARE ROW EXCLUSIVE MODE"))
+        fixed = len((await db.execute(_RECONCILE)).all())
+        await db.commit()
+    return fixed
+
+
+async def run_blob_gc(interval: float = None):
+    """定期回收无引用的正文并统计表大小，在API进程中运行"""
+    interval = interval or settings.MESSAGE_BLOB_GC_INTERVAL
+    while True:
+        if engine.dialect.name == "postgresql":
+            try:
+                deleted = await collect_garbage()
+                if deleted:
+                    logger.info("回收了 %d 条无引用的消息正文", deleted)
+                await table_snapshot()
+            except Exception as e:
+                logger.warning("回收无引用的消息正文失败: %s", e)
+        await asyncio.sleep(interval)
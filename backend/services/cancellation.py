@@ -0,0 +1,90 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from autogen_core import CancellationToken
+from fastapi import Request
+
+from ..core.config import settings
+from ..core.metrics import register_metrics
+
+
+class CancellationStats:
+    """
+    取消相关的统计。token按流式分块计数（模型流式输出基本一个分块一个token）；
+    节省的token用该Agent完整回答的平均长度减去取消前已生成的部分来估算。
+    """
+    def __init__(self):
+        self.disconnects = 0                  # 检测到客户端断开的请求数
+        self.generations_cancelled = 0        # 被取消的上游模型调用数
+        self.tokens_before_cancel = 0         # 取消前已生成的token
+        self.tokens_saved_estimate = 0        # 估算因取消而没有生成的token
+        self.stages_cancelled = 0             # 被取消的工作流阶段数
+        self.workflows_cancelled = 0          # 无人订阅超过宽限期而取消的工作流
+        self._avg_tokens: Dict[str, float] = {}
+
+    def record_completed(self, agent: str, tokens: int):
+        avg = self._avg_tokens.get(agent)
+        # 指数滑动平均，最近的回答权重更高
+        self._avg_tokens[agent] = tokens if avg is None else avg * 0.9 + tokens * 0.1
+
+    def record_cancelled(self, agent: str, tokens: int):
+        self.generations_cancelled += 1
+        self.tokens_before_cancel += tokens
+        self.tokens_saved_estimate += int(max(0.0, self._avg_tokens.get(agent, 0.0) - tokens))
+
+    def stats(self) -> dict:
+        return {
+            "disconnects": self.disconnects,
+            "generations_cancelled": self.generations_cancelled,
+            "tokens_before_cancel": self.tokens_before_cancel,
+            "tokens_saved_estimate": self.tokens_saved_estimate,
+            "stages_cancelled": self.stages_cancelled,
+            "workflows_cancelled": self.workflows_cancelled,
+        }
+
+
+cancellation_stats = CancellationStats()
+register_metrics("cancellation", cancellation_stats.stats)
+
+
+@asynccontextmanager
+async def watch_disconnect(request: Request, interval: Optional[float] = None):
+    """
+    在流式响应期间监视客户端连接，断开时取消返回的 CancellationToken，token 是否被取消即表示客户端是否已断开。
+    响应生成器被提前关闭（服务端先察觉断开）时，单飞订阅随之结束，上游模型调用同样会停止。
+    """
+    interval = interval or settings.DISCONNECT_POLL_INTERVAL
+    token = CancellationToken()
+
+    async def watch():
+        while not await request.is_disconnected():
+            await asyncio.sleep(interval)
+        cancellation_stats.disconnects += 1
+        token.cancel()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        yield token
+    finally:
+        watcher.cancel()
+
+
+async def cancel_when_abandoned(log, token: CancellationToken, grace: Optional[float] = None):
+    """
+    工作流运行与HTTP连接解耦，断线后允许在宽限期内凭 Last-Event-ID 续传；
+    事件流没有任何订阅者且持续 grace 秒后，取消这次运行。
+    """
+    grace = settings.WORKFLOW_DISCONNECT_GRACE if grace is None else grace
+    loop = asyncio.get_running_loop()
+    idle_since = None
+    while not log.done:
+        if log.subscribers == 0:
+            idle_since = idle_since or loop.time()
+            if loop.time() - idle_since >= grace:
+                cancellation_stats.workflows_cancelled += 1
+                token.cancel()
+                return
+        else:
+            idle_since = None
+        await asyncio.sleep(min(1.0, max(grace / 2, 0.05)))
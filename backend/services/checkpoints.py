@@ -0,0 +1,78 @@
+import json
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from ..core.database import AsyncSessionLocal
+from ..models.stage_checkpoint import StageCheckpoint
+
+_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+async def save_checkpoint(
+    session_id: int,
+    stage: str,
+    status: str,
+    output: str = "",
+    inputs: Optional[Dict[str, str]] = None,
+    error: Optional[str] = None,
+    duration: Optional[float] = None,
+):
+    """
+    写入（或覆盖）某个会话某个阶段的检查点，使用独立的数据库会话，不依赖HTTP请求。
+    按 (session_id, stage) 唯一约束一条语句 upsert，同一阶段并发写入时不会因先删后插而冲突；覆盖时保留 created_at
+    """
+    values = {
+        "status": status,
+        "inputs": json.dumps(inputs, ensure_ascii=False) if inputs is not None else None,
+        "output": output or "",
+        "error": error,
+        "duration": duration,
+    }
+    async with AsyncSessionLocal() as db:
+        insert = _INSERTS[db.bind.dialect.name]
+        stmt = insert(StageCheckpoint).values(session_id=session_id, stage=stage, **values)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[StageCheckpoint.session_id, StageCheckpoint.stage],
+            set_={**values, "updated_at": func.now()},
+        ))
+        await db.commit()
+
+
+async def delete_checkpoints(session_id: int, stages: Iterable[str]):
+    """删除会话中若干阶段的检查点，之后恢复运行时这些阶段会重新执行"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            delete(StageCheckpoint)
+            .where(StageCheckpoint.session_id == session_id, StageCheckpoint.stage.in_(list(stages)))
+        )
+        await db.commit()
+
+
+async def load_checkpoints(session_id: int) -> List[StageCheckpoint]:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(StageCheckpoint)
+            .filter_by(session_id=session_id)
+            .order_by(StageCheckpoint.created_at)
+        )).scalars().all()
+
+
+async def completed_outputs(session_id: int) -> Dict[str, str]:
+    """已完成阶段的输出 {阶段名: 输出}，用于恢复运行时跳过这些阶段"""
+    return {
+        cp.stage: cp.output for cp in await load_checkpoints(session_id)
+        if cp.status == "completed"
+    }
+
+
+def checkpoint_to_dict(cp: StageCheckpoint) -> dict:
+    return {
+        "stage": cp.stage,
+        "status": cp.status,
+        "inputs": json.loads(cp.inputs) if cp.inputs else None,
+        "output": cp.output,
+        "error": cp.error,
+        "duration": cp.duration,
+        "updated_at": cp.updated_at,
+    }
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.metrics import register_metrics
+from ..models.message import Message, MessageChunk
+from .blob_store import read_content, store_contents
+
+logger = logging.getLogger(__name__)
+
+# 后台合并任务，保留引用防止被垃圾回收
+_background_tasks = set()
+
+
+class ChunkStats:
+    def __init__(self):
+        self.messages = 0
+        self.flushes = 0
+        self.chunks = 0
+        self.chars = 0
+        self.flush_errors = 0
+        self.compactions = 0
+        self.stale_compacted = 0
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "flushes": self.flushes,
+            "chunks": self.chunks,
+            "chars": self.chars,
+            "flush_errors": self.flush_errors,
+            "compactions": self.compactions,
+            "stale_compacted": self.stale_compacted,
+            "flush_chars": settings.MESSAGE_CHUNK_FLUSH_CHARS,
+            "flush_interval": settings.MESSAGE_CHUNK_FLUSH_INTERVAL,
+        }
+
+
+chunk_stats = ChunkStats()
+register_metrics("message_chunks", chunk_stats.stats)
+
+
+class ChunkWriter:
+    """
+    把一条流式回答边生成边写入数据库：token先在内存中攒着，
+    累计超过 MESSAGE_CHUNK_FLUSH_CHARS 个字符或距上次写入超过 MESSAGE_CHUNK_FLUSH_INTERVAL 秒时追加一行 message_chunks。
+    消息行在第一次写入时创建（status 为 streaming），不增加首token之前的数据库往返；
+    结束时 close 把分块合并进 messages.content。进程中途崩溃时，已写入的部分由 compact_stale_messages 收尾。
+    """
+    def __init__(self, session_id: int, role: str = "assistant"):
+        self.session_id = session_id
+        self.role = role
+        self.message_id: Optional[int] = None
+        self.seq = 0
+        self._buffer: List[str] = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    async def append(self, text: str):
+        self._buffer.append(text)
+        self._size += len(text)
+        if (self._size >= settings.MESSAGE_CHUNK_FLUSH_CHARS
+                or time.monotonic() - self._last_flush >= settings.MESSAGE_CHUNK_FLUSH_INTERVAL):
+            try:
+                await self.flush()
+            except Exception as e:
+                # 写入失败不打断流式输出，内容留在缓冲区，下次再写
+                chunk_stats.flush_errors += 1
+                logger.warning("会话 %s 的回答分块写入失败，稍后重试: %s", self.session_id, e)
+
+    async def flush(self):
+        """把缓冲区写成一个分块；消息行还不存在时一并创建"""
+        self._last_flush = time.monotonic()
+        if not self._buffer and self.message_id is not None:
+            return
+        content = "".join(self._buffer)
+        async with AsyncSessionLocal() as db:
+            message_id = self.message_id
+            if message_id is None:
+                message_id = (await db.execute(
+                    insert(Message)
+                    .values(session_id=self.session_id, role=self.role, content="", status="streaming")
+                    .returning(Message.message_id)
+                )).scalar_one()
+            if content:
+                await db.execute(insert(MessageChunk).values(message_id=message_id, seq=self.seq + 1, content=content))
+            await db.commit()
+        # 提交成功后才更新状态，失败时缓冲区保持不变
+        if self.message_id is None:
+            self.message_id = message_id
+            chunk_stats.messages += 1
+        if content:
+            self.seq += 1
+            chunk_stats.chunks += 1
+            chunk_stats.chars += len(content)
+        chunk_stats.flushes += 1
+        self._buffer = []
+        self._size = 0
+
+    async def close(self, status: str = "complete") -> str:
+        """写入剩余内容并把分块合并进 messages.content，返回完整内容"""
+        await self.flush()
+        return await compact_message(self.message_id, status)
+
+    def close_in_background(self, status: str = "complete"):
+        """
+        在后台任务中 close：流式响应结束（包括客户端断开、响应任务被取消）时调用，
+        不让响应等待数据库，也不受响应任务取消的影响。
+        """
+        async def run():
+            try:
+                await self.close(status)
+            except Exception as e:
+                logger.error("会话 %s 的回答合并失败，将由过期分块清理收尾: %s", self.session_id, e)
+
+        task = asyncio.get_running_loop().create_task(run())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def compact_message(message_id: int, status: str = "complete") -> str:
+    """把消息的分块按序合并进 messages.content 并删除分块，返回合并后的内容；消息已合并过时原样返回"""
+    async with AsyncSessionLocal() as db:
+        # 锁住消息行，与过期分块清理并发时只合并一次
+        message = (await db.execute(
+            select(Message).where(Message.message_id == message_id).with_for_update()
+        )).scalar_one()
+        if message.status != "streaming":
+            return await read_content(db, message)
+        chunks = (await db.execute(
+            select(MessageChunk.content)
+            .where(MessageChunk.message_id == message_id)
+            .order_by(MessageChunk.seq)
+        )).scalars().all()
+        content = await read_content(db, message) + "".join(chunks)
+        for column, value in (await store_contents(db, [content]))[0].items():
+            setattr(message, column, value)
+        message.status = status
+        await db.execute(delete(MessageChunk).where(MessageChunk.message_id == message_id))
+        await db.commit()
+        chunk_stats.compactions += 1
+        return content
+
+
+async def streaming_contents(db: AsyncSession, message_ids: Iterable[int]) -> Dict[int, str]:
+    """正在生成的消息目前已写入的内容 {message_id: 内容}，供历史记录展示部分回答"""
+    message_ids = list(message_ids)
+    if not message_ids:
+        return {}
+    contents: Dict[int, List[str]] = {message_id: [] for message_id in message_ids}
+    rows = (await db.execute(
+        select(MessageChunk.message_id, MessageChunk.content)
+        .where(MessageChunk.message_id.in_(message_ids))
+        .order_by(MessageChunk.message_id, MessageChunk.seq)
+    )).all()
+    for message_id, content in rows:
+        contents[message_id].append(content)
+    return {message_id: "".join(parts) for message_id, parts in contents.items()}
+
+
+async def compact_stale_messages(older_than: float = None) -> int:
+    """
+    生成进程崩溃或重新部署后留下的 streaming 消息：超过 older_than 秒没有新分块的，
+    把已写入的部分合并为 partial 消息，返回处理的消息数。
+    """
+    older_than = settings.MESSAGE_CHUNK_STALE_AFTER if older_than is None else older_than
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than)
+    async with AsyncSessionLocal() as db:
+        last_chunk = (
+            select(func.max(MessageChunk.created_at))
+            .where(MessageChunk.message_id == Message.message_id)
+            .scalar_subquery()
+        )
+        stale = (await db.execute(
+            select(Message.message_id).where(
+                Message.status == "streaming",
+                func.coalesce(last_chunk, Message.created_at) < cutoff,
+            )
+        )).scalars().all()
+    for message_id in stale:
+        await compact_message(message_id, "partial")
+    chunk_stats.stale_compacted += len(stale)
+    return len(stale)
+
+
+async def run_stale_compactor(interval: float = None):
+    """定期清理过期的 streaming 消息，在API进程中运行（worker在重新入队失联任务时一并清理）"""
+    interval = interval or settings.MESSAGE_CHUNK_STALE_AFTER / 2
+    while True:
+        try:
+            await compact_stale_messages()
+        except Exception as e:
+            logger.warning("清理过期的回答分块失败: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from ..agents.set_key import set_deepseek_api_key
+from ..core.config import settings
+from ..core.deadline import remaining
+from ..core.metrics import register_metrics
+
+logger = logging.getLogger("client-pool")
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """
+    共享连接池的包装：每个客户端关闭时只关闭自己的包装，底层连接池由客户端池统一关闭。
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # 按当前上下文的截止时间收紧本次请求的各项超时（流式响应的每次读取都不会超过剩余时间）
+        left = remaining()
+        if left is not None:
+            if left <= 0:
+                raise httpx.TimeoutException("已超过截止时间", request=request)
+            timeout = request.extensions.get("timeout") or {}
+            request.extensions["timeout"] = {
+                key: min(timeout.get(key) or left, left) for key in ("connect", "read", "write", "pool")
+            }
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class _PoolEntry:
+    __slots__ = ("client", "leases", "last_used", "evicted")
+
+    def __init__(self, client):
+        self.client = client
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.evicted = False
+
+
+class ModelClientPool:
+    """
+    按 (api_key, model) 复用 OpenAIChatCompletionClient 的客户端池。
+    - LRU + 空闲超时淘汰，被淘汰的客户端在没有租用者后关闭
+    - 所有客户端共享一个有界的HTTP连接池，避免每次请求重新建立TLS连接
+    - 统计命中/未命中次数和当前打开的连接数
+    """
+    def __init__(self, max_size: int, idle_ttl: float, limits: httpx.Limits):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.limits = limits
+        self._entries: "OrderedDict[Tuple[str, str], _PoolEntry]" = OrderedDict()
+        self._leased: Dict[int, _PoolEntry] = {}
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.closed = 0
+
+    def _shared_transport(self) -> httpx.AsyncHTTPTransport:
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport(limits=self.limits)
+        return self._transport
+
+    def _new_client(self, api_key: str, model: str):
+        http_client = httpx.AsyncClient(
+            transport=_SharedTransport(self._shared_transport()),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
+        return set_deepseek_api_key(api_key, model=model, http_client=http_client)
+
+    def acquire(self, api_key: str, model: str = "deepseek-chat"):
+        """取出（或创建）客户端并计一次租用，使用完毕必须调用 release"""
+        now = time.monotonic()
+        self._evict_idle(now)
+        key = (api_key, model)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            entry = _PoolEntry(self._new_client(api_key, model))
+            self._entries[key] = entry
+            self._evict_overflow()
+        entry.leases += 1
+        entry.last_used = now
+        self._leased[id(entry.client)] = entry
+        return entry.client
+
+    def release(self, client):
+        entry = self._leased.get(id(client))
+        if entry is None:
+            return
+        entry.leases -= 1
+        entry.last_used = time.monotonic()
+        if entry.leases <= 0:
+            del self._leased[id(client)]
+            if entry.evicted:
+                self._schedule_close(entry.client)
+
+    @asynccontextmanager
+    async def lease(self, api_key: str, model: str = "deepseek-chat"):
+        """async with 形式的租用，保证流式请求结束（包括异常）后归还客户端"""
+        client = self.acquire(api_key, model)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def _evict_idle(self, now: float):
+        expired = [
+            key for key, entry in self._entries.items()
+            if entry.leases == 0 and now - entry.last_used > self.idle_ttl
+        ]
+        for key in expired:
+            self._evict(key)
+
+    def _evict_overflow(self):
+        # 从最久未使用的开始淘汰；正在被租用的客户端跳过，池可以暂时超出上限
+        for key in list(self._entries.keys()):
+            if len(self._entries) <= self.max_size:
+                break
+            if self._entries[key].leases == 0:
+                self._evict(key)
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self.evictions += 1
+        if entry.leases == 0:
+            self._schedule_close(entry.client)
+        else:
+            entry.evicted = True
+
+    def _schedule_close(self, client):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(self._close_client(client))
+
+    async def _close_client(self, client):
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"Error closing model client: {e}")
+        self.closed += 1
+
+    async def aclose(self):
+        """关闭所有客户端及共享连接池，在应用关闭时调用"""
+        clients = [entry.client for entry in self._entries.values()]
+        clients += [entry.client for entry in self._leased.values() if entry.evicted]
+        self._entries.clear()
+        self._leased.clear()
+        for client in clients:
+            await self._close_client(client)
+        if self._transport is not None:
+            await self._transport.aclose()
+            self._transport = None
+
+    def open_connections(self) -> int:
+        pool = getattr(self._transport, "_pool", None)
+        return len(getattr(pool, "connections", []) or [])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "leased": len(self._leased),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "closed": self.closed,
+            "open_connections": self.open_connections(),
+            "max_connections": self.limits.max_connections,
+        }
+
+
+model_client_pool = ModelClientPool(
+    max_size=settings.LLM_CLIENT_POOL_SIZE,
+    idle_ttl=settings.LLM_CLIENT_IDLE_TTL,
+    limits=httpx.Limits(
+        max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+    ),
+)
+register_metrics("llm_client_pool", model_client_pool.stats)
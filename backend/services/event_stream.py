@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Dict, List, Optional
+
+from ..core.config import settings
+from ..core.metrics import register_metrics
+
+
+@dataclass
+class StreamEvent:
+    """
+    事件流协议中的一条事件。
+    type: run_start / stage_start / delta / stage_complete / stage_failed / stage_skipped / complete / error
+    """
+    seq: int
+    type: str
+    stage: Optional[str] = None
+    data: dict = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self, run_id: str) -> dict:
+        return {
+            "run_id": run_id,
+            "seq": self.seq,
+            "type": self.type,
+            "stage": self.stage,
+            "timestamp": self.timestamp,
+            **self.data,
+        }
+
+    def to_sse(self, run_id: str) -> str:
+        payload = json.dumps(self.to_dict(run_id), ensure_ascii=False)
+        return f"id: {self.seq}\nevent: {self.type}\ndata: {payload}\n\n"
+
+    def to_ndjson(self, run_id: str) -> str:
+        return json.dumps(self.to_dict(run_id), ensure_ascii=False) + "\n"
+
+
+class EventLog:
+    """
+    一次运行的服务端回放缓冲区：保存全部事件，订阅者可以从任意序号之后继续读取，
+    断线重连时凭 Last-Event-ID 续传，不需要重新执行整个工作流。
+    """
+    def __init__(self, run_id: str, owner_id: Optional[int] = None):
+        self.run_id = run_id
+        self.owner_id = owner_id
+        self.events: List[StreamEvent] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, type: str, stage: Optional[str] = None, **data) -> StreamEvent:
+        event = StreamEvent(seq=len(self.events) + 1, type=type, stage=stage, data=data)
+        self.events.append(event)
+        self._notify()
+        return event
+
+    def close(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    async def subscribe(self, after_seq: int = 0, heartbeat: float = 15.0) -> AsyncGenerator[Optional[StreamEvent], None]:
+        """
+        依次产出 seq > after_seq 的事件，运行结束后返回。
+        长时间没有新事件时产出 None，调用方可据此发送心跳，防止代理断开空闲连接。
+        """
+        index = max(0, after_seq)
+        self.subscribers += 1
+        try:
+            while True:
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                if self.done:
+                    return
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.subscribers -= 1
+
+
+class RunRegistry:
+    """进程内的运行登记表，已结束的运行在 ttl 秒后清理"""
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._runs: Dict[str, EventLog] = {}
+        self.resumes = 0
+
+    def create(self, owner_id: Optional[int] = None) -> EventLog:
+        self._cleanup()
+        log = EventLog(uuid.uuid4().hex, owner_id)
+        self._runs[log.run_id] = log
+        return log
+
+    def get(self, run_id: str) -> Optional[EventLog]:
+        self._cleanup()
+        return self._runs.get(run_id)
+
+    def _cleanup(self):
+        now = time.monotonic()
+        expired = [
+            run_id for run_id, log in self._runs.items()
+            if log.done and now - log.finished_at > self.ttl
+        ]
+        for run_id in expired:
+            del self._runs[run_id]
+
+    def stats(self) -> dict:
+        return {
+            "runs": len(self._runs),
+            "active": sum(1 for log in self._runs.values() if not log.done),
+            "subscribers": sum(log.subscribers for log in self._runs.values()),
+            "resumes": self.resumes,
+        }
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    try:
+        return max(0, int(value)) if value else 0
+    except ValueError:
+        return 0
+
+
+async def sse_stream(log: EventLog, after_seq: int = 0) -> AsyncGenerator[str, None]:
+    """把事件日志编码为 text/event-stream"""
+    # 告诉浏览器 EventSource 的重连间隔
+    yield "retry: 3000\n\n"
+    async for event in log.subscribe(after_seq):
+        if event is None:
+            yield ": ping\n\n"
+        else:
+            yield event.to_sse(log.run_id)
+
+
+workflow_runs = RunRegistry(ttl=settings.WORKFLOW_REPLAY_TTL)
+register_metrics("workflow_runs", workflow_runs.stats)
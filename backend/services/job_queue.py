@@ -0,0 +1,234 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import timedelta
+from typing import AsyncGenerator, List, Optional
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.job import Job, JobEvent
+from .event_stream import EventLog, StreamEvent
+
+# 已结束的任务状态
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+async def submit_job(db: AsyncSession, user_id: int, kind: str, payload: dict,
+                     session_id: Optional[int] = None) -> Job:
+    """任务入队，返回新建的任务记录"""
+    job = Job(
+        job_id=uuid.uuid4().hex,
+        user_id=user_id,
+        session_id=session_id,
+        kind=kind,
+        payload=json.dumps(payload, ensure_ascii=False),
+        status="queued",
+        attempts=0,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    await db.commit()
+    return job
+
+
+async def get_job(db: AsyncSession, job_id: str, user_id: int) -> Optional[Job]:
+    return (await db.execute(
+        select(Job).filter_by(job_id=job_id, user_id=user_id)
+    )).scalar_one_or_none()
+
+
+async def claim_job(worker_id: str) -> Optional[Job]:
+    """
+    领取最早入队的一个任务。SELECT ... FOR UPDATE SKIP LOCKED 保证多个worker进程并发领取时
+    不会拿到同一个任务，也不会互相阻塞。
+    """
+    async with AsyncSessionLocal() as db:
+        job = (await db.execute(
+            select(Job)
+            .where(Job.status == "queued")
+            .order_by(Job.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )).scalar_one_or_none()
+        if job is None:
+            return None
+        job.status = "running"
+        job.worker_id = worker_id
+        job.attempts += 1
+        job.started_at = func.now()
+        job.heartbeat_at = func.now()
+        await db.commit()
+        return job
+
+
+async def heartbeat(job_id: str, worker_id: str) -> bool:
+    """刷新心跳；返回 False 表示任务已不归当前worker所有（被判定失联后重新入队）"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Job)
+            .where(Job.job_id == job_id, Job.worker_id == worker_id, Job.status == "running")
+            .values(heartbeat_at=func.now())
+        )
+        await db.commit()
+        return result.rowcount > 0
+
+
+async def finish_job(job_id: str, worker_id: str, status: str,
+                     result: Optional[dict] = None, error: Optional[str] = None):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.job_id == job_id, Job.worker_id == worker_id)
+            .values(
+                status=status,
+                result=json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error=error,
+                finished_at=func.now(),
+            )
+        )
+        await db.commit()
+
+
+async def requeue_stale_jobs() -> int:
+    """心跳超时的运行中任务重新入队，超过最大尝试次数的标记为失败，返回处理的任务数"""
+    async with AsyncSessionLocal() as db:
+        stale = (await db.execute(
+            select(Job)
+            .where(
+                Job.status == "running",
+                Job.heartbeat_at < func.now() - timedelta(seconds=settings.JOB_STALE_AFTER),
+            )
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        for job in stale:
+            if job.attempts >= job.max_attempts:
+                job.status = "failed"
+                job.error = f"worker失联，已尝试{job.attempts}次"
+                job.finished_at = func.now()
+            else:
+                job.status = "queued"
+            job.worker_id = None
+        await db.commit()
+        return len(stale)
+
+
+async def last_event_seq(job_id: str) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(func.max(JobEvent.seq)).where(JobEvent.job_id == job_id)
+        )).scalar() or 0
+
+
+async def load_job_events(job_id: str, after_seq: int = 0, limit: int = 500) -> List[JobEvent]:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(
+            select(JobEvent)
+            .where(JobEvent.job_id == job_id, JobEvent.seq > after_seq)
+            .order_by(JobEvent.seq)
+            .limit(limit)
+        )).scalars().all()
+
+
+class JobEventSink:
+    """
+    把worker进程内 EventLog 的事件批量写入 job_events，
+    其他进程中的API副本据此向客户端推送任务的实时事件流。
+    同一阶段连续的 delta 在写入前合并，减少行数。
+    """
+    def __init__(self, job_id: str, log: EventLog, seq_offset: int = 0):
+        self.job_id = job_id
+        self.log = log
+        # 重试的任务接着上一次尝试的序号继续编号
+        self.seq = seq_offset
+        self._buffer: List[JobEvent] = []
+
+    def _add(self, event: StreamEvent):
+        last = self._buffer[-1] if self._buffer else None
+        if (event.type == "delta" and last is not None and last.type == "delta"
+                and last.stage == event.stage):
+            data = json.loads(last.data)
+            data["delta"] += event.data.get("delta", "")
+            last.data = json.dumps(data, ensure_ascii=False)
+            return
+        self.seq += 1
+        self._buffer.append(JobEvent(
+            job_id=self.job_id,
+            seq=self.seq,
+            type=event.type,
+            stage=event.stage,
+            data=json.dumps(event.data, ensure_ascii=False),
+        ))
+
+    async def _flush(self):
+        if not self._buffer:
+            return
+        async with AsyncSessionLocal() as db:
+            db.add_all(self._buffer)
+            await db.commit()
+        self._buffer = []
+
+    async def run(self):
+        """持续写入直到事件日志关闭"""
+        last_flush = time.monotonic()
+        async for event in self.log.subscribe(heartbeat=settings.JOB_EVENT_FLUSH_INTERVAL):
+            if event is not None:
+                self._add(event)
+            if (len(self._buffer) >= settings.JOB_EVENT_BATCH_SIZE
+                    or time.monotonic() - last_flush >= settings.JOB_EVENT_FLUSH_INTERVAL):
+                await self._flush()
+                last_flush = time.monotonic()
+        await self._flush()
+
+
+async def job_event_stream(job_id: str, after_seq: int = 0, heartbeat: float = 15.0) -> AsyncGenerator[str, None]:
+    """
+    以 text/event-stream 推送任务事件：先回放 after_seq 之后已写入的事件，
+    再轮询新事件，任务结束且事件读完后返回。与worker运行在哪个进程无关。
+    """
+    yield "retry: 3000\n\n"
+    last_sent = time.monotonic()
+    while True:
+        # 先读状态再读事件：worker写完全部事件后才会把任务标记为结束，保证不会漏掉尾部事件
+        async with AsyncSessionLocal() as db:
+            status = (await db.execute(
+                select(Job.status).where(Job.job_id == job_id)
+            )).scalar_one_or_none()
+        events = await load_job_events(job_id, after_seq)
+        for row in events:
+            event = StreamEvent(
+                seq=row.seq,
+                type=row.type,
+                stage=row.stage,
+                data=json.loads(row.data) if row.data else {},
+                timestamp=row.created_at.timestamp() if row.created_at else time.time(),
+            )
+            yield event.to_sse(job_id)
+            after_seq = row.seq
+            last_sent = time.monotonic()
+        if events:
+            continue
+        if status is None or status in TERMINAL_STATUSES:
+            return
+        if time.monotonic() - last_sent >= heartbeat:
+            yield ": ping\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(settings.JOB_EVENT_FLUSH_INTERVAL)
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "kind": job.kind,
+        "status": job.status,
+        "session_id": job.session_id,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import socket
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+
+from ..agents.registry import AGENTS
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.deadline import deadline_scope
+from ..models.job import Job
+from ..models.user import User
+from .checkpoints import completed_outputs
+from .client_pool import model_client_pool
+from .model_router import ModelRouting
+from .event_stream import EventLog
+from .chunk_store import ChunkWriter, compact_stale_messages
+from .job_queue import claim_job, heartbeat, finish_job, requeue_stale_jobs, last_event_seq, JobEventSink
+from .workflow_runner import run_workflow, summarize_outcome
+
+# 单Agent任务的类型即注册表中的Agent名，请求字段与对应的 /agent/*/stream 接口一致
+JOB_KINDS = ("workflow",) + tuple(AGENTS)
+
+
+async def execute_job(job: Job, log: EventLog) -> Tuple[str, dict, Optional[str]]:
+    """执行一个任务，事件写入 log，返回 (状态, 结果, 错误)"""
+    payload = json.loads(job.payload)
+    async with AsyncSessionLocal() as db:
+        api_key = (await db.execute(select(User.api_key).where(User.id == job.user_id))).scalar_one_or_none()
+    log.append("run_start", None, session_id=job.session_id, attempt=job.attempts)
+
+    if job.kind == "workflow":
+        # 重试时复用上一次尝试已完成阶段的检查点
+        restored = await completed_outputs(job.session_id) if job.attempts > 1 else None
+        with deadline_scope(settings.WORKFLOW_DEADLINE):
+            outcome = await run_workflow(
+                log, api_key, payload.get("description", ""), job.session_id, restored,
+                model_overrides=payload.get("model")
+            )
+        result = summarize_outcome(outcome, job.session_id)
+        return result.pop("status"), result, result.pop("error")
+
+    spec = AGENTS[job.kind]
+    writer = ChunkWriter(job.session_id)
+    try:
+        with deadline_scope(settings.AGENT_DEADLINE):
+            async with model_client_pool.lease(api_key) as client:
+                agent = spec.agent_cls(client, ModelRouting(api_key, payload.get("model")))
+                async for token in agent.handle_message_stream(*spec.values(payload)):
+                    await writer.append(token)
+                    log.append("delta", job.kind, delta=token)
+    except Exception as e:
+        log.append("error", job.kind, error=str(e))
+        log.close()
+        # 保留已生成的部分，重试时会作为新的回答重新生成
+        await writer.close("partial")
+        return "failed", {"session_id": job.session_id}, str(e)
+    # 合并完成后再把任务标记为结束
+    content = await writer.close()
+    log.append("complete", job.kind, content=content)
+    log.close()
+    return "completed", {"session_id": job.session_id, "content": content}, None
+
+
+class JobWorker:
+    """
+    后台任务worker：从 jobs 表领取任务并执行，与API进程分开部署、按需扩容。
+    执行期间定期刷新心跳；worker进程崩溃后，其任务在 JOB_STALE_AFTER 秒后被其他worker重新入队。
+    """
+    def __init__(self, concurrency: int = None, worker_id: str = None):
+        self.concurrency = max(1, concurrency or settings.JOB_WORKER_CONCURRENCY)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """停止领取新任务，已领取的任务执行完后 run() 返回"""
+        self._stopping.set()
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        running = set()
+        last_requeue = 0.0
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            await slots.acquire()
+            job = None
+            try:
+                if loop.time() - last_requeue >= settings.JOB_STALE_AFTER / 2:
+                    await requeue_stale_jobs()
+                    # 失联任务留下的 streaming 消息合并为部分回答
+                    await compact_stale_messages()
+                    last_requeue = loop.time()
+                job = await claim_job(self.worker_id)
+            except Exception as e:
+                print(f"[job worker] 领取任务失败: {e}")
+            if job is None:
+                slots.release()
+                await self._sleep(settings.JOB_POLL_INTERVAL)
+                continue
+            task = asyncio.create_task(self._run(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def _keep_alive(self, job: Job, work: asyncio.Task) -> bool:
+        """
+        在 work 执行期间定期刷新心跳，work 结束时返回 True；任务已不归本worker时返回 False。
+        心跳出错（如数据库连接闪断）时下一轮重试，距上次成功超过 JOB_STALE_AFTER 秒仍失败时，
+        任务可能已被重新入队，按失联处理。
+        """
+        loop = asyncio.get_running_loop()
+        last_beat = loop.time()
+        while not work.done():
+            await asyncio.wait([work], timeout=settings.JOB_HEARTBEAT_INTERVAL)
+            if work.done():
+                break
+            try:
+                if not await heartbeat(job.job_id, self.worker_id):
+                    return False
+                last_beat = loop.time()
+            except Exception as e:
+                if loop.time() - last_beat >= settings.JOB_STALE_AFTER:
+                    print(f"[job worker] 任务 {job.job_id} 的心跳持续失败，放弃执行: {e}")
+                    return False
+                print(f"[job worker] 任务 {job.job_id} 的心跳失败，稍后重试: {e}")
+        return True
+
+    async def _run(self, job: Job):
+        log = EventLog(job.job_id, job.user_id)
+        sink = asyncio.create_task(JobEventSink(job.job_id, log, await last_event_seq(job.job_id)).run())
+        work = asyncio.create_task(execute_job(job, log))
+        try:
+            if not await self._keep_alive(job, work):
+                # 任务已被判定失联并交给其他worker，放弃本次执行
+                return
+            status, result, error = work.result()
+        except Exception as e:
+            status, result, error = "failed", None, str(e)
+            log.append("error", None, error=str(e))
+        finally:
+            # 失联、worker停止等提前退出时先停止执行，之后不会再调用模型或写入已关闭的日志
+            if not work.done():
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+            log.close()
+            # 事件全部落库后才标记任务结束，附着的客户端据此判断事件已读完
+            await sink
+        await finish_job(job.job_id, self.worker_id, status, result, error)
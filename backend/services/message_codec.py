@@ -0,0 +1,145 @@
+import logging
+import time
+import zlib
+from typing import Optional
+
+from ..core.config import settings
+from ..core.metrics import register_metrics
+
+try:
+    import zstandard
+except ImportError:  # 未安装时用标准库的 zlib 压缩
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("zstd", "zlib")
+
+# 压缩/解压器复用同一个实例（只在事件循环线程中使用）
+_compressor = None
+_decompressor = None
+
+
+class CodecStats:
+    """压缩与解压的次数、字节数和耗时，用于评估节省的存储与读写开销"""
+    def __init__(self):
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_seconds = 0.0
+        self.decompressed = 0
+        self.decompressed_bytes = 0
+        self.decompress_seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "codec": active_codec(),
+            "min_bytes": settings.MESSAGE_COMPRESSION_MIN_BYTES,
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "saved_bytes": self.bytes_in - self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            "avg_compress_ms": round(self.compress_seconds * 1000 / self.compressed, 3) if self.compressed else None,
+            "decompressed": self.decompressed,
+            "decompressed_bytes": self.decompressed_bytes,
+            "avg_decompress_ms": (
+                round(self.decompress_seconds * 1000 / self.decompressed, 3) if self.decompressed else None
+            ),
+        }
+
+
+codec_stats = CodecStats()
+register_metrics("message_compression", codec_stats.stats)
+
+_warned_fallback = False
+
+
+def active_codec() -> Optional[str]:
+    """写入时使用的编码：MESSAGE_COMPRESSION 为 zstd 但未安装 zstandard 时退回 zlib，none 表示不压缩"""
+    global _warned_fallback
+    codec = settings.MESSAGE_COMPRESSION
+    if codec == "zstd" and zstandard is None:
+        if not _warned_fallback:
+            _warned_fallback = True
+            logger.warning("未安装 zstandard，消息正文改用 zlib 压缩")
+        return "zlib"
+    return codec if codec in CODECS else None
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    global _compressor
+    if codec == "zstd":
+        if _compressor is None:
+            _compressor = zstandard.ZstdCompressor(level=settings.MESSAGE_COMPRESSION_LEVEL)
+        return _compressor.compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, min(settings.MESSAGE_COMPRESSION_LEVEL, 9))
+    raise ValueError(f"不支持的压缩编码: {codec}")
+
+
+def decompress(blob: bytes, codec: str) -> bytes:
+    global _decompressor
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("消息以 zstd 压缩保存，需要安装 zstandard 才能读取")
+        if _decompressor is None:
+            _decompressor = zstandard.ZstdDecompressor()
+        return _decompressor.decompress(blob)
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    raise ValueError(f"不支持的压缩编码: {codec}")
+
+
+def compression_enabled(dialect: str) -> bool:
+    """
+    只在 PostgreSQL 上压缩：迁移创建的触发器用写入时传入的原文更新全文索引后清空 content 列。
+    SQLite 的 FTS5 外部内容表直接读取 messages.content，保持原文。
+    """
+    return dialect == "postgresql" and active_codec() is not None
+
+
+def encode_content(content: str, dialect: str) -> dict:
+    """
+    消息正文的写入列 {"content", "codec", "content_blob"}。
+    超过 MESSAGE_COMPRESSION_MIN_BYTES 的正文压缩到 content_blob，codec 记录编码；
+    content 仍传原文，供数据库触发器生成全文索引，触发器随后把它清空，不占存储。
+    """
+    values = {"content": content, "codec": None, "content_blob": None}
+    if not compression_enabled(dialect):
+        return values
+    data = content.encode("utf-8")
+    if len(data) < settings.MESSAGE_COMPRESSION_MIN_BYTES:
+        return values
+    codec = active_codec()
+    started = time.perf_counter()
+    blob = compress(data, codec)
+    codec_stats.compress_seconds += time.perf_counter() - started
+    if len(blob) >= len(data) * settings.MESSAGE_COMPRESSION_MAX_RATIO:
+        # 压缩效果不明显（如已压缩的内容），按原文保存，读取时不必解压
+        codec_stats.skipped += 1
+        return values
+    codec_stats.compressed += 1
+    codec_stats.bytes_in += len(data)
+    codec_stats.bytes_out += len(blob)
+    values.update(codec=codec, content_blob=blob)
+    return values
+
+
+def decode_content(content: str, codec: Optional[str], blob: Optional[bytes]) -> str:
+    """读取消息正文：codec 为空时就是 content，否则解压 content_blob"""
+    if codec is None:
+        return content
+    started = time.perf_counter()
+    data = decompress(blob, codec)
+    codec_stats.decompress_seconds += time.perf_counter() - started
+    codec_stats.decompressed += 1
+    codec_stats.decompressed_bytes += len(data)
+    return data.decode("utf-8")
+
+
+def message_content(message) -> str:
+    """Message 对象的完整正文"""
+    return decode_content(message.content, message.codec, message.content_blob)
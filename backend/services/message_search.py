@@ -0,0 +1,172 @@
+import html
+import re
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.metrics import register_metrics
+from .message_codec import decode_content
+from .blob_store import blob_contents
+
+# 高亮标记先用私用区字符占位，转义HTML后再替换为 <mark>，消息中的代码和HTML不会被当作标签
+_START, _STOP = "\ue000", "\ue001"
+
+# PostgreSQL：先按相关度取出一页，只对这一页生成摘要（ts_headline 需要读取整条内容，代价较高）
+_POSTGRES_QUERY = text("""
+WITH q AS (
+    SELECT websearch_to_tsquery(CAST(CAST(:config AS text) AS regconfig), :query) AS query
+),
+top AS (
+    SELECT m.message_id, m.session_id, m.role, m.created_at, ts_rank_cd(m.content_tsv, q.query) AS score
+    FROM messages m JOIN sessions s ON s.session_id = m.session_id, q
+    WHERE s.user_id = :user_id AND m.content_tsv @@ q.query
+      AND (CAST(:role AS varchar) IS NULL OR m.role = :role)
+      AND (CAST(:session_id AS integer) IS NULL OR m.session_id = :session_id)
+    ORDER BY score DESC, m.message_id DESC
+    LIMIT :limit OFFSET :offset
+)
+SELECT top.message_id, top.session_id, top.role, top.created_at, top.score, s.session_name, m.codec, m.content_blob, m.blob_hash,
+       ts_headline(CAST(CAST(:config AS text) AS regconfig), m.content, q.query, :options) AS snippet
+FROM top
+JOIN messages m ON m.message_id = top.message_id
+JOIN sessions s ON s.session_id = top.session_id, q
+ORDER BY top.score DESC, top.message_id DESC
+""")
+
+# 压缩或去重保存的正文在数据库中 content 为空，取出原文传回数据库生成摘要（只有当前页中的这几条）
+_POSTGRES_HEADLINES = text("""
+SELECT ts_headline(
+    CAST(CAST(:config AS text) AS regconfig), d.doc,
+    websearch_to_tsquery(CAST(CAST(:config AS text) AS regconfig), :query), :options
+) AS snippet
+FROM unnest(CAST(:docs AS text[])) WITH ORDINALITY AS d(doc, n)
+ORDER BY d.n
+""")
+
+_HEADLINE_OPTIONS = f'StartSel="{_START}", StopSel="{_STOP}", MinWords=10, MaxWords=30, MaxFragments=2, FragmentDelimiter=" … "'
+
+# SQLite（本地运行）：FTS5 外部内容表 messages_fts，bm25 越小越相关（取负数后与PostgreSQL一样越大越相关）
+_SQLITE_QUERY = text("""
+SELECT m.message_id, m.session_id, m.role, m.created_at, -bm25(messages_fts) AS score, s.session_name,
+       snippet(messages_fts, 0, :start, :stop, ' … ', 24) AS snippet
+FROM messages_fts
+JOIN messages m ON m.message_id = messages_fts.rowid
+JOIN sessions s ON s.session_id = m.session_id
+WHERE messages_fts MATCH :query AND s.user_id = :user_id
+  AND (:role IS NULL OR m.role = :role)
+  AND (:session_id IS NULL OR m.session_id = :session_id)
+ORDER BY score DESC, m.message_id DESC
+LIMIT :limit OFFSET :offset
+""")
+
+
+class SearchUnavailable(Exception):
+    """当前数据库没有全文索引（未执行迁移，或不是 PostgreSQL / SQLite）"""
+
+
+class SearchStats:
+    """搜索次数、无结果次数及最近 window 次搜索的查询耗时（毫秒）"""
+    def __init__(self, window: int = 1000):
+        self.searches = 0
+        self.empty = 0
+        self.errors = 0
+        self._latency = deque(maxlen=window)
+
+    def record(self, seconds: float, results: int):
+        self.searches += 1
+        self.empty += int(results == 0)
+        self._latency.append(seconds * 1000)
+
+    def stats(self) -> dict:
+        ordered = sorted(self._latency)
+        return {
+            "searches": self.searches,
+            "empty": self.empty,
+            "errors": self.errors,
+            "avg_ms": round(sum(ordered) / len(ordered), 2) if ordered else None,
+            "p50_ms": round(ordered[len(ordered) // 2], 2) if ordered else None,
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2) if ordered else None,
+        }
+
+
+search_stats = SearchStats()
+register_metrics("message_search", search_stats.stats)
+
+
+def fts5_query(query: str) -> str:
+    """把用户输入转成 FTS5 查询：每个词加引号（避免被当作运算符），各词之间为 AND"""
+    return " ".join(f'"{term}"' for term in re.findall(r"\w+", query))
+
+
+def _highlight(snippet: Optional[str]) -> str:
+    return html.escape(snippet or "").replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+async def search_messages(db: AsyncSession, user_id: int, query: str, limit: int = 20, offset: int = 0,
+                          role: str = None, session_id: int = None) -> dict:
+    """
+    在当前用户的消息中全文搜索，按相关度排序，返回
+    {"results": [{message_id, session_id, session_name, role, created_at, rank, snippet}], "has_more", "took_ms", "backend"}。
+    snippet 为转义过的HTML片段，命中的词用 <mark> 标出。
+    PostgreSQL 使用 messages.content_tsv（tsvector，GIN索引），SQLite 使用 FTS5 表 messages_fts。
+    """
+    dialect = db.bind.dialect.name
+    params = {"user_id": user_id, "role": role, "session_id": session_id, "limit": limit + 1, "offset": offset}
+    if dialect == "postgresql":
+        statement = _POSTGRES_QUERY
+        params.update(query=query, config=settings.SEARCH_TS_CONFIG, options=_HEADLINE_OPTIONS)
+    elif dialect == "sqlite":
+        statement = _SQLITE_QUERY
+        params.update(query=fts5_query(query), start=_START, stop=_STOP)
+        if not params["query"]:
+            return {"results": [], "has_more": False, "took_ms": 0.0, "backend": dialect}
+    else:
+        raise SearchUnavailable(f"不支持在 {dialect} 上全文搜索")
+
+    started = time.perf_counter()
+    try:
+        rows = (await db.execute(statement, params)).all()
+    except DBAPIError as e:
+        search_stats.errors += 1
+        await db.rollback()
+        raise SearchUnavailable(f"全文索引不可用，请先执行数据库迁移: {e.orig}")
+    snippets = {row.message_id: row.snippet for row in rows}
+    stored = [
+        row for row in rows[:limit]
+        if dialect == "postgresql" and (row.codec is not None or row.blob_hash is not None)
+    ]
+    if stored:
+        blobs = await blob_contents(db, [row.blob_hash for row in stored])
+        headlines = (await db.execute(_POSTGRES_HEADLINES, {
+            "config": params["config"], "query": query, "options": _HEADLINE_OPTIONS,
+            "docs": [
+                blobs[row.blob_hash] if row.blob_hash is not None else decode_content("", row.codec, row.content_blob)
+                for row in stored
+            ],
+        })).scalars().all()
+        snippets.update(zip((row.message_id for row in stored), headlines))
+    took = time.perf_counter() - started
+    search_stats.record(took, len(rows))
+
+    return {
+        "results": [
+            {
+                "message_id": row.message_id,
+                "session_id": row.session_id,
+                "session_name": row.session_name or "",
+                "role": row.role,
+                "created_at": row.created_at,
+                "rank": round(float(row.score), 6),
+                "snippet": _highlight(snippets[row.message_id]),
+            }
+            for row in rows[:limit]
+        ],
+        "has_more": len(rows) > limit,
+        "took_ms": round(took * 1000, 2),
+        "backend": dialect,
+    }
@@ -0,0 +1,195 @@
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from ..core.config import settings
+from ..core.metrics import register_metrics
+from .client_pool import model_client_pool
+
+
+@dataclass(frozen=True)
+class Route:
+    """一次模型调用的路由结果：角色、模型层级、具体模型，以及命中的规则"""
+    role: str
+    tier: str
+    model: str
+    rule: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.role}/{self.tier}/{self.model}"
+
+
+def parse_routes(spec: str) -> List[Tuple[str, Optional[int], str]]:
+    """
+    解析路由表，格式为逗号分隔的 "角色:层级" 或 "角色<最大输入token数:层级"，角色 * 匹配所有角色。
+    如 "reviewer<2000:fast,reviewer:standard" 表示输入不超过2000个token的审查走 fast 层级，其余走 standard。
+    """
+    routes = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        condition, tier = item.rsplit(":", 1)
+        role, _, limit = condition.partition("<")
+        routes.append((role.strip(), int(limit) if limit.strip() else None, tier.strip()))
+    return routes
+
+
+class ModelRouter:
+    """
+    按Agent角色和输入大小把模型调用路由到模型层级（fast / standard / strong），
+    层级再映射为具体模型（MODEL_TIERS）。规则按顺序匹配，第一条满足的生效，都不满足时使用默认层级。
+    """
+    def __init__(self, routes: List[Tuple[str, Optional[int], str]], tiers: Dict[str, str], default_tier: str):
+        unknown = {tier for _, _, tier in routes} - set(tiers) | ({default_tier} - set(tiers))
+        if unknown:
+            raise ValueError(f"路由表引用了未定义的层级: {', '.join(sorted(unknown))}")
+        self.routes = routes
+        self.tiers = tiers
+        self.default_tier = default_tier
+
+    def resolve(self, value: str) -> Tuple[str, str]:
+        """把层级名或模型名解析为 (层级, 模型)；只允许 MODEL_TIERS 中出现过的模型"""
+        if value in self.tiers:
+            return value, self.tiers[value]
+        for tier, model in self.tiers.items():
+            if model == value:
+                return tier, model
+        raise ValueError(f"未知的模型或层级: {value}（可选: {', '.join(sorted(self.tiers))}）")
+
+    def route(self, role: str, input_tokens: int, override: Optional[str] = None) -> Route:
+        if override:
+            tier, model = self.resolve(override)
+            return Route(role, tier, model, "override")
+        for route_role, limit, tier in self.routes:
+            if route_role not in (role, "*"):
+                continue
+            if limit is not None and input_tokens > limit:
+                continue
+            rule = f"{route_role}<{limit}:{tier}" if limit is not None else f"{route_role}:{tier}"
+            return Route(role, tier, self.tiers[tier], rule)
+        return Route(role, self.default_tier, self.tiers[self.default_tier], "default")
+
+
+model_router = ModelRouter(
+    parse_routes(settings.MODEL_ROUTES), settings.MODEL_TIERS, settings.MODEL_DEFAULT_TIER
+)
+
+
+def known_roles() -> Set[str]:
+    """可以单独覆盖模型的角色：工作流的各阶段，以及各Agent（含压缩上下文的 summarizer）的角色名"""
+    # 在函数内导入：agents 包在导入时依赖本模块
+    from ..agents.agent_workflow import AgentWorkflow
+    from ..agents.base_agent import StreamingAgent, agent_role
+
+    def subclasses(cls):
+        for sub in cls.__subclasses__():
+            yield sub
+            yield from subclasses(sub)
+
+    return set(AgentWorkflow.STAGES) | {agent_role(cls.agent_name) for cls in subclasses(StreamingAgent) if cls.agent_name}
+
+
+def parse_model_overrides(value: Union[None, str, Dict[str, str]]) -> Dict[str, str]:
+    """
+    解析请求中的模型覆盖：字符串表示所有角色都使用该层级/模型，
+    dict 为 {角色: 层级或模型}，"*" 匹配其余角色。
+    取值不是字符串、角色未知或层级/模型未定义时抛出 ValueError（接口据此返回400）。
+    """
+    if not value:
+        return {}
+    overrides = {"*": value} if isinstance(value, str) else value
+    if not isinstance(overrides, dict):
+        raise ValueError("model 应为层级/模型名，或 {角色: 层级或模型}")
+    roles = known_roles() | {"*"}
+    for role, target in overrides.items():
+        if role not in roles:
+            raise ValueError(f"未知的角色: {role}（可选: {', '.join(sorted(roles))}）")
+        if not isinstance(target, str):
+            raise ValueError(f"角色 {role} 的模型应为层级/模型名")
+        model_router.resolve(target)
+    return dict(overrides)
+
+
+class ModelRouting:
+    """
+    一次请求的模型路由：按路由表（可被请求中的覆盖替换）选出模型，
+    用请求用户的 api_key 从客户端池租用对应的客户端。
+    """
+    def __init__(self, api_key: str, overrides: Union[None, str, Dict[str, str]] = None,
+                 router: ModelRouter = None):
+        self.api_key = api_key
+        self.overrides = parse_model_overrides(overrides)
+        self.router = router or model_router
+
+    def route(self, role: str, input_tokens: int) -> Route:
+        override = self.overrides.get(role) or self.overrides.get("*")
+        return self.router.route(role, input_tokens, override)
+
+    @asynccontextmanager
+    async def lease(self, route: Route):
+        async with model_client_pool.lease(self.api_key, route.model) as client:
+            yield client
+
+
+class RouteStats:
+    """
+    按路由（角色/层级/模型）统计调用次数、延迟、首token时间、token数和费用。
+    token数优先取模型返回的用量，没有时按分词估算；费用按 MODEL_PRICES（每百万token的单价）计算。
+    """
+    def __init__(self):
+        self._routes: Dict[str, dict] = {}
+
+    def record(self, route: Route, latency: float, first_token: Optional[float],
+               prompt_tokens: int, completion_tokens: int, status: str = "completed"):
+        entry = self._routes.setdefault(route.key, {
+            "role": route.role, "tier": route.tier, "model": route.model,
+            "calls": 0, "cancelled": 0, "errors": 0,
+            "latency_total": 0.0, "first_token_total": 0.0, "first_token_calls": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+        })
+        entry["calls"] += 1
+        if status == "cancelled":
+            entry["cancelled"] += 1
+        elif status == "error":
+            entry["errors"] += 1
+        entry["latency_total"] += latency
+        if first_token is not None:
+            entry["first_token_total"] += first_token
+            entry["first_token_calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        entry["cost"] += self.cost(route.model, prompt_tokens, completion_tokens)
+
+    @staticmethod
+    def cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        input_price, output_price = settings.MODEL_PRICES.get(model, (0.0, 0.0))
+        return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    def stats(self) -> dict:
+        routes = {}
+        for key, entry in self._routes.items():
+            calls = entry["calls"]
+            routes[key] = {
+                "role": entry["role"],
+                "tier": entry["tier"],
+                "model": entry["model"],
+                "calls": calls,
+                "cancelled": entry["cancelled"],
+                "errors": entry["errors"],
+                "avg_latency": round(entry["latency_total"] / calls, 3) if calls else 0.0,
+                "avg_first_token": round(entry["first_token_total"] / entry["first_token_calls"], 3)
+                if entry["first_token_calls"] else None,
+                "prompt_tokens": entry["prompt_tokens"],
+                "completion_tokens": entry["completion_tokens"],
+                "cost": round(entry["cost"], 6),
+            }
+        return {
+            "tiers": model_router.tiers,
+            "routes": routes,
+            "total_cost": round(sum(entry["cost"] for entry in self._routes.values()), 6),
+        }
+
+
+route_stats = RouteStats()
+register_metrics("model_routes", route_stats.stats)
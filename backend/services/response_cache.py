@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import AsyncGenerator, Optional, Tuple
+
+from ..core.config import settings
+from ..core.executor import run_blocking
+from ..core.metrics import register_metrics
+
+logger = logging.getLogger("response-cache")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """统一换行符并去掉行尾空白，保留行首缩进（代码缩进有语义）"""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+class _DiskStore:
+    """
+    基于SQLite的磁盘缓存，WAL模式下可被同一台机器上的多个worker进程共享。
+    所有方法都是阻塞的，由 ResponseCache 放到阻塞IO线程池中执行。
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, agent TEXT, model TEXT, content TEXT NOT NULL,"
+                " size INTEGER NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_access ON response_cache (last_access)")
+            self._initialized = True
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT content, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, content: str, agent: str, model: str, ttl: float):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, agent, model, content, size, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, agent, model, content, size, now + ttl, now),
+            )
+            conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            # 超出容量上限时按最近访问时间淘汰
+            while total > self.max_bytes:
+                row = conn.execute(
+                    "SELECT key, size FROM response_cache ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (row[0],))
+                total -= row[1]
+
+
+class ResponseCache:
+    """
+    单Agent响应的内容寻址缓存，两级存储：
+    - 进程内LRU，命中时无需任何IO
+    - 磁盘SQLite，多个worker共享
+    key 由 agent名、system message、模型名和归一化后的prompt计算sha256得到。
+    """
+    def __init__(self, enabled: bool, ttl: float, memory_entries: int, disk_path: str,
+                 disk_max_bytes: int, replay_chunk: int):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.replay_chunk = max(1, replay_chunk)
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._disk = _DiskStore(disk_path, disk_max_bytes) if disk_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(agent: str, system_message: str, model: str, prompt: str) -> str:
+        payload = json.dumps(
+            [agent, system_message, model, normalize_prompt(prompt)], ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        item = self._memory.get(key)
+        if item is None:
+            return None
+        expires_at, content = item
+        if expires_at < time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return content
+
+    def _memory_set(self, key: str, content: str, expires_at: float):
+        self._memory[key] = (expires_at, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        content = self._memory_get(key)
+        if content is not None:
+            self.memory_hits += 1
+            return content
+        if self._disk is not None:
+            try:
+                content = await run_blocking(self._disk.get, key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Response cache disk read failed: {e}")
+                content = None
+            if content is not None:
+                self.disk_hits += 1
+                # 回填内存层，TTL以磁盘层为准，这里用完整TTL近似
+                self._memory_set(key, content, time.time() + self.ttl)
+                return content
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, content: str, agent: str = "", model: str = ""):
+        if not self.enabled or not content:
+            return
+        self._memory_set(key, content, time.time() + self.ttl)
+        self.stores += 1
+        if self._disk is not None:
+            try:
+                await run_blocking(self._disk.set, key, content, agent, model, self.ttl)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Response cache disk write failed: {e}")
+
+    async def replay(self, content: str) -> AsyncGenerator[str, None]:
+        """把缓存内容按固定大小分块流式返回，与实时回答的输出形式保持一致"""
+        for i in range(0, len(content), self.replay_chunk):
+            yield content[i:i + self.replay_chunk]
+            # 让出事件循环，保证分块真正以流的形式发送
+            await asyncio.sleep(0)
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_size": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "stores": self.stores,
+            "errors": self.errors,
+        }
+
+
+response_cache = ResponseCache(
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    memory_entries=settings.RESPONSE_CACHE_MEMORY_ENTRIES,
+    disk_path=settings.RESPONSE_CACHE_DISK_PATH,
+    disk_max_bytes=settings.RESPONSE_CACHE_DISK_MAX_BYTES,
+    replay_chunk=settings.RESPONSE_CACHE_REPLAY_CHUNK,
+)
+register_metrics("response_cache", response_cache.stats)
@@ -0,0 +1,45 @@
+from sqlalchemy import insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.session import Session as Session_History
+from ..models.message import Message
+from .blob_store import store_contents
+
+
+async def create_session_with_message(db: AsyncSession, user_id: int, session_name: str, content: str) -> int:
+    """
+    在一个事务中创建会话及其第一条用户消息，返回 session_id。
+    PostgreSQL 上用数据修改CTE（INSERT ... RETURNING）一条语句完成，加上提交只有两次往返；
+    其他数据库（如本地SQLite）不支持数据修改CTE，退回为同一事务内的两条 INSERT。
+    正文超过 MESSAGE_BLOB_MIN_BYTES 时先写入 message_blobs（见 blob_store.store_contents），多一次往返。
+    """
+    values = (await store_contents(db, [content]))[0]
+    if db.bind.dialect.name == "postgresql":
+        new_session = (
+            insert(Session_History)
+            .values(user_id=user_id, session_name=session_name, is_active=True)
+            .returning(Session_History.session_id)
+            .cte("new_session")
+        )
+        stmt = (
+            insert(Message)
+            .from_select(
+                ["session_id", "role", "content", "codec", "content_blob", "blob_hash"],
+                select(
+                    new_session.c.session_id, literal("user"), literal(values["content"]),
+                    literal(values["codec"], Message.codec.type), literal(values["content_blob"], Message.content_blob.type),
+                    literal(values["blob_hash"], Message.blob_hash.type),
+                ),
+            )
+            .returning(Message.session_id)
+        )
+        session_id = (await db.execute(stmt)).scalar_one()
+    else:
+        session_id = (await db.execute(
+            insert(Session_History)
+            .values(user_id=user_id, session_name=session_name, is_active=True)
+            .returning(Session_History.session_id)
+        )).scalar_one()
+        await db.execute(insert(Message).values(session_id=session_id, role="user", **values))
+    await db.commit()
+    return session_id
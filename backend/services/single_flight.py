@@ -0,0 +1,116 @@
+import asyncio
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+
+from autogen_core import CancellationToken
+
+from ..core.metrics import register_metrics
+
+
+class _Flight:
+    """一次上游调用：缓存已产生的全部分块，订阅者各自维护读取位置"""
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.token = CancellationToken()      # 传给上游调用，所有订阅者离开时取消
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        # 唤醒所有正在等待的订阅者，再换一个新的Event给下一轮等待
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    相同key的并发流式请求合并为一次上游调用。
+    第一个请求启动上游，后来者直接订阅；每个订阅者都从第一个分块开始收到完整输出，
+    即使它在上游已经输出一半时才加入。所有订阅者都取消或离开后，上游调用随之取消。
+    """
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[CancellationToken], AsyncIterator[str]],
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        factory(token) 产生上游输出，token 在上游被取消时触发。
+        cancellation_token 取消时本订阅者停止读取（不抛异常），其他订阅者不受影响。
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        flight.subscribers += 1
+        if cancellation_token is not None:
+            # 回调在token的锁内执行，只唤醒等待者，是否取消由订阅者自己检查
+            cancellation_token.add_callback(flight.notify)
+        index = 0
+        try:
+            while True:
+                if cancellation_token is not None and cancellation_token.is_cancelled():
+                    return
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                self._cancel(key, flight)
+
+    def _cancel(self, key: str, flight: _Flight):
+        """没有订阅者了，停止上游调用；之后的相同请求会重新发起"""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        self.cancelled += 1
+        flight.token.cancel()
+        flight.task.cancel()
+
+    async def _run(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in factory(flight.token):
+                flight.chunks.append(chunk)
+                flight.notify()
+        except BaseException as e:
+            flight.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            flight.done = True
+            # 结束后立即移除，之后的相同请求会走响应缓存或重新发起调用
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "subscribers": sum(f.subscribers for f in self._flights.values()),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+
+single_flight = SingleFlight()
+register_metrics("single_flight", single_flight.stats)
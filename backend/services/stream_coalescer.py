@@ -0,0 +1,162 @@
+import asyncio
+import zlib
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from ..core.config import settings
+from ..core.metrics import register_metrics
+
+
+@dataclass(frozen=True)
+class CoalesceOptions:
+    """max_bytes: 攒够多少字节立即发送；max_delay: 第一段数据最多等待多少秒；gzip: 是否允许按 gzip 压缩输出"""
+    max_bytes: int
+    max_delay: float
+    gzip: bool = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 1 and self.max_delay > 0
+
+
+def coalesce_options(endpoint: str) -> CoalesceOptions:
+    """按接口名取 STREAM_COALESCE / STREAM_GZIP 中的配置，没有单独配置时使用 * 的配置"""
+    max_bytes, max_delay = settings.STREAM_COALESCE.get(endpoint) or settings.STREAM_COALESCE.get("*", (0, 0.0))
+    gzip = endpoint in settings.STREAM_GZIP or "*" in settings.STREAM_GZIP
+    return CoalesceOptions(int(max_bytes), max_delay, gzip)
+
+
+class StreamStats:
+    """各流式接口每个响应的输入分块（token/事件）数、实际发送的分块数和字节数"""
+    def __init__(self):
+        self._endpoints: Dict[str, dict] = {}
+
+    def record(self, endpoint: str, items: int, chunks: int, raw_bytes: int, sent_bytes: int, gzip: bool):
+        entry = self._endpoints.setdefault(endpoint, {
+            "responses": 0, "gzip_responses": 0, "items": 0, "chunks": 0, "raw_bytes": 0, "sent_bytes": 0,
+        })
+        entry["responses"] += 1
+        entry["gzip_responses"] += int(gzip)
+        entry["items"] += items
+        entry["chunks"] += chunks
+        entry["raw_bytes"] += raw_bytes
+        entry["sent_bytes"] += sent_bytes
+
+    def stats(self) -> dict:
+        result = {}
+        for endpoint, entry in self._endpoints.items():
+            responses = entry["responses"]
+            result[endpoint] = {
+                **entry,
+                "options": coalesce_options(endpoint).__dict__,
+                "avg_chunks": round(entry["chunks"] / responses, 2) if responses else 0.0,
+                "avg_bytes": round(entry["sent_bytes"] / responses, 2) if responses else 0.0,
+                "items_per_chunk": round(entry["items"] / entry["chunks"], 2) if entry["chunks"] else 0.0,
+                "compression_ratio": round(entry["sent_bytes"] / entry["raw_bytes"], 4) if entry["raw_bytes"] else 1.0,
+            }
+        return result
+
+
+stream_stats = StreamStats()
+register_metrics("stream_coalescing", stream_stats.stats)
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+async def coalesce(endpoint: str, source: AsyncIterator[Union[str, bytes]], options: CoalesceOptions,
+                   gzip: bool = False) -> AsyncIterator[bytes]:
+    """
+    类似 Nagle 算法合并流式输出：第一段数据立即发送（不影响首token时间），之后的数据攒到 max_bytes 字节，
+    或自第一段未发送的数据起超过 max_delay 秒时一起发送。gzip 为 True 时每次发送的数据用同一个gzip流压缩并同步刷新，
+    客户端可以边收边解压。
+    源迭代器在单独的任务中读取，等待时间窗口时不会打断它；响应提前结束（客户端断开）时取消该任务。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    compressor = zlib.compressobj(settings.STREAM_GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+    counters = {"items": 0, "chunks": 0, "raw_bytes": 0, "sent_bytes": 0}
+
+    async def pump():
+        try:
+            async for item in source:
+                queue.put_nowait(item)
+        except Exception as e:
+            queue.put_nowait(_Failure(e))
+        finally:
+            queue.put_nowait(_END)
+
+    def encode(buffer: List[bytes], final: bool = False) -> bytes:
+        data = b"".join(buffer)
+        counters["raw_bytes"] += len(data)
+        if compressor is not None:
+            data = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        if data:
+            counters["chunks"] += 1
+            counters["sent_bytes"] += len(data)
+        return data
+
+    producer = asyncio.create_task(pump())
+    getter: Optional[asyncio.Future] = None
+    buffer: List[bytes] = []
+    size = 0
+    flush_at = None
+    first = True
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            timeout = None if flush_at is None else max(0.0, flush_at - loop.time())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                # 时间窗口到了，发送已攒下的数据；getter 保留到下一轮继续等待
+                yield encode(buffer)
+                buffer, size, flush_at = [], 0, None
+                continue
+            item, getter = getter.result(), None
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                if buffer:
+                    yield encode(buffer)
+                raise item.error
+            data = item.encode("utf-8") if isinstance(item, str) else item
+            counters["items"] += 1
+            buffer.append(data)
+            size += len(data)
+            if first or not options.enabled or size >= options.max_bytes:
+                first = False
+                yield encode(buffer)
+                buffer, size, flush_at = [], 0, None
+            elif flush_at is None:
+                flush_at = loop.time() + options.max_delay
+        tail = encode(buffer, final=True)
+        if tail:
+            yield tail
+    finally:
+        if getter is not None:
+            getter.cancel()
+        producer.cancel()
+        stream_stats.record(endpoint, gzip=gzip, **counters)
+
+
+def coalesced_response(endpoint: str, request: Request, source: AsyncIterator[Union[str, bytes]],
+                       media_type: str, headers: Optional[dict] = None) -> StreamingResponse:
+    """
+    用合并层包装流式响应。接口开启了 gzip 且客户端声明 Accept-Encoding: gzip 时返回 gzip 编码的响应。
+    """
+    options = coalesce_options(endpoint)
+    gzip = options.gzip and "gzip" in request.headers.get("accept-encoding", "")
+    headers = dict(headers or {})
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(coalesce(endpoint, source, options, gzip), media_type=media_type, headers=headers)
@@ -0,0 +1,172 @@
+import asyncio
+from typing import Dict
+from autogen_core import CancellationToken
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..agents.agent_workflow import AgentWorkflow
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.deadline import deadline_scope
+from .client_pool import model_client_pool
+from .model_router import ModelRouting
+from .sessions import create_session_with_message
+from .write_behind import message_writer
+from .event_stream import EventLog
+from .checkpoints import completed_outputs, delete_checkpoints, save_checkpoint
+from .cancellation import cancellation_stats
+from .admission import report_queue_position
+from .batch_runner import BatchItem
+
+
+async def create_workflow_session(db: AsyncSession, user_id: int, requirement: str,
+                                  session_name: str = None) -> int:
+    """创建会话及用户需求消息，返回 session_id；session_name 默认为工作流会话名"""
+    return await create_session_with_message(
+        db, user_id, session_name or f"Agent Workflow: {requirement[:30]}", requirement  # 取前30字符作为会话名
+    )
+
+
+async def prepare_rerun(session_id: int, stage: str, downstream: bool = True) -> Dict[str, str]:
+    """
+    重跑 stage（downstream 时连同依赖它的下游阶段）前调用，返回其余已完成阶段的输出。
+    先删除要重跑阶段的检查点：这次运行失败或被取消时，之后的 resume 不会复用基于旧上游输出的结果。
+    """
+    restored = await completed_outputs(session_id)
+    rerun = [stage] + (AgentWorkflow.descendants(stage) if downstream else [])
+    await delete_checkpoints(session_id, rerun)
+    for name in rerun:
+        restored.pop(name, None)
+    return restored
+
+
+# 持久化到messages表时各阶段的标题
+STAGE_TITLES = {
+    "requirement": "需求分析",
+    "coder": "代码生成",
+    "reviewer": "代码审查",
+    "test": "测试代码",
+    "doc": "开发文档",
+    "finalizer": "最终代码",
+}
+
+
+# 未完成的阶段写入检查点时的状态，resume 时只复用 completed 的阶段
+CHECKPOINT_STATUS = {"stage_failed": "failed", "stage_cancelled": "cancelled", "stage_skipped": "skipped"}
+
+
+async def run_workflow(log: EventLog, api_key: str, requirement: str, session_id: int,
+                       restored: Dict[str, str] = None, input_overrides: Dict[str, Dict[str, str]] = None,
+                       cancellation_token: CancellationToken = None, model_overrides=None):
+    """
+    在后台执行工作流并写入事件日志。与HTTP连接解耦，客户端断线后运行继续，
+    重连时从回放缓冲区续传。每个阶段结束时写入检查点，失败或取消后可从最后完成的阶段恢复。
+    返回 {"status", "stages": {阶段名: 输出}, "timings", "error"}，status 为 completed / failed / cancelled。
+    model_overrides 覆盖路由表选择的模型（{阶段名: 层级或模型}，或对所有阶段生效的层级/模型名）。
+    阶段的模型调用需要排队时写入 queued 事件，带当前排队位置。
+    """
+    stage_outputs = {}
+    outcome = {"status": "failed", "stages": stage_outputs, "timings": None, "context": None, "error": None}
+    try:
+        # 各阶段的任务复制当前上下文，模型调用排队时通过回调写入事件日志
+        with report_queue_position(lambda stage, position: log.append("queued", stage, position=position)):
+            async with model_client_pool.lease(api_key) as client:
+                workflow = AgentWorkflow(client, routing=ModelRouting(api_key, model_overrides))
+                async for item in workflow.run_stream(requirement, restored, input_overrides, cancellation_token):
+                    event = item["event"]
+                    stage = item["stage"]
+                    if event == "stage_delta":
+                        log.append("delta", stage, delta=item["message"])
+                    elif event == "stage_artifact":
+                        log.append("artifact", stage, artifact=item["artifact"])
+                    elif event in ("stage_complete", "stage_restored"):
+                        stage_outputs[stage] = item["message"]
+                        log.append(event, stage, content=item["message"])
+                        if event == "stage_complete":
+                            await save_checkpoint(
+                                session_id, stage, "completed", output=item["message"],
+                                inputs=item["inputs"], duration=item["duration"]
+                            )
+                    elif event == "workflow_complete":
+                        outcome["timings"] = item["timings"]
+                        outcome["context"] = item["context"]
+                        # 降级跳过的可选阶段不算失败
+                        failed = [
+                            s["stage"] for s in item["timings"]["stages"]
+                            if s["status"] != "completed" and not s["degraded"]
+                        ]
+                        if cancellation_token is not None and cancellation_token.is_cancelled():
+                            outcome["status"] = "cancelled"
+                        else:
+                            outcome["status"] = "failed" if failed else "completed"
+                        if failed:
+                            outcome["error"] = f"未完成的阶段: {', '.join(failed)}"
+                        log.append("complete", None, timings=item["timings"], context=item["context"])
+                    else:
+                        # stage_start / stage_failed / stage_skipped / stage_cancelled
+                        log.append(event, stage, error=item["message"] or None)
+                        if event == "stage_cancelled":
+                            cancellation_stats.stages_cancelled += 1
+                        if event in ("stage_failed", "stage_cancelled", "stage_skipped"):
+                            await save_checkpoint(
+                                session_id, stage, CHECKPOINT_STATUS[event],
+                                inputs=item["inputs"], error=item["message"], duration=item["duration"]
+                            )
+    except Exception as e:
+        outcome["error"] = str(e)
+        log.append("error", None, error=str(e))
+    finally:
+        log.close()
+
+    # 回答生成完毕后，按阶段整理为一条Message存入数据库
+    full_answer = "\n\n".join(
+        f"## {STAGE_TITLES.get(stage, stage)}\n{output}" for stage, output in stage_outputs.items()
+    )
+    await message_writer.write(session_id, full_answer)
+    return outcome
+
+
+def summarize_outcome(outcome: dict, session_id: int) -> dict:
+    """把 run_workflow 的返回值整理为对外的结果：最终代码、测试、文档与耗时"""
+    stages = outcome["stages"]
+    return {
+        "status": outcome["status"],
+        "error": outcome["error"],
+        "session_id": session_id,
+        "final_code": AgentWorkflow._extract_final_code(stages),
+        "test_code": AgentWorkflow._extract_test_code(stages),
+        "doc": stages.get("doc", ""),
+        "timings": outcome["timings"],
+        "context": outcome["context"],
+    }
+
+
+# 批量执行时作为条目进度转发的阶段事件
+BATCH_STAGE_EVENTS = ("stage_complete", "stage_restored", "stage_failed", "stage_skipped")
+
+
+def make_batch_worker(user):
+    """
+    为 BatchRunner 构造条目执行函数：每条需求新建一个会话，完整执行工作流并写入数据库，
+    阶段结束事件通过 emit 作为 item_stage 转发，返回最终代码、测试、文档与耗时。
+    """
+    async def worker(item: BatchItem, emit) -> dict:
+        async with AsyncSessionLocal() as db:
+            session_id = await create_workflow_session(db, user.id, item.requirement)
+        # 批量条目的事件日志不登记到 workflow_runs，只用于转发进度
+        log = EventLog(f"batch-{session_id}", owner_id=user.id)
+
+        async def forward():
+            async for event in log.subscribe():
+                if event is not None and event.type in BATCH_STAGE_EVENTS:
+                    await emit("item_stage", stage=event.stage, status=event.type,
+                               session_id=session_id, error=event.data.get("error"))
+
+        forwarder = asyncio.create_task(forward())
+        try:
+            # 每个条目单独计算时间预算
+            with deadline_scope(settings.WORKFLOW_DEADLINE):
+                outcome = await run_workflow(log, user.api_key, item.requirement, session_id)
+            await forwarder
+        finally:
+            forwarder.cancel()
+        return summarize_outcome(outcome, session_id)
+    return worker
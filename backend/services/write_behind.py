@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.metrics import register_metrics
+from ..models.message import Message
+from .blob_store import store_contents
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingMessage:
+    values: dict
+    enqueued: float
+    future: asyncio.Future
+
+
+def _consume_exception(future: asyncio.Future):
+    # 不等待结果的调用方（流式接口）不会取出异常，避免 "exception was never retrieved" 警告；失败已计入统计并记录日志
+    if not future.cancelled():
+        future.exception()
+
+
+class WriteBehindQueue:
+    """
+    消息的进程内写后队列：流式接口生成完回答后只把消息放进队列就返回，不再占用数据库连接；
+    后台任务把攒到的消息用一条多行 INSERT 批量写入，失败时按指数退避重试。
+    队列有上限，写入跟不上时 submit 等待（反压），而不是无限占用内存。应用关闭时调用 aclose 写完剩余消息。
+    """
+    def __init__(self, max_pending: int = None, batch_size: int = None, flush_interval: float = None,
+                 max_retries: int = None, retry_backoff: float = None):
+        self.max_pending = max_pending or settings.WRITE_BEHIND_MAX_PENDING
+        self.batch_size = batch_size or settings.WRITE_BEHIND_BATCH_SIZE
+        self.flush_interval = settings.WRITE_BEHIND_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_retries = settings.WRITE_BEHIND_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = settings.WRITE_BEHIND_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _ensure_started(self):
+        # 队列和后台任务绑定到首次使用时的事件循环（脚本中每次 asyncio.run 都是新的循环）
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, session_id: int, content: str, role: str = "assistant") -> asyncio.Future:
+        """消息入队，返回写入完成（或最终失败）时结束的 future；调用方可以不等待它"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        await self._queue.put(_PendingMessage(
+            values={"session_id": session_id, "role": role, "content": content},
+            enqueued=time.monotonic(),
+            future=future,
+        ))
+        self.enqueued += 1
+        return future
+
+    async def write(self, session_id: int, content: str, role: str = "assistant"):
+        """入队并等待写入完成，多个并发的写入会合并到同一批；最终失败时抛出异常"""
+        await (await self.submit(session_id, content, role))
+
+    async def _run(self):
+        queue = self._queue
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                return
+            # 攒一小段时间，让同时结束的流合并为一次写入
+            if self.flush_interval > 0 and queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.flush_interval)
+            batch: List[_PendingMessage] = [item]
+            while len(batch) < self.batch_size and not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._in_flight = len(batch)
+            await self._write_batch(batch)
+            self._in_flight = 0
+
+    async def _write_batch(self, batch: List[_PendingMessage]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with AsyncSessionLocal() as db:
+                    # 较长的正文先在同一事务中写入 message_blobs（或压缩），失败时随事务一起重做
+                    columns = await store_contents(db, [pending.values["content"] for pending in batch])
+                    await db.execute(
+                        insert(Message),
+                        [{**pending.values, **column} for pending, column in zip(batch, columns)]
+                    )
+                    await db.commit()
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    sessions = sorted({pending.values["session_id"] for pending in batch})
+                    logger.error("写入 %d 条消息失败（会话 %s），已重试 %d 次: %s", len(batch), sessions, attempt, e)
+                    for pending in batch:
+                        if not pending.future.done():
+                            pending.future.set_exception(e)
+                    return
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+        now = time.monotonic()
+        self.batches += 1
+        self.written += len(batch)
+        for pending in batch:
+            latency = now - pending.enqueued
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if not pending.future.done():
+                pending.future.set_result(None)
+
+    def pending(self) -> int:
+        return (self._queue.qsize() if self._queue is not None else 0) + self._in_flight
+
+    async def aclose(self, timeout: float = None):
+        """写完队列中剩余的消息后停止后台任务，在应用关闭时调用"""
+        if self._task is None or self._task.done():
+            return
+        timeout = settings.WRITE_BEHIND_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        await self._queue.put(None)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.error("关闭时仍有 %d 条消息未写入", self.pending())
+            self._task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "max_pending": self.max_pending,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "avg_latency": round(self.latency_total / self.written, 4) if self.written else 0.0,
+            "max_latency": round(self.latency_max, 4),
+        }
+
+
+message_writer = WriteBehindQueue()
+register_metrics("message_write_behind", message_writer.stats)
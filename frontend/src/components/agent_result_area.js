@@ -61,6 +61,113 @@ function showSaveButton(result, type, agentType, resultArea) {
     resultArea.insertBefore(saveBtn, resultArea.firstChild);
 }
 
+// ========== 工作流事件流（text/event-stream）解析 ========== //
+
+const WORKFLOW_STAGE_TITLES = {
+    requirement: '需求分析',
+    coder: '代码生成',
+    reviewer: '代码审查',
+    test: '测试代码',
+    doc: '开发文档',
+    finalizer: '最终代码'
+};
+
+// 逐个解析SSE事件（以空行分隔），每解析出一条就回调 onEvent({id, event, data})
+async function readEventStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            const evt = { id: null, event: 'message', data: '' };
+            for (const line of block.split('\n')) {
+                // 以冒号开头的是心跳注释
+                if (!line || line.startsWith(':')) continue;
+                const idx = line.indexOf(':');
+                const field = idx >= 0 ? line.slice(0, idx) : line;
+                const val = idx >= 0 ? line.slice(idx + 1).replace(/^ /, '') : '';
+                if (field === 'id') evt.id = val;
+                else if (field === 'event') evt.event = val;
+                else if (field === 'data') evt.data += val;
+            }
+            if (evt.data) onEvent(evt);
+        }
+    }
+}
+
+/**
+ * 消费工作流事件流：按阶段渲染token增量；连接中断时携带 Last-Event-ID
+ * 请求 /workflow/stream/{runId} 续传，不会重新执行整个工作流。
+ * 返回按阶段整理后的完整文本。
+ */
+async function consumeWorkflowEvents(res, resultDiv, token, maxRetries = 5) {
+    const runId = res.headers.get('X-Run-Id');
+    const stages = {};
+    const order = [];
+    let lastEventId = 0;
+    let finished = false;
+    let retries = 0;
+    let response = res;
+
+    const render = () => order
+        .map(stage => `## ${WORKFLOW_STAGE_TITLES[stage] || stage}\n${stages[stage].text}${stages[stage].status ? `\n[${stages[stage].status}]` : ''}`)
+        .join('\n\n');
+
+    const onEvent = (evt) => {
+        const data = JSON.parse(evt.data);
+        lastEventId = data.seq;
+        const stage = data.stage;
+        if (stage && !stages[stage]) {
+            stages[stage] = { text: '', status: '' };
+            order.push(stage);
+        }
+        if (data.type === 'delta') {
+            stages[stage].text += data.delta;
+        } else if (data.type === 'stage_complete' || data.type === 'stage_restored') {
+            // 以完整内容为准，防止重连前后的增量有缺失
+            stages[stage].text = data.content;
+        } else if (data.type === 'stage_failed' || data.type === 'stage_skipped' || data.type === 'stage_cancelled') {
+            stages[stage].status = {
+                stage_failed: `失败: ${data.error}`,
+                stage_skipped: '已跳过',
+                stage_cancelled: '已取消',
+            }[data.type];
+        } else if (data.type === 'complete') {
+            finished = true;
+        } else if (data.type === 'error') {
+            finished = true;
+            throw new Error(data.error);
+        }
+        renderStreamingResult(resultDiv, render());
+    };
+
+    while (true) {
+        try {
+            await readEventStream(response, onEvent);
+        } catch (e) {
+            if (finished) throw e;
+            console.warn('工作流事件流中断，准备续传:', e);
+        }
+        if (finished) break;
+        if (!runId || ++retries > maxRetries) throw new Error('工作流事件流中断');
+        await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+        response = await fetch(`/workflow/stream/${runId}`, {
+            headers: {
+                'Last-Event-ID': String(lastEventId),
+                ...(token ? { 'Authorization': 'Bearer ' + token } : {})
+            }
+        });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    }
+    return render();
+}
+
 // ========== 各 Agent 的 onSubmit 处理函数 ========== //
 
 /**
@@ -88,6 +195,7 @@ function showSaveButton(result, type, agentType, resultArea) {
  *   - msgTextErrorBg: 错误提示背景
  *   - msgTextErrorBorder: 错误提示边框
  *   - buildRequestBody: (可选) 构造请求体的方法，默认 {requirement}
+ *   - eventStream: (可选) 后端返回 text/event-stream 事件流（工作流），支持断线续传
  */
 async function onSubmitAgentGeneric({
     form,
@@ -110,7 +218,8 @@ async function onSubmitAgentGeneric({
     msgTextErrorColor = '#b91c1c',
     msgTextErrorBg = '#fee2e2',
     msgTextErrorBorder = '1px solid #fecaca',
-    buildRequestBody
+    buildRequestBody,
+    eventStream = false
 }) {
     // 获取需求文本
     const requirement = form.requirement.value.trim();
@@ -173,14 +282,18 @@ async function onSubmitAgentGeneric({
         });
     
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const reader = res.body.getReader();
-        const decoder = new TextDecoder();
-        while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-            const chunk = decoder.decode(value, { stream: true });
-            result += chunk;
-            renderStreamingResult(resultDiv, result);
+        if (eventStream) {
+            result = await consumeWorkflowEvents(res, resultDiv, token);
+        } else {
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                const chunk = decoder.decode(value, { stream: true });
+                result += chunk;
+                renderStreamingResult(resultDiv, result);
+            }
         }
 
         // 生成完成，使用传入参数
@@ -237,7 +350,8 @@ export async function onSubmitAgentWorkflow(form, resultArea) {
         requireApiKey: true,
         msgText: 'Workflow执行中...',
         msgTextDone: '生成完成，可保存到本地！',
-        msgTextError: '流式请求失败，请重试'
+        msgTextError: '流式请求失败，请重试',
+        eventStream: true
     });
 }
 
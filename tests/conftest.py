@@ -0,0 +1,26 @@
+# 测试使用临时的SQLite数据库，不读写响应缓存；须在导入 backend 之前设置
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/test.db")
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "0")
+
+import asyncio
+
+import pytest
+
+from backend.core.database import Base, engine
+from backend.models import job, message, session, stage_checkpoint, user  # noqa: F401  注册所有模型
+
+
+@pytest.fixture
+def db_tables():
+    """每个测试使用空表"""
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+    asyncio.run(reset())
+    yield
+    asyncio.run(engine.dispose())
@@ -0,0 +1,34 @@
+import asyncio
+
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+from backend.agents.agent_workflow import AgentWorkflow
+
+
+class RecordingClient(ReplayChatCompletionClient):
+    """记录每次模型调用收到的消息"""
+    def __init__(self, completions):
+        super().__init__(completions)
+        self.calls = []
+
+    def create_stream(self, messages, **kwargs):
+        self.calls.append([message.content for message in messages])
+        return super().create_stream(messages, **kwargs)
+
+
+def test_summaries_do_not_share_context():
+    client = RecordingClient(["摘要一", "摘要二"])
+    workflow = AgentWorkflow(client, pipeline_artifacts=False)
+
+    async def run():
+        first = await workflow.summarizer_agent.handle_message("第一段说明", 100)
+        second = await workflow.summarizer_agent.handle_message("第二段说明", 100)
+        return first, second
+
+    assert asyncio.run(run()) == ("摘要一", "摘要二")
+    assert len(client.calls) == 2
+    for call, text in zip(client.calls, ("第一段说明", "第二段说明")):
+        # 系统提示 + 本次的提示，不带之前的提示和摘要
+        assert len(call) == 2
+        assert text in call[1]
+    assert "第一段说明" not in client.calls[1][1]
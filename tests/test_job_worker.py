@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.core.config import settings
+from backend.services import job_worker
+
+
+class FakeSink:
+    def __init__(self, job_id, log, seq_offset=0):
+        self.log = log
+
+    async def run(self):
+        while not self.log.done:
+            await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+def worker_env(monkeypatch):
+    """心跳间隔缩短为10ms，记录结束的任务和执行被取消的情况"""
+    env = SimpleNamespace(finished=[], cancelled=False, closed_before_cancel=None, heartbeats=[])
+
+    async def last_event_seq(job_id):
+        return 0
+
+    async def finish_job(job_id, worker_id, status, result, error):
+        env.finished.append((status, error))
+
+    async def execute_job(job, log):
+        try:
+            await asyncio.sleep(job.duration)
+        except asyncio.CancelledError:
+            env.cancelled = True
+            env.closed_before_cancel = log.done
+            raise
+        return "completed", {"session_id": 1}, None
+
+    monkeypatch.setattr(settings, "JOB_HEARTBEAT_INTERVAL", 0.01)
+    monkeypatch.setattr(job_worker, "JobEventSink", FakeSink)
+    monkeypatch.setattr(job_worker, "last_event_seq", last_event_seq)
+    monkeypatch.setattr(job_worker, "finish_job", finish_job)
+    monkeypatch.setattr(job_worker, "execute_job", execute_job)
+
+    def use_heartbeat(results):
+        """results 依次为每次心跳的结果，异常实例表示该次心跳抛出异常，用完后一直成功"""
+        results = list(results)
+
+        async def heartbeat(job_id, worker_id):
+            result = results.pop(0) if results else True
+            env.heartbeats.append(result)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        monkeypatch.setattr(job_worker, "heartbeat", heartbeat)
+
+    env.use_heartbeat = use_heartbeat
+    return env
+
+
+def make_job(duration: float):
+    return SimpleNamespace(job_id="job", user_id=1, duration=duration)
+
+
+def test_transient_heartbeat_error_is_tolerated(worker_env):
+    worker_env.use_heartbeat([ConnectionError("数据库连接断开")])
+    asyncio.run(job_worker.JobWorker(worker_id="w")._run(make_job(0.05)))
+    assert isinstance(worker_env.heartbeats[0], ConnectionError)
+    assert worker_env.finished == [("completed", None)]
+    assert not worker_env.cancelled
+
+
+def test_persistent_heartbeat_error_cancels_work(worker_env, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_STALE_AFTER", 0.03)
+    worker_env.use_heartbeat([ConnectionError("数据库不可用")] * 100)
+    asyncio.run(job_worker.JobWorker(worker_id="w")._run(make_job(10)))
+    # 执行在日志关闭前被取消，任务留给重新入队，不记录失败
+    assert worker_env.cancelled and worker_env.closed_before_cancel is False
+    assert worker_env.finished == []
+
+
+def test_lost_job_cancels_work(worker_env):
+    worker_env.use_heartbeat([False])
+    asyncio.run(job_worker.JobWorker(worker_id="w")._run(make_job(10)))
+    assert worker_env.cancelled and worker_env.closed_before_cancel is False
+    assert worker_env.finished == []
+
+
+def test_worker_shutdown_cancels_work(worker_env):
+    worker_env.use_heartbeat([])
+
+    async def run():
+        task = asyncio.create_task(job_worker.JobWorker(worker_id="w")._run(make_job(10)))
+        await asyncio.sleep(0.03)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert worker_env.cancelled and worker_env.closed_before_cancel is False
+    assert worker_env.finished == []
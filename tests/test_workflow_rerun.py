@@ -0,0 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from autogen_ext.models.replay import ReplayChatCompletionClient
+
+from backend.services import workflow_runner
+from backend.services.checkpoints import completed_outputs, load_checkpoints, save_checkpoint
+from backend.services.event_stream import EventLog
+
+STAGES = ("requirement", "coder", "reviewer", "test", "doc", "finalizer")
+
+
+class FailingClient(ReplayChatCompletionClient):
+    """每次模型调用都失败"""
+    def create_stream(self, messages, **kwargs):
+        raise RuntimeError("上游不可用")
+
+
+def test_failed_rerun_does_not_restore_old_downstream(db_tables, monkeypatch):
+    @asynccontextmanager
+    async def lease(api_key, model="deepseek-chat"):
+        yield FailingClient([])
+
+    async def write(session_id, content, role="assistant"):
+        pass
+
+    monkeypatch.setattr(workflow_runner.model_client_pool, "lease", lease)
+    monkeypatch.setattr(workflow_runner.message_writer, "write", write)
+
+    async def run():
+        for stage in STAGES:
+            await save_checkpoint(1, stage, "completed", output=f"旧的{stage}输出")
+        restored = await workflow_runner.prepare_rerun(1, "coder")
+        assert restored == {"requirement": "旧的requirement输出"}
+        outcome = await workflow_runner.run_workflow(
+            EventLog("run"), "key", "需求", 1, restored=restored, input_overrides={"coder": {}}
+        )
+        statuses = {cp.stage: cp.status for cp in await load_checkpoints(1)}
+        return outcome, statuses, await completed_outputs(1)
+
+    outcome, statuses, completed = asyncio.run(run())
+    assert outcome["status"] == "failed"
+    assert statuses["coder"] == "failed"
+    assert {statuses[stage] for stage in ("reviewer", "test", "doc", "finalizer")} == {"skipped"}
+    # resume 只复用需求分析，不会恢复基于旧代码的审查和最终代码
+    assert completed == {"requirement": "旧的requirement输出"}